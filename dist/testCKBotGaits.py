@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Checks that the gaits of every robot file shipped with the CKBot simulator and
+hardware runtime give the same reference angles when computed for all modules
+at once as they did when computed one module at a time.
+"""
+
+import unittest
+import glob
+import math
+import types
+import sys, os
+
+LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "lib")
+SIM_DIR = os.path.join(LIB, "simulator", "ode", "ckbot")
+PLATFORM_DIR = os.path.join(LIB, "platforms", "ckbot")
+sys.path.append(SIM_DIR)
+sys.path.append(PLATFORM_DIR)
+
+import CKBotSimHelper
+
+# Times (in seconds) to compare the reference angles at
+TIMES = [0.0, 0.1, 0.35, 1.0, 2.5, 7.3, 12.0, 31.4]
+
+def oldGaitAngle(gait, time, module):
+    """ Reference angle of one module for a fixed gait [time, row1, row2, ...], the old way """
+
+    nummoves = len(gait)-1
+    gaittime = gait[0]
+    singletime = float(gaittime)/(nummoves-1)
+
+    currenttime = (time%gaittime)/singletime
+    globalref = gait[int(math.ceil(currenttime))+1][module]
+    globalprev = gait[int(math.floor(currenttime))+1][module]
+
+    if globalref == globalprev:
+        return globalref
+    interp = currenttime - math.floor(currenttime)
+    return globalprev + interp*(globalref-globalprev)
+
+def oldPeriodicAngle(gait, time, module):
+    """ Reference angle of one module for a periodic gait [amplitudes, frequencies, phases], the old way """
+    return gait[0][module]*math.sin(gait[1][module]*time + gait[2][module])
+
+def isHardwareFormat(filename):
+    """
+    Whether a robot file is in the hardware runtime's format, where one gait type
+    (given right after "Gaits:") applies to all the gaits, rather than the simulator's
+    """
+
+    with open(filename) as f:
+        words = [line.split() for line in f]
+    words = [w for w in words[[w[:1] for w in words].index(["Gaits:"]):] if w]
+    return any(w[0] == "Type" for w in words[:3])
+
+def robotFiles(directory, hardware):
+    return [filename for filename in sorted(glob.glob(os.path.join(directory, "config", "*.ckbot")))
+            if isHardwareFormat(filename) == hardware]
+
+class Robot(object):
+    """ Just enough of a simulator to load a robot file into """
+    cubesize = 6.0
+
+class TestCKBotGaits(unittest.TestCase):
+    def compare(self, name, nummodules, gait, angles):
+        """ Compare angles(time) against the old per-module calculation for the given gait """
+
+        rows = gait[1:] if gait[0] == "periodic" else gait[2:]
+        if min(len(row) for row in rows) < nummodules:
+            # A few robot files (e.g. Plus2) have gaits for fewer modules than the robot has.
+            # The old code failed on these with an IndexError; they are still unusable.
+            self.assertTrue(len(angles(0.0)) < nummodules, "%s: too many angles" % name)
+            return
+
+        if gait[0] == "periodic":
+            old = lambda time, module: oldPeriodicAngle(gait[1:], time, module)
+        elif len(gait) > 3 and gait[1] > 0:
+            old = lambda time, module: oldGaitAngle(gait[1:], time, module)
+        else:
+            # The old code divided by zero here; now the gait holds its first row
+            old = lambda time, module: gait[2][module]
+
+        for time in TIMES:
+            new = angles(time)
+            self.assertEqual(len(new), nummodules, "%s: wrong number of angles" % name)
+            for module in xrange(nummodules):
+                self.assertAlmostEqual(new[module], old(time, module), 9,
+                                       "%s: module %d differs at t=%s" % (name, module, time))
+
+    def testSimulatorConfigs(self):
+        filenames = robotFiles(SIM_DIR, False)
+        self.assertTrue(filenames)
+
+        for filename in filenames:
+            robot = Robot()
+            CKBotSimHelper.loadRobotData(robot, filename)
+            nummodules = len(robot.connM)
+
+            for i, gait in enumerate(robot.gaits):
+                compiled = CKBotSimHelper.compilegait(gait, nummodules)
+                self.compare("%s gait %d" % (os.path.basename(filename), i+1), nummodules, gait,
+                             lambda time: CKBotSimHelper.gaitangles(compiled, time))
+
+    def testHardwareConfigs(self):
+        try:
+            import CKBotRun
+        except ImportError, e:
+            self.skipTest("CKBot hardware library not available (%s)" % e)
+
+        class Cluster(object):
+            def populate(self):
+                pass
+
+        # Some of the simulator's robot files are in this format too
+        for filename in robotFiles(PLATFORM_DIR, True) + robotFiles(SIM_DIR, True):
+            robot = types.InstanceType(CKBotRun.CKBotRun)
+            robot.cluster = Cluster()
+            robot.loadRobotData(filename)
+            nummodules = len(robot.connM)
+
+            for i, (gait, compiled) in enumerate(zip(robot.gaits, robot.compiled_gaits)):
+                if robot.gaittype == "Periodic":
+                    # The hardware runs periodic gaits at a quarter of the speed
+                    gait = ["periodic", gait[0], [0.25*f for f in gait[1]], gait[2]]
+                else:
+                    gait = ["fixed"] + gait
+                self.compare("%s gait %d" % (os.path.basename(filename), i+1), nummodules, gait,
+                             lambda time: robot.gaitangles(compiled, time))
+
+if __name__ == "__main__":
+    unittest.main()
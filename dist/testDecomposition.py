@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Checks that the Hertel-Mehlhorn decomposition splits the free space of example maps
+that are awkward to triangulate into convex pieces that cover exactly that space,
+without falling back to MP5.
+"""
+
+import unittest
+import sys, os
+LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "lib")
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "examples")
+sys.path.append(LIB)
+import Polygon, Polygon.Utils
+import regions
+import decomposition
+
+# Same tolerance as parseLP, which does the decomposition
+Polygon.setTolerance(0.1)
+
+def freeSpace(filename):
+    """
+    Return a list of (outer polygon, list of hole polygons) for each part of the space
+    left inside the boundary region of a region file once all other regions are removed
+    """
+
+    rfi = regions.RegionFileInterface()
+    if not rfi.readFile(filename):
+        raise IOError("Could not load region file %s" % filename)
+
+    boundary = None
+    others = Polygon.Polygon()
+    for region in rfi.regions:
+        # parseLP works on integer coordinates
+        poly = Polygon.Polygon([(int(pt.x), int(pt.y)) for pt in region.getPoints()])
+        if region.name.lower() == "boundary":
+            boundary = poly
+        else:
+            others += poly
+
+    free = boundary - others
+    parts = []
+    for i in range(len(free)):
+        if not free.isHole(i):
+            holes = [Polygon.Polygon(free[j]) for j in range(len(free)) if free.isHole(j)]
+            parts.append((Polygon.Polygon(free[i]), [h for h in holes if Polygon.Polygon(free[i]).covers(h)]))
+    return parts
+
+class TestHertelMehlhorn(unittest.TestCase):
+    def checkDecomposition(self, poly, holes):
+        de = decomposition.decomposition(Polygon.Polygon(poly), [Polygon.Polygon(h) for h in holes])
+        pieces = de.hertelMehlhorn()
+        self.assertFalse(de.failed, "fell back to MP5")
+
+        for piece in pieces:
+            points = Polygon.Utils.pointList(piece)
+            n = len(points)
+            self.assertTrue(all(decomposition.cross(points[i-1], points[i], points[(i+1)%n]) >= 0 for i in xrange(n)) or
+                            all(decomposition.cross(points[i-1], points[i], points[(i+1)%n]) <= 0 for i in xrange(n)),
+                            "piece %s is not convex" % points)
+
+        target = Polygon.Polygon(poly)
+        for hole in holes:
+            target -= hole
+        self.assertAlmostEqual(sum(piece.area() for piece in pieces), target.area(), 6)
+
+        covered = Polygon.Polygon()
+        for piece in pieces:
+            covered += piece
+        self.assertAlmostEqual((covered ^ target).area(), 0, 6)
+
+        return pieces
+
+    def testPinched(self):
+        # Shelves touching at their corners split the free space into parts that only meet at a point
+        parts = freeSpace(os.path.join(EXAMPLES, "grocery", "grocery.regions"))
+        for poly, holes in parts:
+            self.checkDecomposition(poly, holes)
+
+    def testHoles(self):
+        parts = freeSpace(os.path.join(EXAMPLES, "hideandseek", "hideandseek.regions"))
+        self.assertTrue(any(len(holes) == 2 for poly, holes in parts))
+        for poly, holes in parts:
+            self.checkDecomposition(poly, holes)
+
+    def testSeparateParts(self):
+        # Two squares meeting at a corner, and a hole touching the outer contour at a vertex
+        bowtie = Polygon.Polygon([(0, 0), (10, 0), (10, 10), (20, 10), (20, 20), (10, 20), (10, 10), (0, 10)])
+        self.assertEqual(len(self.checkDecomposition(bowtie, [])), 2)
+
+        outer = Polygon.Polygon([(0, 0), (30, 0), (30, 30), (0, 30), (-5, 15)])
+        hole = Polygon.Polygon([(-5, 15), (10, 5), (20, 15), (10, 25)])
+        self.checkDecomposition(outer, [hole])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Checks that simplified LTL formulas are written out correctly, i.e. that
+parsing, simplifying and re-serializing a formula gives back a formula that
+parses to the same tree and means the same thing as the original.
+"""
+
+import unittest
+import itertools
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..","src","lib"))
+from LTLParser.LTLFormula import LTLFormula, treeToString
+
+# One formula per operator, plus a few where simplification changes the tree
+PROPOSITIONAL_FORMULAS = ["a & b", "a | b", "a ^ b", "a -> b", "a <-> b", "!a",
+                          "a ^ b ^ c", "a ^ b ^ TRUE", "a ^ FALSE", "(a ^ b) & c",
+                          "!(a ^ b) | c", "a & (a | b)", "a | !a", "(a & b) -> a",
+                          "(a -> b) <-> (b ^ c)", "a & b & TRUE & a", "!!a <-> FALSE"]
+
+TEMPORAL_FORMULAS = ["[](a ^ b)", "[]<>(a & !b)", "next(a) <-> b", "a U b", "a W b",
+                     "[](next(a) ^ next(b))", "[](a -> next(b ^ TRUE))", "<>(a ^ b ^ c)"]
+
+def evaluate(tree, values):
+    """ Truth value of a propositional tree for the given variable assignment """
+
+    if tree[0] == "TRUE":
+        return True
+    elif tree[0] == "FALSE":
+        return False
+    elif tree[0] == "Assignment":
+        return values[tree[1][0]]
+    elif tree[0] == "UnaryFormula" and tree[1][0] == "NotOperator":
+        return not evaluate(tree[2], values)
+
+    children = [evaluate(t, values) for t in tree[1:]]
+    if tree[0] == "Conjunction":
+        return all(children)
+    elif tree[0] == "Disjunction":
+        return any(children)
+    elif tree[0] == "Xor":
+        return sum(children) % 2 == 1
+    elif tree[0] == "Implication":
+        return not children[0] or children[1]
+    elif tree[0] == "Biimplication":
+        return children[0] == children[1]
+    raise ValueError("Not a propositional formula: %r" % (tree,))
+
+class TestSimplifyRoundTrip(unittest.TestCase):
+    def roundTrip(self, text):
+        original = LTLFormula.fromString(text)
+        simplified = original.simplify()
+        written = treeToString(simplified.tree)
+        reparsed = LTLFormula.fromString(written)
+        self.assertEqual(treeToString(reparsed.tree), written,
+                         "%r was simplified to %r, which does not parse back the same" % (text, written))
+        return original, reparsed, written
+
+    def testPropositional(self):
+        for text in PROPOSITIONAL_FORMULAS:
+            original, reparsed, written = self.roundTrip(text)
+            for bits in itertools.product([False, True], repeat=3):
+                values = dict(zip("abc", bits))
+                self.assertEqual(evaluate(original.tree, values), evaluate(reparsed.tree, values),
+                                 "%r was simplified to %r, which is not equivalent" % (text, written))
+
+    def testTemporal(self):
+        for text in TEMPORAL_FORMULAS:
+            self.roundTrip(text)
+
+    def testXor(self):
+        self.assertEqual(self.roundTrip("[](a ^ b)")[2], "[](a ^ b)")
+        self.assertEqual(self.roundTrip("a ^ b ^ TRUE")[2], "!(a ^ b)")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+""" Compare the convex decomposition methods available to parseLP on the
+    regions of one or more region files (by default, those of all the examples).
+
+    For each file, every region is decomposed on its own, and so is the free
+    space left inside the boundary region once all other regions are removed
+    (which is usually the largest, and only holed, polygon).  A method that
+    raises an error, or (for Hertel-Mehlhorn) has to fall back to MP5, counts
+    as having failed on that polygon.
+
+    Usage: benchmark_decomposition.py [file.regions ...]
+"""
+
+import sys, os, glob, time
+import Polygon, Polygon.Utils
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "lib"))
+import lib.regions as regions
+import lib.decomposition as decomposition
+
+Polygon.setTolerance(0.1)
+
+METHODS = [("MP5", "MP5"), ("Hertel-Mehlhorn", "hertelMehlhorn")]
+
+def toPolygon(points):
+    # parseLP works on integer coordinates
+    return Polygon.Utils.prunePoints(Polygon.Polygon([(int(x), int(y)) for x, y in points]))
+
+def polygonsOf(rfi):
+    """ Yield (name, outer polygon, list of hole polygons) for everything to decompose """
+    boundary = None
+    others = Polygon.Polygon()
+    for region in rfi.regions:
+        poly = toPolygon([(pt.x, pt.y) for pt in region.getPoints()])
+        if region.name.lower() == "boundary":
+            boundary = poly
+        else:
+            others += poly
+            yield region.name, poly, []
+
+    if boundary is not None:
+        free = boundary - others
+        for i in range(len(free)):
+            if not free.isHole(i):
+                holes = [Polygon.Polygon(free[j]) for j in range(len(free)) if free.isHole(j)]
+                holes = [h for h in holes if Polygon.Polygon(free[i]).covers(h)]
+                yield "(free space %d)" % i, Polygon.Polygon(free[i]), holes
+
+def benchmark(filename):
+    rfi = regions.RegionFileInterface()
+    if not rfi.readFile(filename):
+        print "Could not load region file %s" % filename
+        return None
+
+    totals = dict((label, [0, 0.0, 0]) for label, _ in METHODS)
+    for name, poly, holes in polygonsOf(rfi):
+        for label, method in METHODS:
+            de = decomposition.decomposition(Polygon.Polygon(poly), [Polygon.Polygon(h) for h in holes])
+            start = time.time()
+            try:
+                pieces = getattr(de, method)()
+            except Exception, e:
+                print "%s failed on %s in %s: %s" % (label, name, filename, e)
+                totals[label][2] += 1
+                continue
+            if de.failed:
+                # Hertel-Mehlhorn fell back to MP5, so these aren't its pieces
+                print "%s failed on %s in %s" % (label, name, filename)
+                totals[label][2] += 1
+                continue
+            totals[label][0] += len(pieces)
+            totals[label][1] += time.time() - start
+
+    return totals
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        files = sys.argv[1:]
+    else:
+        examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "examples")
+        files = sorted(f for f in glob.glob(os.path.join(examples, "*", "*.regions"))
+                       if not f.endswith("_decomposed.regions"))
+
+    print "%-40s" % "Region file" + "".join("%18s pieces %8s %7s" % (label, "time", "failed") for label, _ in METHODS)
+    for filename in files:
+        totals = benchmark(filename)
+        if totals is None:
+            continue
+        print "%-40s" % os.path.relpath(filename)[-40:] + \
+              "".join("%25d %7.3fs %7d" % tuple(totals[label]) for label, _ in METHODS)
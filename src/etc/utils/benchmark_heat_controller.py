@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+""" Evaluate the heat controller's vector field on a grid covering a region,
+    comparing the vectorized evaluation with the one-point-at-a-time one,
+    and check that the field converges by following it from every grid
+    point inside the region.
+
+    By default a built-in pentagon is used; otherwise, the named region (or
+    every region) of a region file.  The heat controller needs convex regions,
+    so use a _decomposed.regions file.  Regions are flipped vertically, as a
+    typical calibration would do.
+
+    Usage: benchmark_heat_controller.py [--plot] [--size N] [file.regions [region name]]
+"""
+
+import sys, os, time, getopt
+import numpy
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "lib"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "lib", "handlers", "motionControl"))
+import lib.regions as regions
+import __heatControllerHelper as heatControllerHelper
+
+# Number of grid points evaluated one at a time, for comparison
+SCALAR_SAMPLES = 200
+
+def polygonsOf(filename, name=None):
+    """ Yield (name, 2 x N vertex matrix) for each region to test """
+    if filename is None:
+        yield "pentagon", numpy.mat([[0, 100, 120, 60, 0], [0, 0, 70, 110, 80]], dtype=float)[:, ::-1]
+        return
+
+    rfi = regions.RegionFileInterface()
+    if not rfi.readFile(filename):
+        print "Could not load region file %s" % filename
+        return
+
+    for region in rfi.regions:
+        if name is not None and region.name != name:
+            continue
+        if region.name.lower() == "boundary" or region.getDirection() == regions.dir_CONCAVE:
+            continue
+        vertices = numpy.mat([(pt.x, -pt.y) for pt in region.getPoints()]).T
+
+        # make sure they're clockwise
+        x, y = vertices.A
+        if numpy.sum(x*numpy.roll(y, -1) - numpy.roll(x, -1)*y) > 0:
+            vertices = vertices[:, ::-1]
+        yield region.name, vertices
+
+def grid(vertices, size):
+    """ A size x size grid of points (2 x size**2) covering the vertices' bounding box """
+    xs = numpy.linspace(vertices[0].min(), vertices[0].max(), size)
+    ys = numpy.linspace(vertices[1].min(), vertices[1].max(), size)
+    x, y = numpy.meshgrid(xs, ys)
+    return numpy.vstack((x.ravel(), y.ravel()))
+
+def convergence(controller, params, starts, steps=400):
+    """
+    Follow the field from each of the start points (2 x M) with fixed-length steps.
+    Returns the number of points that leave through the exit face (or reach the
+    goal, for the last region).
+    """
+    length = numpy.sqrt(numpy.sum(numpy.square(numpy.diff(params['Vtx'].A, axis=1)), axis=0)).mean()
+    dt = 0.01*length
+
+    q = starts.copy()
+    done = numpy.zeros(q.shape[1], dtype=bool)
+    for i in xrange(steps):
+        X = controller(q[:, ~done])[0]
+        q[:, ~done] += dt*X
+
+        if params['last']:
+            done = numpy.sqrt(numpy.sum((q - params['qf'].A)**2, axis=0)) < 2*dt
+        else:
+            # past the exit face
+            done = numpy.sum((q - params['P0'].A)*params['N0'].A, axis=0) > 0
+        if done.all():
+            break
+
+    return done.sum()
+
+def benchmark(name, vertices, size, plot=False):
+    for exitface, last in [(0, False), (None, True)]:
+        label = "%s (%s)" % (name, "goal" if last else "exit face %d" % exitface)
+
+        points = grid(vertices, size)
+
+        try:
+            start = time.time()
+            params = heatControllerHelper.getControllerParameters(vertices, exitface, last)
+            setup = time.time() - start
+
+            controller = heatControllerHelper.makeBatchController(params)
+
+            start = time.time()
+            [X, DqX, F, inside, J] = controller(points)
+            batch = time.time() - start
+        except Exception, e:
+            print "%-30s failed: %s" % (label[-30:], e)
+            continue
+
+        # Compare with the one-point-at-a-time version
+        if last:
+            single = lambda q: heatControllerHelper.Xgoal_penn(q, *[params[k] for k in
+                ('P0', 'N0', 'Pin', 'Nin', 'qx', 'ae1', 'ae2', 'Bmax', 'hessian', 'Vtx', 'Brad', 'qf', 'alpha')])
+        else:
+            single = lambda q: heatControllerHelper.Xoq_penn(q, *[params[k] for k in
+                ('P0', 'N0', 'Pin', 'Nin', 'qx', 'ae1', 'ae2', 'Bmax', 'hessian', 'Vtx', 'Brad')])
+        samples = numpy.linspace(0, points.shape[1]-1, min(SCALAR_SAMPLES, points.shape[1])).astype(int)
+        error = 0.0
+        start = time.time()
+        for m in samples:
+            Xs = single(numpy.mat(points[:, m]).T)[0]
+            if not numpy.isnan(X[:, m]).all():
+                error = max(error, numpy.abs(numpy.asarray(Xs).ravel() - X[:, m]).max())
+        scalar = (time.time() - start)/len(samples)*points.shape[1]
+
+        converged = convergence(controller, params, points[:, inside])
+
+        print "%-30s %6.2fs %8d %8.3fs %8.3fs %10.1e %6d/%-6d" % (label[-30:], setup, points.shape[1],
+                batch, scalar, error, converged, inside.sum())
+
+        if plot:
+            import matplotlib.pyplot as plt
+            plt.figure()
+            plt.title(label)
+            plt.plot(numpy.append(vertices[0].A.ravel(), vertices[0, 0]),
+                     numpy.append(vertices[1].A.ravel(), vertices[1, 0]), 'k-')
+            plt.quiver(points[0, inside], points[1, inside], X[0, inside], X[1, inside])
+            plt.axis('equal')
+
+def usage():
+    print __doc__.strip().split("\n")[-1].strip()
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["plot", "size="])
+    except getopt.GetoptError, e:
+        print e
+        usage()
+        sys.exit(2)
+    opts = dict(opts)
+    size = int(opts.get("--size", 100))
+    plot = "--plot" in opts
+
+    print "%-30s %7s %8s %9s %9s %10s %13s" % ("Region", "setup", "points", "batch", "scalar*", "max |dX|", "converged")
+    for name, vertices in polygonsOf(args[0] if args else None, args[1] if len(args) > 1 else None):
+        benchmark(name, vertices, size, plot)
+    print "* estimated from %d points evaluated one at a time" % SCALAR_SAMPLES
+
+    if plot:
+        import matplotlib.pyplot as plt
+        plt.show()
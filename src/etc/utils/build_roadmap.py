@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+""" Build the roadmap used by the sampling-based motion controllers (RRT, OMPL)
+    for a project, and save it next to the project's _decomposed.regions file,
+    so that they don't have to plan from scratch at run time.
+
+    Run this after compiling the specification.  The roadmap is built for the
+    calibration of the project's current experiment configuration and the given
+    robot radius (in lab units; the default is that used by the controllers for
+    basicSim and ODE).  Roadmaps for other radii stored in the same file are kept.
+
+    Usage: build_roadmap.py [--radius R] [--seed N] file.spec
+"""
+
+import sys, os, time, getopt
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "lib"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "lib", "handlers", "motionControl"))
+import lib.project as project
+import __roadmap as roadmapHelper
+
+def usage():
+    print __doc__.strip().split("\n")[-1].strip()
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["radius=", "seed="])
+    except getopt.GetoptError, e:
+        print e
+        usage()
+        sys.exit(2)
+    opts = dict(opts)
+
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+
+    radius = float(opts.get("--radius", 5))
+    seed = int(opts.get("--seed", 0))
+
+    proj = project.Project()
+    if not proj.loadProject(args[0]):
+        sys.exit(1)
+
+    if proj.compile_options['decompose']:
+        proj.rfiold = proj.rfi
+        proj.rfi = proj.loadRegionFile(decomposed=True)
+        if proj.rfi is None:
+            sys.exit(1)
+    proj.updateCoordMaps()
+
+    if proj.coordTransform is None:
+        print "No experiment configuration; the roadmap needs a calibration."
+        sys.exit(1)
+
+    start = time.time()
+    roadmap = roadmapHelper.buildRoadmap(proj.getRegionGeometry(), radius, seed)
+    print "Built a roadmap with %d nodes and %d edges, through %d of %d transitions, in %.2fs" % \
+            (len(roadmap.points), roadmap.edges.shape[1], len(roadmap.gates),
+             sum(1 for i, j, faces in proj.rfi.transitions.iterTransitions() if i != j), time.time() - start)
+
+    roadmapHelper.saveRoadmap(proj, roadmap)
+    print "Saved to %s" % roadmapHelper.roadmapFilename(proj)
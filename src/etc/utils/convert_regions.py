@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+""" Convert a region file between the text and binary region file formats.
+
+    Usage: convert_regions.py [--text | --binary] input.regions output.regions
+
+    By default the output is written in whichever format the input is not.
+"""
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "lib"))
+import lib.regions as regions
+
+args = [a for a in sys.argv[1:] if not a.startswith("--")]
+flags = [a for a in sys.argv[1:] if a.startswith("--")]
+
+if len(args) != 2 or any(f not in ("--text", "--binary") for f in flags) or len(flags) > 1:
+    print __doc__
+    sys.exit(1)
+
+fn_in, fn_out = args
+
+rfi = regions.RegionFileInterface()
+if not rfi.readFile(fn_in):
+    print "ERROR: Could not load region file %s" % fn_in
+    sys.exit(1)
+
+if flags:
+    binary = (flags[0] == "--binary")
+else:
+    binary = not regions.isBinaryRegionFile(fn_in)
+
+if binary:
+    rfi.writeBinaryFile(fn_out)
+else:
+    rfi.writeFile(fn_out)
+
+print "Wrote %d regions to %s (%s format)" % (len(rfi.regions), fn_out, "binary" if binary else "text")
@@ -453,17 +453,16 @@ class MopsyFrame(wx.Frame):
     def onMapClick(self, event):
         x = event.GetX()/self.mapScale
         y = event.GetY()/self.mapScale
-        for i, region in enumerate(self.proj.rfi.regions):
-            if region.objectContainsPoint(x, y):
-                self.dest_region = i
+        i = self.proj.rfi.regionContainingPoint(x, y)
+        if i is not None:
+            self.dest_region = i
 
-                if self.dest_region == self.current_region:
-                    self.label_movingto.SetLabel("Stay in region " + self.env_aut.getAnnotatedRegionName(self.proj.rfi.regions.index(region)))
-                else:
-                    self.label_movingto.SetLabel("Move to region " + self.env_aut.getAnnotatedRegionName(self.proj.rfi.regions.index(region)))
+            if self.dest_region == self.current_region:
+                self.label_movingto.SetLabel("Stay in region " + self.env_aut.getAnnotatedRegionName(i))
+            else:
+                self.label_movingto.SetLabel("Move to region " + self.env_aut.getAnnotatedRegionName(i))
 
-                self.applySafetyConstraints()
-                break
+            self.applySafetyConstraints()
 
         self.onResize() # Force map redraw
         event.Skip()
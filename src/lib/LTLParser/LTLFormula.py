@@ -101,6 +101,11 @@ class LTLFormula(object):
     def getConjunctsByType(self, kind):
         return [t for t in self.getConjuncts() if t.getType() == kind]
 
+    def simplify(self):
+        """ Return a new, logically equivalent LTLFormula with constants folded,
+            duplicate sub-formulas removed and absorbed terms dropped """
+        return LTLFormula(simplify_tree(self.tree))
+
     def getConjuncts(self):
         if not self.tree[0] == "Conjunction":
             # This can happen if there is only one conjunct in the spec, for example
@@ -185,6 +190,165 @@ def flatten_as_much_as_possible(tree):
     # Every other case
     return tree
 
+TRUE_TREE = ('TRUE',)
+FALSE_TREE = ('FALSE',)
+
+def is_true(tree):
+    return tree[0] == 'TRUE'
+
+def is_false(tree):
+    return tree[0] == 'FALSE'
+
+def is_negation(tree):
+    return tree[0] == "UnaryFormula" and tree[1][0] == "NotOperator"
+
+def negate_tree(tree):
+    """ Return the negation of a (cleaned) tree, avoiding double negations """
+
+    if is_true(tree):
+        return FALSE_TREE
+    elif is_false(tree):
+        return TRUE_TREE
+    elif is_negation(tree):
+        return tree[2]
+    else:
+        return ["UnaryFormula", ["NotOperator", ('!',)], tree]
+
+def _simplify_nary(tree):
+    """ Simplify a flattened conjunction or disjunction """
+
+    if tree[0] == "Conjunction":
+        identity, annihilator = TRUE_TREE, FALSE_TREE
+        dual = "Disjunction"
+    else:
+        identity, annihilator = FALSE_TREE, TRUE_TREE
+        dual = "Conjunction"
+
+    # Simplify children, absorbing any nested operators of the same type
+    # that simplification may have produced
+    children = []
+    for child in tree[1:]:
+        child = simplify_tree(child)
+        if child[0] == tree[0]:
+            children.extend(child[1:])
+        else:
+            children.append(child)
+
+    # Constant folding and deduplication (keep the first occurrence)
+    parts = []
+    keys = set()
+    for child in children:
+        if child[0] == identity[0]:
+            continue
+        if child[0] == annihilator[0]:
+            return annihilator
+        key = treeToString(child)
+        if key in keys:
+            continue
+        keys.add(key)
+        parts.append((key, child))
+
+    # x & !x == FALSE, x | !x == TRUE
+    for key, child in parts:
+        if is_negation(child) and treeToString(child[2]) in keys:
+            return annihilator
+
+    # Absorption: x & (x | y) == x, x | (x & y) == x
+    # A part is absorbed if the operands of some other part are a subset of its own
+    operands = [frozenset(treeToString(t) for t in child[1:]) if child[0] == dual else frozenset([key])
+                for key, child in parts]
+    kept = []
+    for i, (key, child) in enumerate(parts):
+        if child[0] == dual and any(j != i and operands[j] < operands[i] for j in range(len(parts))):
+            continue
+        kept.append(child)
+
+    if len(kept) == 0:
+        return identity
+    elif len(kept) == 1:
+        return kept[0]
+    else:
+        return [tree[0]] + kept
+
+def simplify_tree(tree):
+    """ Return a logically equivalent version of a cleaned parse tree, with constant
+        subformulas folded, duplicate conjuncts/disjuncts removed and absorbed terms
+        and tautological implications eliminated.  The input tree is not modified. """
+
+    # Ground case
+    if tree[0] in p.terminals or tree[0] == "Assignment":
+        return tree
+
+    if tree[0] in ["Conjunction", "Disjunction"]:
+        return _simplify_nary(tree)
+    elif tree[0] == "Xor":
+        # Pull out constants, tracking parity
+        parity = False
+        kept = []
+        for child in tree[1:]:
+            child = simplify_tree(child)
+            if is_true(child):
+                parity = not parity
+            elif not is_false(child):
+                kept.append(child)
+
+        if len(kept) == 0:
+            result = FALSE_TREE
+        elif len(kept) == 1:
+            result = kept[0]
+        else:
+            result = ["Xor"] + kept
+
+        return negate_tree(result) if parity else result
+    elif tree[0] == "Implication":
+        lhs = simplify_tree(tree[1])
+        rhs = simplify_tree(tree[2])
+        lhs_key = treeToString(lhs)
+        rhs_key = treeToString(rhs)
+
+        if is_true(lhs):
+            return rhs
+        if is_false(lhs) or is_true(rhs) or lhs_key == rhs_key:
+            return TRUE_TREE
+        if is_false(rhs):
+            return negate_tree(lhs)
+        # (a & b) -> a, and a -> (a | b)
+        if lhs[0] == "Conjunction" and rhs_key in [treeToString(t) for t in lhs[1:]]:
+            return TRUE_TREE
+        if rhs[0] == "Disjunction" and lhs_key in [treeToString(t) for t in rhs[1:]]:
+            return TRUE_TREE
+
+        return ["Implication", lhs, rhs]
+    elif tree[0] == "Biimplication":
+        lhs = simplify_tree(tree[1])
+        rhs = simplify_tree(tree[2])
+
+        if is_true(lhs):
+            return rhs
+        if is_true(rhs):
+            return lhs
+        if is_false(lhs):
+            return negate_tree(rhs)
+        if is_false(rhs):
+            return negate_tree(lhs)
+        if treeToString(lhs) == treeToString(rhs):
+            return TRUE_TREE
+
+        return ["Biimplication", lhs, rhs]
+    elif tree[0] == "UnaryFormula":
+        child = simplify_tree(tree[2])
+
+        if tree[1][0] == "NotOperator":
+            return negate_tree(child)
+
+        # Next, globally and finally all preserve constants
+        if is_true(child) or is_false(child):
+            return child
+
+        return [tree[0], tree[1], child]
+    else:
+        return [tree[0]] + [simplify_tree(x) for x in tree[1:]]
+
 
 # =====================================================
 # The parsing function
@@ -223,7 +387,8 @@ def treeToString(tree, top_level=True):
     n_ary_operators = {"Conjunction": " & ",
                        "Disjunction": " | ",
                        "Implication": " -> ",
-                       "Biimplication": " <-> "}
+                       "Biimplication": " <-> ",
+                       "Xor": " ^ "}
 
     # We need to force parentheses for some operators, even if they are unary
     requires_parens = ["NextOperator", "GloballyOperator", "FinallyOperator"]
@@ -248,6 +413,12 @@ def treeToString(tree, top_level=True):
            # ^^^ HACK: To be backwards compatible, we want to avoid [](<>(something))
             child = "(" + child + ")"
         return treeToString(tree[1], top_level=False) + child
+    elif tree[0] == "BinaryTemporalFormula":
+        # Keep the operator separated from its operands so it isn't lexed as part of an id
+        chunk = " ".join(treeToString(t, top_level=False) for t in tree[1:])
+        if not top_level:
+            chunk = "(" + chunk + ")"
+        return chunk
     else:
         return "".join(treeToString(t, top_level=False) for t in tree[1:])
         
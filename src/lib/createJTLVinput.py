@@ -11,6 +11,7 @@ import math
 import parseEnglishToLTL
 import textwrap
 from LTLParser.LTLFormula import LTLFormula, LTLFormulaType, treeToString
+from LTLParser.LTLParser import Parser as LTLParser
 
 def createSMVfile(fileName, sensorList, robotPropList):
     ''' This function writes the skeleton SMV file.
@@ -59,6 +60,7 @@ def createSMVfile(fileName, sensorList, robotPropList):
     
 
 def createTopologyFragment(adjData, regions, use_bits=True):
+    # adjData is a regions.AdjacencyMatrix, so only adjacent pairs are visited
     if use_bits:
         numBits = int(math.ceil(math.log(len(adjData),2)))
         # TODO: only calc bitencoding once
@@ -77,12 +79,11 @@ def createTopologyFragment(adjData, regions, use_bits=True):
         adjFormula = adjFormula + (nextBitEnc[Origin] if use_bits else "next(s."+regions[Origin].name+")")
         adjFormula = adjFormula + ')'
         
-        for dest in range(len(adjData)):
-            if adjData[Origin][dest]:
-                # not empty, hence there is a transition
-                adjFormula = adjFormula + '\n\t\t\t\t\t\t\t\t\t| ('
-                adjFormula = adjFormula + (nextBitEnc[dest] if use_bits else "next(s."+regions[dest].name+")")
-                adjFormula = adjFormula + ') '
+        for dest in adjData.neighbors(Origin):
+            # adjacent, hence there is a transition
+            adjFormula = adjFormula + '\n\t\t\t\t\t\t\t\t\t| ('
+            adjFormula = adjFormula + (nextBitEnc[dest] if use_bits else "next(s."+regions[dest].name+")")
+            adjFormula = adjFormula + ') '
 
         # closing this region
         adjFormula = adjFormula + ' ) ) '
@@ -129,7 +130,107 @@ def createNecessaryFillerSpec(spec_part):
         if not formula.getConjunctsByType(LTLFormulaType.LIVENESS):
             filler_spec.append("[]<>(TRUE)")
 
-    return " & ".join(filler_spec) 
+    return " & ".join(filler_spec)
+
+def simplifySpecPart(spec_part):
+    """ Simplify one half (assumptions or guarantees) of a specification before
+        it is written out.  Each top-level conjunct is simplified on its own, then
+        duplicates and trivially true conjuncts are removed.  Conjuncts are
+        regrouped into initial, safety and liveness order, and TRUE fillers are
+        kept only where a group would otherwise be empty.
+
+        Returns a tuple (text, conjunct_map), where `text` is the simplified
+        spec with one conjunct per line and `conjunct_map` maps the canonical
+        string of every original conjunct to the list of output lines (exactly
+        as they appear in `text`) that it became.  Conjuncts that were removed
+        map to an empty list. """
+
+    if spec_part.strip() == "":
+        return spec_part, {}
+
+    conjunct_origins = {}   # canonical output conjunct -> list of canonical input conjuncts
+    outputs = {LTLFormulaType.INITIAL: [],
+               LTLFormulaType.SAFETY: [],
+               LTLFormulaType.LIVENESS: [],
+               LTLFormulaType.OTHER: []}
+    conjunct_map = {}
+
+    for conjunct in LTLFormula.fromString(spec_part).getConjuncts():
+        original = treeToString(conjunct.tree)
+        conjunct_map.setdefault(original, [])
+
+        simplified = conjunct.simplify()
+        if simplified.tree[0] == "Conjunction":
+            # e.g. TRUE -> (a & b) becomes two separate conjuncts
+            pieces = simplified.getConjuncts()
+        else:
+            pieces = [simplified]
+
+        for piece in pieces:
+            if piece.tree[0] == 'TRUE':
+                continue
+            text = treeToString(piece.tree)
+            if text not in conjunct_origins:
+                conjunct_origins[text] = []
+                outputs[piece.getType()].append(text)
+            if original not in conjunct_origins[text]:
+                conjunct_origins[text].append(original)
+
+    # Both parts need at least one each of initial, safety, and liveness formulas
+    fillers = {LTLFormulaType.INITIAL: "TRUE",
+               LTLFormulaType.SAFETY: "[](TRUE)",
+               LTLFormulaType.LIVENESS: "[]<>(TRUE)"}
+    for kind, filler in fillers.iteritems():
+        if not outputs[kind]:
+            outputs[kind].append(filler)
+            conjunct_origins.setdefault(filler, [])
+
+    ordered = [text for kind in (LTLFormulaType.INITIAL, LTLFormulaType.SAFETY,
+                                 LTLFormulaType.LIVENESS, LTLFormulaType.OTHER)
+                    for text in outputs[kind]]
+
+    lines = []
+    for i, text in enumerate(ordered):
+        line = '\t\t\t' + text
+        if i < len(ordered) - 1:
+            line += ' & '
+        lines.append(line)
+        for original in conjunct_origins[text]:
+            conjunct_map[original].append(line)
+
+    return "\n".join(lines), conjunct_map
+
+def remapSimplifiedFragments(fragments, conjunct_map, canonical=False):
+    """ Given a dictionary keyed by LTL fragments of an unsimplified spec (e.g. the
+        LTL -> spec line number mapping), return a copy keyed by the corresponding
+        lines of the simplified spec, using a `conjunct_map` from simplifySpecPart().
+
+        Fragments that were simplified away are dropped, and fragments that cannot
+        be matched are kept unchanged.  If several fragments end up on the same line,
+        the first one wins.  If `canonical` is True, the new keys are stripped of
+        surrounding whitespace and conjunction operators. """
+
+    remapped = {}
+    for fragment, value in fragments.iteritems():
+        try:
+            tree = LTLFormula.fromString(fragment.strip("\n\t &")).tree
+        except LTLParser.ParseErrors:
+            remapped[fragment] = value
+            continue
+
+        trees = tree[1:] if tree[0] == "Conjunction" else [tree]
+        originals = [treeToString(t) for t in trees]
+        if not all(o in conjunct_map for o in originals):
+            remapped[fragment] = value
+            continue
+
+        for original in originals:
+            for line in conjunct_map[original]:
+                if canonical:
+                    line = line.lstrip().rstrip("\n\t &")
+                remapped.setdefault(line, value)
+
+    return remapped
 
 def flattenLTLFormulas(f):
     if isinstance(f, LTLFormula):
@@ -24,6 +24,279 @@ def removeDuplicatePoints(points):
 
     return points
 
+def signedArea(points):
+    # twice the signed area of a contour; positive when it is counterclockwise
+    return sum(points[i-1][0]*points[i][1] - points[i][0]*points[i-1][1] for i in xrange(len(points)))
+
+def cross(o, a, b):
+    # z-component of (a-o) x (b-o); positive when o->a->b turns left
+    return (a[0]-o[0])*(b[1]-o[1]) - (a[1]-o[1])*(b[0]-o[0])
+
+def cleanContour(points, orientation):
+    """
+    Return a copy of a contour with the given orientation (1 for ccw, -1 for cw), without
+    consecutive duplicate points or collinear vertices, and the list of collinear vertices
+    that were removed.
+    """
+    points = removeDuplicatePoints([tuple(pt) for pt in points])
+    if signedArea(points)*orientation < 0:
+        points.reverse()
+
+    removed = []
+    clean = False
+    while not clean and len(points) > 3:
+        clean = True
+        for i in xrange(len(points)):
+            a, b, c = points[i-1], points[i], points[(i+1)%len(points)]
+            if cross(a, b, c) == 0:
+                removed.append(b)
+                points.pop(i)
+                clean = False
+                break
+
+    return points, removed
+
+def pointInTriangle(p, a, b, c):
+    # True if p is inside or on the boundary of the ccw triangle abc
+    return cross(a, b, p) >= 0 and cross(b, c, p) >= 0 and cross(c, a, p) >= 0
+
+def traceLoops(contours):
+    """
+    Trace the edges of a polygon's (ccw) outer contour and (cw) holes into simple loops.
+    Where two parts of a region only meet at a point, Polygon returns contours that touch
+    themselves or each other there, and they may pass through that vertex in any order.
+    Leaving each vertex along the first edge clockwise from the one we arrived along keeps
+    the region tightly on the left, and so splits it into its separate parts (ccw loops)
+    and holes (cw loops).  Loops without any area are dropped.  Returns None if the
+    edges can't be traced like that.
+    """
+    edges = []
+    outgoing = {}
+    for points in contours:
+        for i in xrange(len(points)):
+            a, b = points[i], points[(i+1)%len(points)]
+            edges.append((a, b))
+            outgoing.setdefault(a, []).append(b)
+    if len(set(edges)) != len(edges):
+        return None
+
+    def turn(a, b, c):
+        # clockwise angle at b from the direction of a to that of c, in (0, 2*pi]
+        angle = (math.atan2(a[1]-b[1], a[0]-b[0]) - math.atan2(c[1]-b[1], c[0]-b[0])) % (2*math.pi)
+        return angle if angle > 0 else 2*math.pi
+
+    loops = []
+    used = set()
+    for edge in edges:
+        loop = []
+        a, b = edge
+        while (a, b) not in used:
+            used.add((a, b))
+            loop.append(a)
+            a, b = b, min(outgoing[b], key=lambda c: turn(a, b, c))
+        if loop and (a, b) != edge:
+            return None
+        if len(loop) >= 3 and signedArea(loop) != 0:
+            loops.append(loop)
+
+    return loops
+
+def groupContours(outer, holes):
+    """
+    Split the (ccw) outer contour and (cw) holes of a polygon into simple loops (see
+    traceLoops()), and return a list of (outer loop, holes inside it) for each separate
+    part of the polygon, or None if that isn't possible.
+    """
+    loops = traceLoops([outer] + holes)
+    if loops is None:
+        return None
+
+    groups = [(loop, []) for loop in loops if signedArea(loop) > 0]
+    for hole in [loop for loop in loops if signedArea(loop) < 0]:
+        # Any point strictly inside the hole is inside the part of the polygon around it
+        ears = earClip(hole[::-1])
+        if not ears:
+            return None
+        x = sum(pt[0] for pt in ears[0])/3.0
+        y = sum(pt[1] for pt in ears[0])/3.0
+        for loop, loopHoles in groups:
+            if Polygon.Polygon(loop).isInside(x, y):
+                loopHoles.append(hole)
+                break
+        else:
+            return None
+
+    return groups
+
+def bridgeHoles(outer, holes):
+    """
+    Join each (cw) hole to the (ccw) outer contour with a pair of coincident edges, so that
+    the result is a single contour that can be triangulated by ear clipping.
+    Holes are processed from the rightmost one, connecting each hole's rightmost vertex to
+    a vertex visible from it along a ray to +inf in x.
+    """
+    poly = list(outer)
+
+    for hole in sorted(holes, key=lambda h: -max(pt[0] for pt in h)):
+        m = max(xrange(len(hole)), key=lambda i: (hole[i][0], -hole[i][1]))
+        M = hole[m]
+
+        # find the closest edge of the contour hit by the ray from M
+        best = None
+        for k in xrange(len(poly)):
+            a, b = poly[k], poly[(k+1)%len(poly)]
+            if a[1] == b[1] or not (min(a[1], b[1]) <= M[1] <= max(a[1], b[1])):
+                continue
+            ix = a[0] + (M[1]-a[1])*(b[0]-a[0])/float(b[1]-a[1])
+            if ix >= M[0] and (best is None or ix < best[0]):
+                best = (ix, k)
+        if best is None:
+            return None
+
+        ix, k = best
+        I = (ix, M[1])
+        a, b = poly[k], poly[(k+1)%len(poly)]
+        if a == I or b == I:
+            P = I if a == I else b
+        else:
+            P = a if a[0] > b[0] else b
+
+        # any reflex vertex inside the triangle M, I, P could block the view of P;
+        # if so, use the one making the smallest angle with the ray instead
+        tri = (M, I, P) if cross(M, I, P) > 0 else (M, P, I)
+        for j in xrange(len(poly)):
+            R = poly[j]
+            if R == P or R == I:
+                continue
+            if cross(poly[j-1], R, poly[(j+1)%len(poly)]) <= 0 and pointInTriangle(R, *tri):
+                angleR = math.atan2(abs(R[1]-M[1]), R[0]-M[0])
+                angleP = math.atan2(abs(P[1]-M[1]), P[0]-M[0])
+                if angleR < angleP or (angleR == angleP and
+                        (R[0]-M[0])**2 + (R[1]-M[1])**2 < (P[0]-M[0])**2 + (P[1]-M[1])**2):
+                    P = R
+
+        # P may appear several times after earlier bridges; pick the occurrence whose
+        # interior wedge contains the direction towards M
+        d = (M[0]-P[0], M[1]-P[1])
+        k = None
+        for j in xrange(len(poly)):
+            if poly[j] != P:
+                continue
+            prev, next = poly[j-1], poly[(j+1)%len(poly)]
+            e1 = (next[0]-P[0], next[1]-P[1])
+            e2 = (prev[0]-P[0], prev[1]-P[1])
+            c1 = e1[0]*d[1] - e1[1]*d[0]
+            c2 = d[0]*e2[1] - d[1]*e2[0]
+            if cross(prev, P, next) > 0:
+                inWedge = c1 > 0 and c2 > 0
+            else:
+                inWedge = not (c1 <= 0 and c2 <= 0)
+            if inWedge:
+                k = j
+                break
+        if k is None:
+            return None
+
+        poly = poly[:k+1] + hole[m:] + hole[:m] + [M, P] + poly[k+1:]
+
+    return poly
+
+def earClip(poly):
+    """
+    Triangulate a simple ccw contour (possibly with bridged holes) by ear clipping.
+    Returns a list of ccw triangles, or None if no ear could be found.
+    """
+    poly = list(poly)
+    triangles = []
+
+    i = 0
+    stalled = 0
+    while len(poly) > 3:
+        n = len(poly)
+        i = i % n
+        a, b, c = poly[i-1], poly[i], poly[(i+1)%n]
+        isEar = cross(a, b, c) > 0
+        if isEar:
+            for j in xrange(n):
+                p = poly[j]
+                if p == a or p == b or p == c:
+                    continue
+                if pointInTriangle(p, a, b, c):
+                    isEar = False
+                    break
+
+        if isEar:
+            triangles.append([a, b, c])
+            poly.pop(i)
+            i -= 1
+            stalled = 0
+        else:
+            i += 1
+            stalled += 1
+            if stalled > n:
+                return None
+
+    if cross(*poly) > 0:
+        triangles.append(poly)
+
+    return triangles
+
+def mergeConvexPieces(pieces):
+    """
+    Hertel-Mehlhorn merging: remove diagonals between ccw convex pieces whenever the union
+    of the two pieces on either side of it is still convex.
+    """
+    pieces = dict(enumerate([list(p) for p in pieces]))
+    owner = {}  # directed edge -> index of the piece it belongs to
+    for idx, piece in pieces.iteritems():
+        for k in xrange(len(piece)):
+            owner[(piece[k], piece[(k+1)%len(piece)])] = idx
+
+    diagonals = [e for e in owner if (e[1], e[0]) in owner and e[0] < e[1]]
+    for u, v in sorted(diagonals):
+        if (u, v) not in owner or (v, u) not in owner:
+            continue
+        ia, ib = owner[(u, v)], owner[(v, u)]
+        if ia == ib:
+            continue
+
+        A, B = pieces[ia], pieces[ib]
+        # walk A from v round to u, then B from u round to v (both skipping the diagonal)
+        ka = A.index(v) if A[(A.index(u)+1)%len(A)] == v else None
+        kb = B.index(u) if B[(B.index(v)+1)%len(B)] == u else None
+        if ka is None or kb is None:
+            continue
+        merged = [A[(ka+j)%len(A)] for j in xrange(len(A))] + \
+                 [B[(kb+j)%len(B)] for j in xrange(1, len(B)-1)]
+
+        n = len(merged)
+        if any(cross(merged[j-1], merged[j], merged[(j+1)%n]) < 0 for j in xrange(n)):
+            continue
+
+        del owner[(u, v)]
+        del owner[(v, u)]
+        del pieces[ib]
+        pieces[ia] = merged
+        for k in xrange(n):
+            owner[(merged[k], merged[(k+1)%n])] = ia
+
+    return [pieces[idx] for idx in sorted(pieces)]
+
+def insertCollinearPoints(piece, points):
+    """
+    Put back any of the given points that lie in the middle of an edge of the piece
+    """
+    result = []
+    for k in xrange(len(piece)):
+        a, b = piece[k], piece[(k+1)%len(piece)]
+        result.append(a)
+        onEdge = [p for p in points if p != a and p != b and cross(a, b, p) == 0 and
+                  min(a[0], b[0]) <= p[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= p[1] <= max(a[1], b[1])]
+        onEdge.sort(key=lambda p: (p[0]-a[0])**2 + (p[1]-a[1])**2)
+        result.extend(onEdge)
+
+    return result
+
 class decomposition():
 
     def __init__(self,polygon,holes=[]):
@@ -33,7 +306,6 @@ class decomposition():
         """
 
         # Initialization
-        self.background = Polygon.Polygon(((-300,-300),(1500,-300),(1500,1500),(-300,1500)))
         self.P = polygon
         
         if self.P.orientation()[0] > 0:
@@ -42,6 +314,7 @@ class decomposition():
         self.holeList = holes
         
         self.listOfConvexPoly = [] # List of convex polygons
+        self.failed = False # Whether hertelMehlhorn() had to fall back to MP5
 
         #self.drawPoly([self.P],'Initial')
         poly = []
@@ -128,6 +401,36 @@ class decomposition():
         return self.listOfConvexPoly
         #print "Mission Complete"
         
+    def hertelMehlhorn(self):
+        """
+        Decompose the polygon into convex polygons by ear clipping triangulation followed
+        by Hertel-Mehlhorn merging.  Holes are joined to the outer contour up front, and
+        vertices are never moved or added, so that neighbouring pieces share whole faces.
+        Parts of the polygon that only touch at a vertex are decomposed separately.
+        Falls back to MP5 if the polygon is too degenerate to triangulate.
+        """
+
+        outer, removed = cleanContour(Polygon.Utils.pointList(self.P), 1)
+        holes = []
+        for hole in self.holeList:
+            points, holeRemoved = cleanContour(Polygon.Utils.pointList(hole), -1)
+            holes.append(points)
+            removed.extend(holeRemoved)
+
+        pieces = []
+        for loop, loopHoles in groupContours(outer, holes) or [(None, None)]:
+            bridged = bridgeHoles(loop, loopHoles) if loop is not None else None
+            triangles = earClip(bridged) if bridged is not None else None
+            if triangles is None:
+                print "WARNING: Ear clipping failed; falling back to MP5 decomposition"
+                self.failed = True
+                return self.MP5()
+            pieces.extend(mergeConvexPieces(triangles))
+
+        self.listOfConvexPoly = [Polygon.Polygon(insertCollinearPoints(piece, removed))
+                                 for piece in pieces]
+        return self.listOfConvexPoly
+
     def removeContour(self,contour):
         pt1 = contour[0][0]
         pt2 = contour[0][1]
@@ -468,6 +771,15 @@ class decomposition():
             return False
             
     def drawPoly(self,polyList,fileName):
+        # use a background slightly larger than the polygons being drawn
+        xmin, xmax, ymin, ymax = Polygon.Polygon(self.P).boundingBox() if self.P.nPoints() > 0 else (0, 1, 0, 1)
+        for poly in polyList:
+            if poly.nPoints() > 0:
+                bxmin, bxmax, bymin, bymax = poly.boundingBox()
+                xmin, xmax, ymin, ymax = min(xmin, bxmin), max(xmax, bxmax), min(ymin, bymin), max(ymax, bymax)
+        margin = 0.1*max(xmax-xmin, ymax-ymin)
+        self.background = Polygon.Shapes.Rectangle(xmax-xmin+2*margin, ymax-ymin+2*margin)
+        self.background.shift(xmin-margin, ymin-margin)
         polyList.insert(0,self.background)
         Polygon.IO.writeSVG('/Users/cameron/Desktop/'+fileName+'.svg', polyList)
         polyList.pop(0) # make sure the back ground won't be added to the actual list
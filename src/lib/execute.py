@@ -112,14 +112,12 @@ class LTLMoPExecutor(object, ExecutorResynthesisExtensions):
         return aut if success else None
 
     def _getCurrentRegionFromPose(self, rfi=None):
-        # TODO: move this to regions.py
         if rfi is None:
             rfi = self.proj.rfi
 
         pose = self.proj.coordmap_lab2map(self.proj.h_instance['pose'].getPose())
 
-        region = next((i for i, r in enumerate(rfi.regions) if r.name.lower() != "boundary" and \
-                        r.objectContainsPoint(*pose)), None)
+        region = rfi.regionContainingPoint(pose[0], pose[1], excludeBoundary=True)
  
         if region is None:
             logging.warning("Pose of {} not inside any region!".format(pose))
@@ -7,7 +7,11 @@
     Some routines for reading and writing plaintext config/data files, shared throughout the toolkit.
 """
 
-import re, types
+import re, types, os, time, threading
+
+# How many times, and how long apart (in seconds), to try replacing a file that is in use (on Windows)
+REPLACE_FILE_RETRIES = 20
+REPLACE_FILE_RETRY_DELAY = 0.05
 
 def readFromFile(fileName):
     """
@@ -160,6 +164,39 @@ def writeToFile(fileName, data, comments={}):
             print >>f  # Put a blank line in between sections, just because it's prettier that way 
     f.close()
 
+def replaceFile(fileName, write):
+    """
+    Call ``write(tmpName)`` to write a new version of the given file under a temporary
+    name in the same directory, and then rename it over the old one.  Readers never see
+    a half-written file, and anything that still has the old file open or memory-mapped
+    (e.g. region files loaded lazily by :meth:`regions.RegionFileInterface.readBinaryFile`)
+    keeps its own copy.
+
+    Windows can't rename over an existing file, nor remove one that is still open, so
+    there the old file is removed first, retrying for a while if it is in use.
+    """
+
+    tmpName = "%s.%d.%d.tmp" % (fileName, os.getpid(), threading.current_thread().ident)
+    try:
+        write(tmpName)
+
+        for attempt in xrange(REPLACE_FILE_RETRIES):
+            try:
+                os.rename(tmpName, fileName)
+                break
+            except OSError:
+                if os.name != "nt" or attempt == REPLACE_FILE_RETRIES - 1:
+                    raise
+            try:
+                os.remove(fileName)
+            except OSError:
+                # Still in use; give whoever has it a chance to let go
+                time.sleep(REPLACE_FILE_RETRY_DELAY)
+    except:
+        if os.path.exists(tmpName):
+            os.remove(tmpName)
+        raise
+
 def properCase(str):
     """
     Returns a copy of a string, with the first letter capitalized and all others lower-case
@@ -613,6 +613,18 @@ class Automaton:
                 # We're going to a new region
                 print "Heading to region %s..." % self.regions[self.next_region].name
 
+            if hasattr(self.motion_handler, "_anticipateTransitions"):
+                # Let the motion handler get ready for the other moves we could make now,
+                # and for the ones we could make once we get to the next region
+                transitions = [(self.current_region, self.regionFromState(s)) for s in next_states]
+                if self.next_region is not None:
+                    transitions += [(self.next_region, self.regionFromState(s)) for s in self.next_state.transitions]
+                upcoming = []
+                for from_reg, to_reg in transitions:
+                    if to_reg is not None and from_reg != to_reg and (from_reg, to_reg) not in upcoming:
+                        upcoming.append((from_reg, to_reg))
+                self.motion_handler._anticipateTransitions(upcoming)
+
             self.arrived = False
 
 
@@ -28,7 +28,6 @@ import matplotlib.animation as animation
 import thread
 import threading
 
-
 class motionControlHandler:
     def __init__(self, proj, shared_data,robot_type):
         """
@@ -120,6 +119,7 @@ class motionControlHandler:
             self.boxRealVertical_shift  = self.boxRealVertical_shift*self.factorODE
             self.boxRealHorizontal_shift= self.boxRealHorizontal_shift*self.factorODE
 
+        self.geometry = proj.getRegionGeometry()  # lab-frame region polygons shared with other handlers
         self.map = {}                             # dictionary for all the regions
         self.all = Polygon.Polygon()              # Polygon with all the regions
         self.map_work = Polygon.Polygon()         # Polygon of the current region and next region considered
@@ -153,16 +153,9 @@ class motionControlHandler:
         self.realRobot.shift(pose[0]-self.boxRealHorizontal_shift,pose[1]-self.boxRealVertical_shift)
         self.realRobot.rotate(pose[2]-pi/2,pose[0],pose[1])
 
-        #constructing polygon of different regions (holes being taken care)
-
-        for region in self.proj.rfi.regions:
-            self.map[region.name] = self.createRegionPolygon(region)
-            for n in range(len(region.holeList)): # no of holes
-                self.map[region.name] -= self.createRegionPolygon(region,n)
-
-        #construct a polygon that included all the regions
-        for regionName,regionPoly in self.map.iteritems():
-            self.all += regionPoly
+        #polygons of different regions (holes being taken care), and one that includes all the regions
+        self.map = self.geometry.getPolygonsByName()
+        self.all = self.geometry.getBoundary()
 
 
         #setting for plotting
@@ -229,13 +222,9 @@ class motionControlHandler:
         if not self.previous_current_reg == current_reg:
             #print 'getting into bug alogorithm'
 
-            #clean up the previous self.map_work
-            self.map_work =  Polygon.Polygon()
-
             # NOTE: Information about region geometry can be found in self.proj.rfi.regions
-            # create polygon list for regions other than the current_reg and the next_reg
-            self.map_work += self.map[self.proj.rfi.regions[current_reg].name]
-            self.map_work += self.map[self.proj.rfi.regions[next_reg].name]
+            # polygon of the current_reg and the next_reg
+            self.map_work = self.geometry.getUnion([current_reg, next_reg])
 
             # building current polygon and destination polygon
             self.nextRegionPoly    = self.map[self.proj.rfi.regions[next_reg].name]
@@ -250,24 +239,20 @@ class motionControlHandler:
                 print "Next reg is "+ str(self.proj.rfi.regions[next_reg].name.lower())
 
 
-                for i in range(len(self.proj.rfi.transitions[current_reg][next_reg])):
-                    pointArray_transface = [x for x in self.proj.rfi.transitions[current_reg][next_reg][i]]
-                    transFace = asarray(map(self.coordmap_map2lab,pointArray_transface))
-                    bundle_x = (transFace[0,0] +transFace[1,0])/2    #mid-point coordinate x
-                    bundle_y = (transFace[0,1] +transFace[1,1])/2    #mid-point coordinate y
-                    q_gBundle = hstack((q_gBundle,vstack((bundle_x,bundle_y))))
-                q_gBundle = q_gBundle.transpose()
+                # mid-points of the faces to the next region
+                q_gBundle = self.geometry.getTransitionFaces(current_reg, next_reg)[0]
 
                 # Find the closest face to the current position
                 max_magsq = 1000000
+                goalRegion = self.geometry.getOffsetPolygon(next_reg, -self.PioneerLengthHalf*2)   # where the goal is far enough from the edges
                 for tf in q_gBundle:
                     magsq = (tf[0] - pose[0])**2 + (tf[1] - pose[1])**2
                     if magsq < max_magsq:
                         connection = 0
                         tf = tf+(tf-asarray(self.currentRegionPoly.center()))/norm(tf-asarray(self.currentRegionPoly.center()))*2.1*self.PioneerLengthHalf
-                        if not self.nextRegionPoly.covers(PolyShapes.Circle(self.PioneerLengthHalf*2,(tf[0],tf[1]))):
+                        if not goalRegion.isInside(tf[0],tf[1]):
                             tf = tf-(tf-asarray(self.currentRegionPoly.center()))/norm(tf-asarray(self.currentRegionPoly.center()))*4.2*self.PioneerLengthHalf
-                            if self.nextRegionPoly.covers(PolyShapes.Circle(self.PioneerLengthHalf*2,(tf[0],tf[1]))):
+                            if goalRegion.isInside(tf[0],tf[1]):
                                 connection = 1
                         else:
                             connection = 1
@@ -278,12 +263,9 @@ class motionControlHandler:
                             self.q_g[0] = pt1[0]
                             self.q_g[1] = pt1[1]
                         else:
-                            sample = False
-                            while not sample:
-                                self.q_g[0],self.q_g[1] = self.nextRegionPoly.sample(random.random)
-                                robo = PolyShapes.Circle(self.PioneerLengthHalf,(self.q_g[0],self.q_g[1]))
-                                if not bool(robo - self.nextRegionPoly):
-                                    sample = True
+                            # sample a point in the next region where the robot fits (anywhere in it if it doesn't fit)
+                            fits = self.geometry.getOffsetPolygon(next_reg, -self.PioneerLengthHalf)
+                            self.q_g[0],self.q_g[1] = (fits or self.nextRegionPoly).sample(random.random)
 
 
                 """
@@ -302,7 +284,7 @@ class motionControlHandler:
                     plt.plot(pose[0],pose[1],'bo')
                     self.plotPioneer(self.overlap_figure,0)
 
-                if transFace is None:
+                if len(q_gBundle) == 0:
                     print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.proj.rfi.regions[current_reg].name, self.proj.rfi.regions[next_reg].name)
 
 
@@ -693,14 +675,10 @@ class motionControlHandler:
         if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
             print "WARNING: Left current region but not in expected destination region"
             # Figure out what region we think we stumbled into
-            for r in self.proj.rfi.regions:
-                pointArray = [self.coordmap_map2lab(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    #print "I think I'm in " + r.name
-                    #print pose
-                    break
+            r = self.proj.rfi.regionContainingPoint(*self.coordmap_lab2map(pose[0:2]))
+            #if r is not None:
+            #    print "I think I'm in " + self.proj.rfi.regions[r].name
+            #    print pose
             self.last_warning = time.time()
 
         return arrived
@@ -793,19 +771,6 @@ class motionControlHandler:
         print 'Cannot find region with sub-region %s' % regionName
         return None
 
-    def createRegionPolygon(self,region,hole = None):
-        """
-        This function takes in the region points and make it a Polygon.
-        """
-        if hole == None:
-            pointArray = [x for x in region.getPoints()]
-        else:
-            pointArray = [x for x in region.getPoints(hole_id = hole)]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        regionPoints = [(pt[0],pt[1]) for pt in pointArray]
-        formedPolygon= Polygon.Polygon(regionPoints)
-        return formedPolygon
-
     def data_gen(self):
         self.ax.cla()
         self.plotPioneer(1)
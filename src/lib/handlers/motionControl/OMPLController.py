@@ -34,6 +34,8 @@ from time import sleep
 from math import fabs
 from numpy import *
 from __is_inside import *
+from __collisionChecking import RegionCollisionChecker
+import __roadmap as roadmapHelper
 import math
 import sys,os, time
 from scipy.linalg import norm
@@ -52,16 +54,18 @@ from math import sqrt, fabs , pi
 import random
 import thread
 import threading
+from bisect import bisect_left
 
 
 class motionControlHandler:
-    def __init__(self, proj, shared_data,Space_Dimension,planner,robot_type,Geometric_Control,plotting):
+    def __init__(self, proj, shared_data,Space_Dimension,planner,robot_type,Geometric_Control,plotting,roadmap=True):
         """
         Space_Dimension(int): dimension of the space operating in. Enter 2 for 2D and 3 for 3D. Only quadrotor in ROS is supported for 3D now.(default=2)
         planner(string): Planner to be used. Enter RRT,KPIECE1 or PRM, RRTConnect. (default='PRM')
         robot_type (int): Which robot is used for execution. BasicSim is 1, ODE is 2, ROS is 3, Nao is 4, Pioneer is 5(default=1)
         Geometric_Control(string): Specify if you want to planner to sample in geometric or control space. G for geometric and C for control. (default='G')
         plotting (bool): Check the box to enable plotting (default=True)
+        roadmap (bool): In 2D, follow paths from a roadmap of the map stored next to the project (see src/etc/utils/build_roadmap.py), and only call the planner for transitions it can't get through (default=True)
         """
         
         #Parameters
@@ -71,6 +75,13 @@ class motionControlHandler:
         self.map                = {}                    # dictionary of polygons of different regions
         self.all                = Polygon.Polygon()     # polygon of the boundary
         self.OMPLpath           = None
+        self.waypoints          = None                  # points on the path being followed, one per row
+        self.validityChecker    = None                  # collision checker for the current and next regions
+        self.validityCheckers   = {}                    # (current region, next region) -> collision checker for the two regions
+        self.setups             = {}                    # (current region, next region) -> (SimpleSetup, planner)
+        self.reusePlannerData   = False                 # whether the planner can keep what it learned in the last query
+        self.plannerDataValid   = {}                    # (current region, next region) -> whether the setup's planner data can be reused
+        self.obstacleLayers     = None                  # obstacle heights and the free space above each of them, in 3D
         self.trans_matrix       = mat([[0,1],[-1,0]])   # transformation matrix for find the normal to the vector 
         
         # Get references to handlers we'll need to communicate with
@@ -136,11 +147,9 @@ class motionControlHandler:
         else:
             self.maxHeight = self.original_regions.getMaximumHeight()
            
-        self.map = {'polygon':{},'original_name':{},'height':{}}
-        for region in self.proj.rfi.regions:
-            self.map['polygon'][region.name] = self.createRegionPolygon(region)
-            for n in range(len(region.holeList)): # no of holes
-                self.map['polygon'][region.name] -= self.createRegionPolygon(region,n)
+        # lab-frame region polygons shared with other handlers
+        self.geometry = self.proj.getRegionGeometry()
+        self.map = {'polygon':self.geometry.getPolygonsByName(),'original_name':{},'height':{}}
         
         # map the names back to the old original names specified by the user  
         for rname, rlist in self.proj.regionMapping.iteritems(): 
@@ -167,8 +176,7 @@ class motionControlHandler:
         self.planner_dictionary['C']['KPIECE1'] = oc.KPIECE1
         
         # Generate the boundary polygon 
-        for regionName,regionPoly in self.map['polygon'].iteritems():
-            self.all += regionPoly
+        self.all = self.geometry.getBoundary()
         
         # Specify the size of the robot 
         # 1: basicSim; 2: ODE; 3: ROS  4: Nao; 5: Pioneer
@@ -201,6 +209,13 @@ class motionControlHandler:
         self.current_reg = None
         self.next_reg    = None
 
+        # Roadmap of the whole map for our radius (see __roadmap.py)
+        self.roadmap = None
+        if roadmap and self.Space_Dimension == 2 and self.proj.project_root is not None:
+            self.roadmap = roadmapHelper.loadRoadmap(self.proj, self.radius)
+            if self.roadmap is None:
+                print "No roadmap stored for this map; planning every transition"
+
     def gotoRegion(self, current_reg, next_reg, last=False):
         """
         If ``last`` is True, we will move to the center of the destination region.
@@ -254,63 +269,60 @@ class motionControlHandler:
             else:
                 self.nextRegionPoly    = self.map['polygon'][self.proj.rfi.regions[next_reg].name]
                 self.currentRegionPoly = self.map['polygon'][self.proj.rfi.regions[current_reg].name]
-                self.nextAndcurrentRegionPoly = self.nextRegionPoly+self.currentRegionPoly
-            #just to make sure a path can be generated
-            self.nextAndcurrentRegionPoly += Polygon.Shapes.Circle(self.radius*2,(pose[0],pose[1]))
+                self.nextAndcurrentRegionPoly = self.geometry.getUnion([current_reg, next_reg])
+
+            # The checker for the two regions is kept, and so is the planner data, unless we
+            # need some extra space around the robot to get started
+            if (current_reg, next_reg) not in self.validityCheckers:
+                self.validityCheckers[(current_reg, next_reg)] = RegionCollisionChecker(self.nextAndcurrentRegionPoly, self.radius)
+            self.validityChecker = self.validityCheckers[(current_reg, next_reg)]
+            self.reusePlannerData = self.validityChecker.diskInside((pose[0],pose[1]))
+            if not self.reusePlannerData:
+                #just to make sure a path can be generated
+                self.nextAndcurrentRegionPoly = self.nextAndcurrentRegionPoly + Polygon.Shapes.Circle(self.radius*2,(pose[0],pose[1]))
+                self.validityChecker = RegionCollisionChecker(self.nextAndcurrentRegionPoly, self.radius)
+
+            if self.Space_Dimension == 3:
+                self.obstacleLayers = self.getObstacleLayers(self.nextAndcurrentRegionPoly)
             
             if self.system_print == True:
                 print "next Region is " + str(self.proj.rfi.regions[next_reg].name)
                 print "Current Region is " + str(self.proj.rfi.regions[current_reg].name)
 
-            #set to zero velocity before tree is generated
-            self.drive_handler.setVelocity(0, 0)   
-            if last:
-                transFace = None
-            else:
-                # Determine the mid points on the faces connecting to the next region (one goal point will be picked among all the mid points later in buildTree)
-                transFace   = None
-                goalPoints   = [[],[]] # list of goal points (midpoints of transition faces)
-                face_normal = [[],[]] # normal of the trnasition faces
-                for i in range(len(self.proj.rfi.transitions[current_reg][next_reg])):
-                    pointArray_transface = [x for x in self.proj.rfi.transitions[current_reg][next_reg][i]]
-                    transFace = asarray(map(self.coordmap_map2lab,pointArray_transface))
-                    coord_x = (transFace[0,0] +transFace[1,0])/2    #mid-point coordinate x
-                    coord_y = (transFace[0,1] +transFace[1,1])/2    #mid-point coordinate y
-                    goalPoints = hstack((goalPoints,vstack((coord_x,coord_y))))
-                
-                    #find the normal vector to the face
-                    face          = transFace[0,:] - transFace[1,:]
-                    distance_face = norm(face)
-                    normal        = face/distance_face * self.trans_matrix
-                    face_normal   = hstack((face_normal,vstack((normal[0,0],normal[0,1]))))
-                
-                # move the goal points to the next region
-                q_gBundle = mat(goalPoints)
-                face_normal = mat(face_normal)    
-                for i in range(q_gBundle.shape[1]):           
-                    q_g = q_gBundle[:,i]+face_normal[:,i]*1.5*self.radius    ##original 2*self.radius
-                    if not self.nextRegionPoly.isInside(q_g[0],q_g[1]):
-                        q_g = q_gBundle[:,i]-face_normal[:,i]*1.5*self.radius    ##original 2*self.radius
-                    goalPoints[0,i] = q_g[0,0]
-                    goalPoints[1,i] = q_g[1,0]
-                    
-                
-                if transFace is None:
-                    print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.proj.rfi.regions[current_reg].name, self.proj.rfi.regions[next_reg].name)
+            self.waypoints = None
+            if self.roadmap is not None and not last:
+                self.waypoints = self.roadmap.findPath(current_reg, next_reg, pose,
+                        self.currentRegionPoly + Polygon.Shapes.Circle(self.radius*2,(pose[0],pose[1])))
+
+            if self.waypoints is None:
+                #set to zero velocity before tree is generated
+                self.drive_handler.setVelocity(0, 0)   
+                if last:
+                    transFace = None
+                else:
+                    # Determine the mid points on the faces connecting to the next region (one goal point will be picked among all the mid points later in buildTree)
+                    # and move them into the next region
+                    midpoints, normals = self.geometry.getTransitionFaces(current_reg, next_reg)
+                    goalPoints = (midpoints + normals*1.5*self.radius).T    ##original 2*self.radius
+                    transFace = midpoints if len(midpoints) > 0 else None
+
+                    if transFace is None:
+                        print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.proj.rfi.regions[current_reg].name, self.proj.rfi.regions[next_reg].name)
                     
-            self.OMPLpath = self.plan(goalPoints,self.proj.rfi.regions[current_reg].name,self.proj.rfi.regions[next_reg].name,0) 
+                self.OMPLpath = self.plan(goalPoints,self.proj.rfi.regions[current_reg].name,self.proj.rfi.regions[next_reg].name,0) 
+                self.waypoints = self.getWaypoints(self.OMPLpath)
             self.currentState = 1          
             
         # Run algorithm to find a velocity vector (global frame) to take the robot to the next region
         if self.Space_Dimension == 3:
-            self.Velocity = self.getVelocity([pose[0],pose[1],pose[3]], self.OMPLpath)
+            self.Velocity = self.getVelocity([pose[0],pose[1],pose[3]], self.waypoints)
         else:
-            self.Velocity = self.getVelocity([pose[0], pose[1]], self.OMPLpath)
+            self.Velocity = self.getVelocity([pose[0], pose[1]], self.waypoints)
         self.previous_next_reg = next_reg
         
         """
         # FOR ROBERT
-        self.Node = self.getNode([pose[0], pose[1]], self.OMPLpath)
+        self.Node = self.getNode([pose[0], pose[1]], self.waypoints)
         print "self.Node:" + str(self.Node) 
         self.drive_handler.setDestination(self.Node[0,0], self.Node[1,0], pose[2])
         """
@@ -330,67 +342,52 @@ class motionControlHandler:
 
         if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
             # Figure out what region we think we stumbled into
-            for r in self.proj.rfi.regions:
-                pointArray = [self.coordmap_map2lab(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    print "I think I'm in " + r.name
-                    print pose
-                    break
+            r = self.proj.rfi.regionContainingPoint(*self.coordmap_lab2map(pose[0:2]))
+            if r is not None:
+                print "I think I'm in " + self.proj.rfi.regions[r].name
+                print pose
             self.last_warning = time.time()
 
         #print "arrived:"+str(arrived)
         return arrived
             
-    def getVelocity(self,p, OMPLpath, last=False):
+    def getVelocity(self,p, waypoints, last=False):
         """
         This function calculates the velocity for the robot with RRT.
         The inputs are (given in order):
-            p        = the current x-y position of the robot
-            OMPLpath = path information of the planner
+            p         = the current position of the robot (x-y, or x-y-z in 3D)
+            waypoints = array of the points on the path, one per row (see getWaypoints())
             last = True, if the current region is the last region
                  = False, if the current region is NOT the last region
         """
 
-        pose     = mat(p).T
-        """
-        if self.system_print == True:
-            print (OMPLpath.getSolutionPath().getState(self.currentState))[0]   # x-coordinate of the current state  
-        """ 
-        if self.Space_Dimension == 3:    
-            dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY(),(OMPLpath.getSolutionPath().getState(self.currentState)).getZ()))- pose
-
-            if norm(dis_cur) < 1.5*self.radius:         # go to next point
-                if not (self.currentState+1) == OMPLpath.getSolutionPath().getStateCount():
-                    self.currentState = self.currentState + 1
-                    dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY(),(OMPLpath.getSolutionPath().getState(self.currentState)).getZ()))- pose
-            
-            Vel = zeros([3,1])
+        pose      = mat(p).T
+        dimension = len(p)
+
+        #dis_cur = distance between current position and the next point
+        dis_cur  = vstack(waypoints[self.currentState,0:dimension]) - pose
+
+        if norm(dis_cur) < 1.5*self.radius:         # go to next point
+            if not (self.currentState+1) == len(waypoints):
+                # head to the next node
+                self.currentState = self.currentState + 1
+                dis_cur  = vstack(waypoints[self.currentState,0:dimension]) - pose
+
+        Vel = zeros([dimension,1])
+        if dimension == 3:
             Vel[0:3,0] = dis_cur/norm(dis_cur)*0.3              #TUNE THE SPEED LATER
-            
         else:
-            dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY()))- pose[0:2]
-
-            if norm(dis_cur) < 1.5*self.radius:         # go to next point
-                if not (self.currentState+1) == OMPLpath.getSolutionPath().getStateCount():
-                    # head to the next node
-                    self.currentState = self.currentState + 1
-                    dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY()))- pose[0:2]
-            Vel = zeros([2,1])
             # set different speed for basicSim
             Vel[0:2,0] = dis_cur/norm(dis_cur)*0.5                    #TUNE THE SPEED LATER
         return Vel
     
-    def getNode(self,p, OMPLpath, last=False):
+    def getNode(self,p, waypoints, last=False):
         """
 
         This function return the heading node of the robot. (for 2D only now)
         The inputs are (given in order):
-            p        = the current x-y position of the robot
-
-            E        = edges of the tree  (2 x No. of nodes on the tree)
-            V        = points of the tree (2 x No. of vertices)
+            p         = the current x-y position of the robot
+            waypoints = array of the points on the path, one per row (see getWaypoints())
             last = True, if the current region is the last region
                  = False, if the current region is NOT the last region
 
@@ -399,30 +396,54 @@ class motionControlHandler:
         pose     = mat(p).T
         
         #dis_cur = distance between current position and the next point
-        dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY()))- pose[0:2]
+        dis_cur  = vstack(waypoints[self.currentState,0:2]) - pose[0:2]
         
         if norm(dis_cur) < 1.5*self.radius:         # go to next point
-            if not (self.currentState+1) == OMPLpath.getSolutionPath().getStateCount():
+            if not (self.currentState+1) == len(waypoints):
                 # head to the next node
                 self.currentState = self.currentState + 1
         
         Node = zeros([2,1])
-        Node[0,0] = (OMPLpath.getSolutionPath().getState(self.currentState)).getX()
-        Node[1,0] = (OMPLpath.getSolutionPath().getState(self.currentState)).getY()
+        Node[0,0] = waypoints[self.currentState,0]
+        Node[1,0] = waypoints[self.currentState,1]
         return Node 
+
+    def getWaypoints(self, ss):
+        """
+        Return the states on the solution path of ``ss`` as an array, with one row of x, y
+        (and z in 3D) per state, so we don't have to go back to OMPL while following it.
+        """
+
+        path = ss.getSolutionPath()
+        states = [path.getState(i) for i in range(path.getStateCount())]
+        if self.Space_Dimension == 3:
+            return array([(state.getX(), state.getY(), state.getZ()) for state in states])
+        return array([(state.getX(), state.getY()) for state in states])
+
+    def getObstacleLayers(self, regionPoly):
+        """
+        Return the heights of the obstacles, in ascending order, and for each of them the part
+        of ``regionPoly`` not covered by it or any higher obstacle (plus ``regionPoly`` itself,
+        last), so the free space above any height can be looked up in isStateValid().
+        """
+
+        obstacles = sorted((self.original_map['height'][name], name) for name in self.original_map['polygon']
+                           if self.original_map['isObstacle'][name] is True)
+
+        layers = [Polygon.Polygon(regionPoly)]
+        for height, name in reversed(obstacles):
+            layers.append(layers[-1] - self.original_map['polygon'][name])
+        layers.reverse()
+
+        return [height for height, name in obstacles], layers
                          
     
     def createRegionPolygon(self,region,hole = None):
         """
         This function takes in the region points and make it a Polygon.
         """
-        if hole == None:
-            pointArray = [x for x in region.getPoints()]
-        else:
-            pointArray = [x for x in region.getPoints(hole_id = hole)]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        regionPoints = [(pt[0],pt[1]) for pt in pointArray]
-        formedPolygon= Polygon.Polygon(regionPoints)
+        regionPoints = self.proj.coordTransform.map2lab(region.getPoints(hole_id = hole))
+        formedPolygon= Polygon.Polygon(regionPoints.tolist())
         return formedPolygon
                 
     def plotMap(self):
@@ -484,20 +505,14 @@ class motionControlHandler:
     # This function is needed, even when we can write a sampler like the one
     # above, because we need to check path segments for validity
     def isStateValid(self,state):
-        # Let's pretend that the validity check is computationally relatively
-        # expensive to emphasize the benefit of explicitly generating valid
-        # samples
-        sleep(.001)
         # Valid states satisfy the following constraints:
         # inside the current region and the next region   
         if self.Space_Dimension == 3:
 
-            region_considered = Polygon.Polygon(self.nextAndcurrentRegionPoly)
+            # leave out the obstacles at least as high as the bottom of the robot
             bottom = state.getZ()-self.height/2  # bottom of the robot
-            for i, name in enumerate(self.original_map['polygon']):
-                if self.original_map['isObstacle'][name] is True:
-                    if self.original_map['height'][name] >= bottom:
-                        region_considered -=self.original_map['polygon'][name]
+            heights, layers = self.obstacleLayers
+            region_considered = layers[bisect_left(heights, bottom)]
             
             state_polygon = PolyShapes.Circle(self.radius,(state.getX(),state.getY()))
             current_region = self.proj.rfi.regions[self.current_reg].name
@@ -511,7 +526,7 @@ class motionControlHandler:
             
             return region_considered.covers(state_polygon) and (state.getZ()+self.height/2) < height and (state.getZ()-self.height/2) > 0
         else: 
-            return self.nextAndcurrentRegionPoly.covers(PolyShapes.Circle(self.radius,(state.getX(),state.getY())))
+            return self.validityChecker.diskInside((state.getX(),state.getY()))
              
     
     # This function generates control space needed information
@@ -526,12 +541,17 @@ class motionControlHandler:
         state.setY( start.getY() + control[0] * duration * sin(start.getYaw()) )
         state.setYaw(start.getYaw() + control[1] * duration)
 
-    def plan(self,goalPoints,current_region,next_region,samplerIndex):
+    def getSetup(self, current_region, next_region):
         """
-        goal points: array that contains the coordinates of all the possible goal states
-        current_reg: name of the current region (p1 etc)
-        next_reg   : name of the next region (p1 etc)
+        Return the SimpleSetup and planner for going from ``current_region`` to ``next_region``
+        (both names), creating them the first time.  They are kept so that planners that build a
+        roadmap (PRM) can reuse it for later queries.
         """
+
+        key = (current_region, next_region)
+        if key in self.setups:
+            return self.setups[key]
+
         # construct the state space we are planning in
         if self.Space_Dimension == 2:
             space = ob.SE2StateSpace()
@@ -582,9 +602,56 @@ class motionControlHandler:
             ss = oc.SimpleSetup(cspace)
             # set state validity checking for this space
             ss.setStatePropagator(oc.StatePropagatorFn(self.propagate))
-        ss.setStateValidityChecker(ob.StateValidityCheckerFn(self.isStateValid)) 
+        ss.setStateValidityChecker(ob.StateValidityCheckerFn(self.isStateValid))
+
+        # set sampler (optional; the default is uniform sampling)
+        si = ss.getSpaceInformation()
         
+        # set planner
+        planner_prep = self.planner_dictionary[self.Geometric_Control][self.planner]
+        planner = planner_prep(si)
+        ss.setPlanner(planner)
         
+        if self.Geometric_Control == 'G':            
+            if not self.planner == 'PRM':
+                planner.setRange(self.radius*2)
+                if self.system_print is True:
+                    print "planner.getRange():" + str(planner.getRange())
+                #if not self.planner == 'RRTConnect':
+                #    planner.setGoalBias(0.5)
+            
+        else:
+            # (optionally) set propagation step size
+            si.setPropagationStepSize(1)  #actually is the duration in propagate
+            si.setMinMaxControlDuration(3,3) # is the no of steps taken with the same velocity and omega
+            if self.system_print is True:
+                print "radius: " +str(self.radius)
+                print "si.getPropagationStepSize():" + str(si.getPropagationStepSize())    
+            planner.setGoalBias(0.5)
+
+        self.setups[key] = (ss, planner)
+        return ss, planner
+
+    def plan(self,goalPoints,current_region,next_region,samplerIndex):
+        """
+        goal points: array that contains the coordinates of all the possible goal states
+        current_reg: name of the current region (p1 etc)
+        next_reg   : name of the next region (p1 etc)
+        """
+        ss, planner = self.getSetup(current_region, next_region)
+        space = ss.getStateSpace()
+
+        # Forget the last query, and everything else too unless the planner builds a roadmap it can
+        # reuse and the collision checking (see gotoRegion()) is the same as when it was built
+        key = (current_region, next_region)
+        if self.reusePlannerData and self.plannerDataValid.get(key) and self.Geometric_Control == 'G' and self.planner == 'PRM':
+            planner.clearQuery()
+        else:
+            planner.clear()
+        self.plannerDataValid[key] = self.reusePlannerData
+        ss.getProblemDefinition().clearSolutionPaths()
+        ss.clearStartStates()
+
         # create a start state
         start = ob.State(space)
         pose = self.pose_handler.getPose()  #x,y,w,(z if using ROS quadrotor)
@@ -638,30 +705,6 @@ class motionControlHandler:
         ss.setGoal(goalStates)
         ss.setStartState(start)
 
-        # set sampler (optional; the default is uniform sampling)
-        si = ss.getSpaceInformation()
-        
-        # set planner
-        planner_prep = self.planner_dictionary[self.Geometric_Control][self.planner]
-        planner = planner_prep(si)
-        ss.setPlanner(planner)
-        
-        if self.Geometric_Control == 'G':            
-            if not self.planner == 'PRM':
-                planner.setRange(self.radius*2)
-                if self.system_print is True:
-                    print "planner.getRange():" + str(planner.getRange())
-                #if not self.planner == 'RRTConnect':
-                #    planner.setGoalBias(0.5)
-            
-        else:
-            # (optionally) set propagation step size
-            si.setPropagationStepSize(1)  #actually is the duration in propagate
-            si.setMinMaxControlDuration(3,3) # is the no of steps taken with the same velocity and omega
-            if self.system_print is True:
-                print "radius: " +str(self.radius)
-                print "si.getPropagationStepSize():" + str(si.getPropagationStepSize())    
-            planner.setGoalBias(0.5)
         ss.setup()
         
 
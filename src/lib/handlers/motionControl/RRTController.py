@@ -24,6 +24,10 @@ from math import sqrt, fabs , pi
 import random
 import thread
 import threading
+import Queue
+from __collisionChecking import RegionCollisionChecker
+import __roadmap as roadmapHelper
+from collections import OrderedDict
 
 # importing matplotlib to show the path if possible
 try:
@@ -34,8 +38,11 @@ except:
     print "matplotlib is not imported. Plotting is disabled"
     import_matplotlib = False
 
+# Number of trees built ahead of time to keep around
+PLAN_CACHE_SIZE = 20
+
 class motionControlHandler:
-    def __init__(self, proj, shared_data,robot_type,max_angle_goal,max_angle_overlap,plotting):
+    def __init__(self, proj, shared_data,robot_type,max_angle_goal,max_angle_overlap,plotting,preplan=True,roadmap=True):
         """
         Rapidly-Exploring Random Trees alogorithm motion planning controller
 
@@ -43,6 +50,8 @@ class motionControlHandler:
         max_angle_goal (float): The biggest difference in angle between the new node and the goal point that is acceptable. If it is bigger than the max_angle, the new node will not be connected to the goal point. The value should be within 0 to 6.28 = 2*pi. Default set to 6.28 = 2*pi (default=6.28)
         max_angle_overlap (float): difference in angle allowed for two nodes overlapping each other. If you don't want any node overlapping with each other, put in 2*pi = 6.28. Default set to 1.57 = pi/2 (default=1.57)
         plotting (bool): Check the box to enable plotting. Uncheck to disable plotting (default=True)
+        preplan (bool): Build trees for the likely next transitions in the background, instead of stopping to build them at each region change. Not used when plotting (default=True)
+        roadmap (bool): Follow paths from a roadmap of the map stored next to the project, building and saving it in the background if there isn't one yet, and only build trees for transitions it can't get through (default=True)
         """
 
         self.system_print       = False       # for debugging. print on GUI ( a bunch of stuffs)
@@ -67,11 +76,19 @@ class motionControlHandler:
         self.Velocity           = None
         self.currentRegionPoly  = None
         self.nextRegionPoly     = None
+        self.geometry           = proj.getRegionGeometry()   # lab-frame region polygons shared with other handlers
         self.map                = {}
         self.all                = Polygon.Polygon()
         self.trans_matrix       = mat([[0,1],[-1,0]])   # transformation matrix for find the normal to the vector
         self.stuck_thres        = 20          # threshold for changing the range of sampling omega
 
+        #!!! CONTROL SPACE: generate a list of omega for random sampling
+        omegaLowerBound = -math.pi/20      # upper bound for the value of omega
+        omegaUpperBound = math.pi/20       # lower bound for the value of omega
+        omegaNoOfSteps  = 20
+        self.omega_range = linspace(omegaLowerBound,omegaUpperBound,omegaNoOfSteps)
+        self.omega_range_escape = linspace(omegaLowerBound*4,omegaUpperBound*4,omegaNoOfSteps*4)    # range used when stuck > stuck_thres
+
         # Information about the robot (default set to ODE)
         if robot_type not in [1,2,3,4,5]:
             robot_type = 1
@@ -142,15 +159,9 @@ class motionControlHandler:
         if self.system_print == True:
             print "The operate_system is "+ str(self.operate_system)
 
-        # Generate polygon for regions in the map
-        for region in self.proj.rfi.regions:
-            self.map[region.name] = self.createRegionPolygon(region)
-            for n in range(len(region.holeList)): # no of holes
-                self.map[region.name] -= self.createRegionPolygon(region,n)
-
-        # Generate the boundary polygon
-        for regionName,regionPoly in self.map.iteritems():
-            self.all += regionPoly
+        # Polygons for regions in the map, and the boundary polygon
+        self.map = self.geometry.getPolygonsByName()
+        self.all = self.geometry.getBoundary()
 
         # Start plotting if operating in Windows
         if self.operate_system == 2 and self.plotting ==True:
@@ -160,6 +171,27 @@ class motionControlHandler:
             self.scope = _Scope(self.ax,self)
             thread.start_new_thread(self.jplot,())
 
+        # Trees built ahead of time, keyed by (current region, next region) and the start cell
+        self.plans             = OrderedDict()
+        self.plans_lock        = threading.Lock()
+        self.plan_queue        = Queue.Queue()
+        self.plan_generation   = 0             # jobs queued before the latest scheduling are dropped
+        self.upcoming          = []            # transitions we might make soon, from the automaton
+        self.preplan           = preplan and not self.plotting
+        if self.preplan:
+            worker = threading.Thread(target=self.planWorker)
+            worker.daemon = True
+            worker.start()
+
+        # Roadmap of the whole map for our radius (see __roadmap.py)
+        self.roadmap           = None
+        if roadmap and self.proj.project_root is not None:
+            self.roadmap = roadmapHelper.loadRoadmap(self.proj, self.radius)
+            if self.roadmap is None:
+                worker = threading.Thread(target=self.roadmapWorker)
+                worker.daemon = True
+                worker.start()
+
     def gotoRegion(self, current_reg, next_reg, last=False):
         """
         If ``last`` is True, we will move to the center of the destination region.
@@ -192,52 +224,40 @@ class motionControlHandler:
                 print "next Region is " + str(self.proj.rfi.regions[next_reg].name)
                 print "Current Region is " + str(self.proj.rfi.regions[current_reg].name)
 
-            #set to zero velocity before tree is generated
-            self.drive_handler.setVelocity(0, 0)
-            if last:
-                transFace = None
+            plan = self.getRoadmapPlan(current_reg, next_reg, pose, last)
+            if plan is None and self.preplan:
+                plan = self.getPlan(current_reg, next_reg, pose)
+            if plan is not None:
+                # We already have a path from around here
+                self.RRT_V,self.RRT_E,self.E_current_column = plan
             else:
-                # Determine the mid points on the faces connecting to the next region (one goal point will be picked among all the mid points later in buildTree)
-                transFace   = None
-                q_gBundle   = [[],[]] # list of goal points (midpoints of transition faces)
-                face_normal = [[],[]] # normal of the trnasition faces
-                for i in range(len(self.proj.rfi.transitions[current_reg][next_reg])):
-                    pointArray_transface = [x for x in self.proj.rfi.transitions[current_reg][next_reg][i]]
-                    transFace = asarray(map(self.coordmap_map2lab,pointArray_transface))
-                    bundle_x = (transFace[0,0] +transFace[1,0])/2    #mid-point coordinate x
-                    bundle_y = (transFace[0,1] +transFace[1,1])/2    #mid-point coordinate y
-                    q_gBundle     = hstack((q_gBundle,vstack((bundle_x,bundle_y))))
-
-                    #find the normal vector to the face
-                    face          = transFace[0,:] - transFace[1,:]
-                    distance_face = norm(face)
-                    normal        = face/distance_face * self.trans_matrix
-                    face_normal   = hstack((face_normal,vstack((normal[0,0],normal[0,1]))))
-
-
-                if transFace is None:
-                    print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.proj.rfi.regions[current_reg].name, self.proj.rfi.regions[next_reg].name)
-
-            # Run algorithm to build the Rapid-Exploring Random Trees
-            self.RRT_V = None
-            self.RRT_E = None
-
-            # For plotting
-            if self.operate_system == 2:
-                if self.plotting == True:
-                    self.ax.cla()
+                #set to zero velocity before tree is generated
+                self.drive_handler.setVelocity(0, 0)
+                q_gBundle, face_normal = self.getTransitionGoals(current_reg, next_reg, last)
+
+                # Run algorithm to build the Rapid-Exploring Random Trees
+                self.RRT_V = None
+                self.RRT_E = None
+
+                # For plotting
+                if self.operate_system == 2:
+                    if self.plotting == True:
+                        self.ax.cla()
+                    else:
+                        self.ax = None
                 else:
                     self.ax = None
-            else:
-                self.ax = None
 
-            if self.operate_system == 1 and self.plotting == True:
-                plt.cla()
-                self.plotMap(self.map)
-                plt.plot(pose[0],pose[1],'ko')
+                if self.operate_system == 1 and self.plotting == True:
+                    plt.cla()
+                    self.plotMap(self.map)
+                    plt.plot(pose[0],pose[1],'ko')
+
+                self.RRT_V,self.RRT_E,self.E_current_column = self.buildTree(\
+                [pose[0], pose[1]],pose[2],self.currentRegionPoly, self.nextRegionPoly,q_gBundle,face_normal)
 
-            self.RRT_V,self.RRT_E,self.E_current_column = self.buildTree(\
-            [pose[0], pose[1]],pose[2],self.currentRegionPoly, self.nextRegionPoly,q_gBundle,face_normal)
+            # Get started on the trees for where we might go from the next region
+            self.schedulePlanning(next_reg)
 
             """
             # map the lab coordinates back to pixels
@@ -264,31 +284,161 @@ class motionControlHandler:
 
         if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
             # Figure out what region we think we stumbled into
-            for r in self.proj.rfi.regions:
-                pointArray = [self.coordmap_map2lab(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    print "I think I'm in " + r.name
-                    print pose
-                    break
+            r = self.proj.rfi.regionContainingPoint(*self.coordmap_lab2map(pose[0:2]))
+            if r is not None:
+                print "I think I'm in " + self.proj.rfi.regions[r].name
+                print pose
             self.last_warning = time.time()
 
         #print "arrived:"+str(arrived)
         return arrived
 
-    def createRegionPolygon(self,region,hole = None):
+    def getTransitionGoals(self, current_reg, next_reg, last=False):
         """
-        This function takes in the region points and make it a Polygon.
+        Determine the mid points on the faces connecting to the next region (one goal point will be
+        picked among all the mid points later in buildTree), and the normals of those faces.
+        Returns ``(q_gBundle, face_normal)``, or ``(None, None)`` if ``last`` is True.
         """
-        if hole == None:
-            pointArray = [x for x in region.getPoints()]
-        else:
-            pointArray = [x for x in region.getPoints(hole_id = hole)]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        regionPoints = [(pt[0],pt[1]) for pt in pointArray]
-        formedPolygon= Polygon.Polygon(regionPoints)
-        return formedPolygon
+
+        if last:
+            return None, None
+
+        q_gBundle, face_normal = self.geometry.getTransitionFaces(current_reg, next_reg)
+
+        if len(q_gBundle) == 0:
+            print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.proj.rfi.regions[current_reg].name, self.proj.rfi.regions[next_reg].name)
+
+        return q_gBundle.T, face_normal.T
+
+    def _anticipateTransitions(self, transitions):
+        """
+        Called by the automaton with a list of ``(current region, next region)`` transitions
+        that we might make soon, so that their trees can be built in the background.
+        """
+
+        self.upcoming = list(transitions)
+        if self.previous_next_reg is not None:
+            self.schedulePlanning(self.previous_next_reg)
+
+    def startCell(self, p):
+        """
+        Return the cell of the grid (with a spacing of one robot diameter) that the x-y position ``p`` falls in.
+        """
+
+        return (int(math.floor(p[0]/(2*self.radius))), int(math.floor(p[1]/(2*self.radius))))
+
+    def getPlan(self, current_reg, next_reg, pose):
+        """
+        Return a tree built ahead of time for going from ``current_reg`` to ``next_reg``
+        that we can join from ``pose``, or None if there isn't one.
+        """
+
+        cell_x, cell_y = self.startCell(pose)
+        with self.plans_lock:
+            plans = [self.plans[key] for key in ((current_reg, next_reg, cell_x+i, cell_y+j) for i in (-1,0,1) for j in (-1,0,1))
+                     if key in self.plans]
+
+        if not plans:
+            return None
+
+        # Make sure we can drive straight from here to the first point on the tree
+        checker = RegionCollisionChecker(self.currentRegionPoly + PolyShapes.Circle(self.radius*2.5,(pose[0],pose[1])), self.radius)
+        headings = [(V[1,E[1,column]],V[2,E[1,column]]) for V, E, column in plans]
+        joinable = checker.segmentsInside([(pose[0],pose[1])]*len(plans), headings)
+        for plan, ok in zip(plans, joinable):
+            if ok:
+                return plan
+
+        return None
+
+    def schedulePlanning(self, next_reg):
+        """
+        Queue up trees for the upcoming transitions out of ``next_reg``, starting from the end of
+        the tree we are following into it.  Anything queued before is dropped.
+        """
+
+        if not self.preplan or self.RRT_V is None:
+            return
+
+        # Where and in which direction we expect to enter the next region
+        V = self.RRT_V
+        start = [V[1,-1], V[2,-1]]
+        theta = math.atan2(V[2,-1]-V[2,-2], V[1,-1]-V[1,-2])
+
+        self.plan_generation += 1
+        for current_reg, to_reg in self.upcoming:
+            if current_reg != next_reg:
+                continue
+
+            if self.roadmap is not None and (current_reg, to_reg) in self.roadmap.gates:
+                continue
+
+            key = (current_reg, to_reg) + self.startCell(start)
+            with self.plans_lock:
+                if key in self.plans:
+                    continue
+
+            q_gBundle, face_normal = self.getTransitionGoals(current_reg, to_reg)
+            regionPoly     = self.map[self.proj.rfi.regions[current_reg].name]
+            nextRegionPoly = self.map[self.proj.rfi.regions[to_reg].name]
+            self.plan_queue.put((self.plan_generation, key, (start, theta, regionPoly, nextRegionPoly, q_gBundle, face_normal)))
+
+    def planWorker(self):
+        """
+        Build the trees queued by schedulePlanning(), one at a time, and keep the
+        most recent PLAN_CACHE_SIZE of them.
+        """
+
+        while True:
+            generation, key, args = self.plan_queue.get()
+            if generation != self.plan_generation:
+                continue
+            with self.plans_lock:
+                if key in self.plans:
+                    continue
+
+            try:
+                plan = self.buildTree(*args)
+            except Exception, e:
+                print "WARNING: Could not plan ahead from %s to %s (%s)" % (self.proj.rfi.regions[key[0]].name, self.proj.rfi.regions[key[1]].name, e)
+                continue
+
+            with self.plans_lock:
+                self.plans[key] = plan
+                while len(self.plans) > PLAN_CACHE_SIZE:
+                    self.plans.popitem(last=False)
+
+    def getRoadmapPlan(self, current_reg, next_reg, pose, last=False):
+        """
+        Return a path from the roadmap for going from ``current_reg`` to ``next_reg`` starting
+        at ``pose``, in the same form as the trees from buildTree(), or None if there isn't one.
+        """
+
+        if self.roadmap is None or last:
+            return None
+
+        regionPoly = self.currentRegionPoly + PolyShapes.Circle(self.radius*2.5,(pose[0],pose[1]))
+        waypoints = self.roadmap.findPath(current_reg, next_reg, pose, regionPoly)
+        if waypoints is None:
+            return None
+
+        V = vstack((arange(len(waypoints)), waypoints.T))
+        E = array([arange(len(waypoints)-1), arange(1, len(waypoints))], dtype=int)
+        return V, E, 0
+
+    def roadmapWorker(self):
+        """
+        Build the roadmap for our radius and save it for later runs.
+        """
+
+        try:
+            roadmap = roadmapHelper.buildRoadmap(self.geometry, self.radius)
+            roadmapHelper.saveRoadmap(self.proj, roadmap)
+        except Exception, e:
+            print "WARNING: Could not build the roadmap (%s)" % e
+            return
+
+        self.roadmap = roadmap
 
     def getVelocity(self,p, V, E, last=False):
         """
@@ -363,23 +513,26 @@ class motionControlHandler:
         """
 
         q_init          = mat(p).T
-        V               = vstack((0,q_init))
         theta           = self.orientation_bound(theta)
-        V_theta         = array([theta])
-
-        #!!! CONTROL SPACE: generate a list of omega for random sampling
-        omegaLowerBound = -math.pi/20      # upper bound for the value of omega
-        omegaUpperBound = math.pi/20       # lower bound for the value of omega
-        omegaNoOfSteps  = 20
-        self.omega_range = linspace(omegaLowerBound,omegaUpperBound,omegaNoOfSteps)
-        self.omega_range_escape = linspace(omegaLowerBound*4,omegaUpperBound*4,omegaNoOfSteps*4)    # range used when stuck > stuck_thres
+        tree            = _Tree(q_init[0,0], q_init[1,0], theta, 2*self.radius)
 
         regionPolyOld = Polygon.Polygon(regionPoly)
         regionPoly += PolyShapes.Circle(self.radius*2.5,(q_init[0,0],q_init[1,0]))
+        checker = RegionCollisionChecker(regionPoly, self.radius)
+
+        # pushing possible q_goals into the current region (ensure path is covered by the current region polygon)
+        q_gBundle = mat(q_gBundle)
+        face_normal = mat(face_normal)
+        q_goals = []
+        for i in range(q_gBundle.shape[1]):
+            q_g = q_gBundle[:,i]+face_normal[:,i]*1.5*self.radius    ##original 2*self.radius
+            #q_g = q_gBundle[:,i]+(q_gBundle[:,i]-q_latest)/norm(q_gBundle[:,i]-q_latest)*1.5*self.radius    ##original 2*self.radius
+            if not regionPolyOld.isInside(q_g[0],q_g[1]):
+                #q_g = q_gBundle[:,i]-(q_gBundle[:,i]-q_latest)/norm(q_gBundle[:,i]-q_latest)*1.5*self.radius    ##original 2*self.radius
+                q_g = q_gBundle[:,i]-face_normal[:,i]*1.5*self.radius    ##original 2*self.radius
+            q_goals.append(q_g)
 
         # check faces of the current region for goal points
-        E     = [[],[]]       # the tree matrix
-        Other = [[],[]]
         path                        = False          # if path formed then = 1
         stuck                       = 0              # count for changing the range of sampling omega
         append_after_latest_node    = False       # append new nodes to the latest node
@@ -399,46 +552,43 @@ class motionControlHandler:
             if self.system_print == True:
                 print "Try Connection to the goal points"
 
-            # pushing possible q_goals into the current region (ensure path is covered by the current region polygon)
             q_pass = [[],[],[]]
             q_pass_dist = []
-            q_gBundle = mat(q_gBundle)
-            face_normal = mat(face_normal)
 
-            while i < q_gBundle.shape[1]:
-                q_g_original = q_gBundle[:,i]
-                q_g = q_gBundle[:,i]+face_normal[:,i]*1.5*self.radius    ##original 2*self.radius
-                #q_g = q_gBundle[:,i]+(q_gBundle[:,i]-V[1:,(shape(V)[1]-1)])/norm(q_gBundle[:,i]-V[1:,(shape(V)[1]-1)])*1.5*self.radius    ##original 2*self.radius
-                if not regionPolyOld.isInside(q_g[0],q_g[1]):
-                    #q_g = q_gBundle[:,i]-(q_gBundle[:,i]-V[1:,(shape(V)[1]-1)])/norm(q_gBundle[:,i]-V[1:,(shape(V)[1]-1)])*1.5*self.radius    ##original 2*self.radius
-                    q_g = q_gBundle[:,i]-face_normal[:,i]*1.5*self.radius    ##original 2*self.radius
+            # the latest node on the tree
+            latest   = tree.count-1
+            x_latest, y_latest = tree.xy[latest]
+            q_latest = mat([[x_latest],[y_latest]])
 
-                #forming polygon for path checking
-                EdgePolyGoal = PolyShapes.Circle(self.radius,(q_g[0,0],q_g[1,0])) + PolyShapes.Circle(self.radius,(V[1,shape(V)[1]-1],V[2:,shape(V)[1]-1]))
-                EdgePolyGoal = PolyUtils.convexHull(EdgePolyGoal)
-                dist = norm(q_g - V[1:,shape(V)[1]-1])
+            #check coverage of path from the latest node to each goal
+            connect_goals = checker.segmentsInside([(x_latest,y_latest)]*len(q_goals), [(q_g[0,0],q_g[1,0]) for q_g in q_goals])
+
+            while i < len(q_goals):
+                q_g_original = q_gBundle[:,i]
+                q_g = q_goals[i]
+                dist = norm(q_g - q_latest)
 
                 #check connection to goal
-                connect_goal = regionPoly.covers(EdgePolyGoal)   #check coverage of path from new point to goal
+                connect_goal = connect_goals[i]
 
                 # compare orientation difference
-                thetaPrev = V_theta[shape(V)[1]-1]
+                thetaPrev = tree.theta[latest]
 
-                theta_orientation = abs(arctan((q_g[1,0]- V[2,shape(V)[1]-1])/(q_g[0,0]- V[1,shape(V)[1]-1])))
-                if q_g[1,0] > V[2,shape(V)[1]-1]:
-                    if q_g[0,0] < V[1,shape(V)[1]-1]: # second quadrant
+                theta_orientation = abs(arctan((q_g[1,0]- y_latest)/(q_g[0,0]- x_latest)))
+                if q_g[1,0] > y_latest:
+                    if q_g[0,0] < x_latest: # second quadrant
                         theta_orientation = pi - theta_orientation
-                    elif q_g[0,0] > V[1,shape(V)[1]-1]: # first quadrant
+                    elif q_g[0,0] > x_latest: # first quadrant
                         theta_orientation = theta_orientation
-                elif q_g[1,0] < V[2,shape(V)[1]-1]:
-                    if q_g[0,0] < V[1,shape(V)[1]-1]: #third quadrant
+                elif q_g[1,0] < y_latest:
+                    if q_g[0,0] < x_latest: #third quadrant
                         theta_orientation = pi + theta_orientation
-                    elif q_g[0,0] > V[1,shape(V)[1]-1]: # foruth quadrant
+                    elif q_g[0,0] > x_latest: # foruth quadrant
                         theta_orientation =  2*pi - theta_orientation
 
                 # check the angle between vector(new goal to goal_original ) and vector( latest node to new goal)
                 Goal_to_GoalOriginal = q_g_original - q_g
-                LatestNode_to_Goal   = q_g - V[1:,shape(V)[1]-1]
+                LatestNode_to_Goal   = q_g - q_latest
                 Angle_Goal_LatestNode= arccos(vdot(array(Goal_to_GoalOriginal), array(LatestNode_to_Goal))/norm(Goal_to_GoalOriginal)/norm(LatestNode_to_Goal))
 
                 # if connection to goal can be established and the max change in orientation of the robot is smaller than max_angle, tree is said to be completed.
@@ -463,8 +613,6 @@ class motionControlHandler:
             if self.system_print == True:
                 print "checked goal points"
 
-            self.E = E
-            self.V = V
             # connection to goal has established
             # Obtain the closest goal point that path can be formed.
             if path:
@@ -474,86 +622,80 @@ class motionControlHandler:
                     (cols,) = nonzero(q_pass_dist == min(q_pass_dist))
                     cols = asarray(cols)[0]
                 q_g = q_pass[1:,cols]
+                goal_face = int(q_pass[0,cols])
                 """
-                q_g = q_g-(q_gBundle[:,q_pass[0,cols]]-V[1:,(shape(V)[1]-1)])/norm(q_gBundle[:,q_pass[0,cols]]-V[1:,(shape(V)[1]-1)])*3*self.radius   #org 3
+                q_g = q_g-(q_gBundle[:,goal_face]-q_latest)/norm(q_gBundle[:,goal_face]-q_latest)*3*self.radius   #org 3
                 if not nextRegionPoly.isInside(q_g[0],q_g[1]):
-                    q_g = q_g+(q_gBundle[:,q_pass[0,cols]]-V[1:,(shape(V)[1]-1)])/norm(q_gBundle[:,q_pass[0,cols]]-V[1:,(shape(V)[1]-1)])*6*self.radius   #org 3
+                    q_g = q_g+(q_gBundle[:,goal_face]-q_latest)/norm(q_gBundle[:,goal_face]-q_latest)*6*self.radius   #org 3
                 """
                 if self.plotting == True :
+                    x_parent, y_parent = tree.xy[max(tree.parent[latest], 0)]
                     if self.operate_system == 1:
                         plt.suptitle('Rapidly-exploring Random Tree', fontsize=12)
                         plt.xlabel('x')
                         plt.ylabel('y')
-                        if shape(V)[1] <= 2:
-                            plt.plot(( V[1,shape(V)[1]-1],q_g[0,0]),( V[2,shape(V)[1]-1],q_g[1,0]),'b')
+                        if tree.count <= 2:
+                            plt.plot(( x_latest,q_g[0,0]),( y_latest,q_g[1,0]),'b')
                         else:
-                            plt.plot(( V[1,E[0,shape(E)[1]-1]], V[1,shape(V)[1]-1],q_g[0,0]),( V[2,E[0,shape(E)[1]-1]], V[2,shape(V)[1]-1],q_g[1,0]),'b')
+                            plt.plot(( x_parent, x_latest,q_g[0,0]),( y_parent, y_latest,q_g[1,0]),'b')
                         plt.plot(q_g[0,0],q_g[1,0],'ko')
                         plt.figure(1).canvas.draw()
                     else:
                         BoundPolyPoints = asarray(PolyUtils.pointList(regionPoly))
                         self.ax.plot(BoundPolyPoints[:,0],BoundPolyPoints[:,1],'k')
-                        if shape(V)[1] <= 2:
-                            self.ax.plot(( V[1,shape(V)[1]-1],q_g[0,0]),( V[2,shape(V)[1]-1],q_g[1,0]),'b')
+                        if tree.count <= 2:
+                            self.ax.plot(( x_latest,q_g[0,0]),( y_latest,q_g[1,0]),'b')
                         else:
-                            self.ax.plot(( V[1,E[0,shape(E)[1]-1]], V[1,shape(V)[1]-1],q_g[0,0]),( V[2,E[0,shape(E)[1]-1]], V[2,shape(V)[1]-1],q_g[1,0]),'b')
+                            self.ax.plot(( x_parent, x_latest,q_g[0,0]),( y_parent, y_latest,q_g[1,0]),'b')
                         self.ax.plot(q_g[0,0],q_g[1,0],'ko')
 
                 # trim the path connecting current node to goal point into pieces if the path is too long now
-                numOfPoint = floor(norm(V[1:,shape(V)[1]-1]- q_g)/self.step_size)
+                numOfPoint = int(floor(norm(q_latest - q_g)/self.step_size))
                 if numOfPoint < 3:
                     numOfPoint = 3
-                x = linspace( V[1,shape(V)[1]-1], q_g[0,0], numOfPoint )
-                y = linspace( V[2,shape(V)[1]-1], q_g[1,0], numOfPoint )
+                x = linspace( x_latest, q_g[0,0], numOfPoint )
+                y = linspace( y_latest, q_g[1,0], numOfPoint )
+                theta_goal = math.atan2(q_g[1,0]-y_latest, q_g[0,0]-x_latest)
                 for i in range(x.shape[0]):
                     if i != 0:
-                        V = hstack((V,vstack((shape(V)[1],x[i],y[i]))))
-                        E = hstack((E,vstack((shape(V)[1]-2,shape(V)[1]-1))))
+                        tree.add(x[i], y[i], theta_goal, tree.count-1)
 
                 #push the goal point to the next region
-                q_g = q_g+face_normal[:,q_pass[0,cols]]*3*self.radius    ##original 2*self.radius
+                q_g = q_g+face_normal[:,goal_face]*3*self.radius    ##original 2*self.radius
                 if not nextRegionPoly.isInside(q_g[0],q_g[1]):
-                    q_g = q_g-face_normal[:,q_pass[0,cols]]*6*self.radius    ##original 2*self.radius
-                V = hstack((V,vstack((shape(V)[1],q_g[0,0],q_g[1,0]))))
-                E = hstack((E,vstack((shape(V)[1]-2 ,shape(V)[1]-1))))
+                    q_g = q_g-face_normal[:,goal_face]*6*self.radius    ##original 2*self.radius
+                tree.add(q_g[0,0], q_g[1,0], theta_goal, tree.count-1)
 
                 if self.plotting == True :
                     if self.operate_system == 1:
                         plt.plot(q_g[0,0],q_g[1,0],'ko')
-                        plt.plot(( V[1,shape(V)[1]-1],V[1,shape(V)[1]-2]),( V[2,shape(V)[1]-1],V[2,shape(V)[1]-2]),'b')
+                        plt.plot(( tree.xy[tree.count-1,0],tree.xy[tree.count-2,0]),( tree.xy[tree.count-1,1],tree.xy[tree.count-2,1]),'b')
                         plt.figure(1).canvas.draw()
                     else:
                         self.ax.plot(q_g[0,0],q_g[1,0],'ko')
-                        self.ax.plot(( V[1,shape(V)[1]-1],V[1,shape(V)[1]-2]),( V[2,shape(V)[1]-1],V[2,shape(V)[1]-2]),'b')
+                        self.ax.plot(( tree.xy[tree.count-1,0],tree.xy[tree.count-2,0]),( tree.xy[tree.count-1,1],tree.xy[tree.count-2,1]),'b')
 
             # path is not formed, try to append points onto the tree
             if not path:
 
                 # connection_to_tree : connection to the tree is successful
                 if append_after_latest_node:
-                    V,V_theta,E,Other,stuck,append_after_latest_node, connection_to_tree = self.generateNewNode(V,V_theta,E,Other,regionPoly,stuck, append_after_latest_node)
+                    stuck,append_after_latest_node, connection_to_tree = self.generateNewNode(tree,checker,stuck, append_after_latest_node)
                 else:
                     connection_to_tree = False
                     while not connection_to_tree:
-                        V,V_theta,E,Other,stuck,append_after_latest_node, connection_to_tree = self.generateNewNode  (V,V_theta,E,Other,regionPoly,stuck)
+                        stuck,append_after_latest_node, connection_to_tree = self.generateNewNode(tree,checker,stuck)
 
+        V = tree.vertices()
 
         if self.finish_print:
+            E = vstack((tree.parent[1:tree.count], arange(1, tree.count)))
             print 'Here is the V matrix:', V, 'Here is the E matrix:',E
             print >>sys.__stdout__, 'Here is the V matrix:\n', V, '\nHere is the E matrix:\n',E
 
-        #B: trim to a single path
-        single = 0
-        while single == 0:
-            trim  = 0
-            for j in range(shape(V)[1]-3):
-                (row,col) = nonzero(E == j+1)
-                if len(col) == 1:
-                    E = delete(E, col[0], 1)
-                    trim = 1
-
-            if trim == 0:
-                single = 1;
+        #B: trim to a single path, by following the parents back from the goal
+        nodes = tree.path(tree.count-1)
+        E = array([nodes[:-1], nodes[1:]], dtype=int)
 
         ####print with matlib
         if self.plotting ==True :
@@ -572,18 +714,14 @@ class motionControlHandler:
                     self.ax.text(V[1,E[1,i]],V[2,E[1,i]], V[0,E[1,i]], fontsize=12)
 
         #return V, E, and the current node number on the tree
-        V = array(V)
         return V, E, 0
 
 
-    def generateNewNode(self,V,V_theta,E,Other,regionPoly,stuck,append_after_latest_node =False):
+    def generateNewNode(self,tree,checker,stuck,append_after_latest_node =False):
         """
-        Generate a new node on the current tree matrix
-        V         : the node matrix
-        V_theta   : the orientation matrix
-        E         : the tree matrix (or edge matrix)
-        Other     : the matrix containing the velocity and angular velocity(omega) information
-        regionPoly: the polygon of current region
+        Generate a new node on the tree
+        tree      : the tree built so far (a _Tree)
+        checker   : a RegionCollisionChecker for the current region
         stuck     : count on the number of times failed to generate new node
         append_after_latest_node : append new nodes to the latest node (True only if the previous node addition is successful)
         """
@@ -604,34 +742,33 @@ class motionControlHandler:
 
         #!!!! CONTROL SPACE STEP 2 - pick a random point on the tree
         if append_after_latest_node:
-            tree_index = shape(V)[1]-1
+            tree_index = tree.count-1
         else:
             if random.choice([1,2]) == 1:
-                tree_index = random.choice(array(V[0])[0])
+                tree_index = random.randrange(tree.count)
             else:
-                tree_index = shape(V)[1]-1
+                tree_index = tree.count-1
 
 
-        xPrev     = V[1,tree_index]
-        yPrev     = V[2,tree_index]
-        thetaPrev = V_theta[tree_index]
+        xPrev, yPrev = tree.xy[tree_index]
+        thetaPrev    = tree.theta[tree_index]
 
         j = 1
         #!!!! CONTROL SPACE STEP 3 - Check path of the robot
-        path_robot = PolyShapes.Circle(self.radius,(xPrev,yPrev))
+        path_robot = [(xPrev,yPrev)]
         while j <= self.timeStep:
             xOrg      = xPrev
             yOrg      = yPrev
             xPrev     = xPrev + self.velocity/omega*(sin(omega* 1 + thetaPrev)-sin(thetaPrev))
             yPrev     = yPrev - self.velocity/omega*(cos(omega* 1 + thetaPrev)-cos(thetaPrev))
             thetaPrev = omega* 1 + thetaPrev
-            path_robot = path_robot + PolyShapes.Circle(self.radius,(xPrev,yPrev))
+            path_robot.append((xPrev,yPrev))
 
             j = j + 1
 
         thetaPrev = self.orientation_bound(thetaPrev)
-        path_all = PolyUtils.convexHull(path_robot)
-        in_bound = regionPoly.covers(path_all)
+        # the robot drives straight between the nodes once the tree is built, so check that as well as the arc
+        in_bound = checker.segmentsInside(path_robot[:-1] + path_robot[:1], path_robot[1:] + path_robot[-1:]).all()
         """
         # plotting
         if plotting == True:
@@ -641,14 +778,10 @@ class motionControlHandler:
         stuck = stuck + 1
 
         if in_bound:
-            robot_new_node = PolyShapes.Circle(self.radius,(xPrev,yPrev))
-            # check how many nodes on the tree does the new node overlaps with
-            nodes_overlap_count = 0
-            for k in range(shape(V)[1]-1):
-                robot_old_node = PolyShapes.Circle(self.radius,(V[1,k],V[2,k]))
-                if robot_new_node.overlaps(robot_old_node):
-                    if  abs(thetaPrev - V_theta[k]) <   self.max_angle_overlap:
-                        nodes_overlap_count += 1
+            # check how many nodes on the tree (other than the latest one) the new node overlaps with
+            nearby = tree.near(xPrev, yPrev, 2*self.radius)
+            nearby = nearby[nearby != tree.count-1]
+            nodes_overlap_count = count_nonzero(abs(thetaPrev - tree.theta[nearby]) < self.max_angle_overlap)
 
 
             if nodes_overlap_count == 0 or (stuck > self.stuck_thres+1 and nodes_overlap_count < 2) or (stuck > self.stuck_thres+500):
@@ -660,16 +793,15 @@ class motionControlHandler:
                 stuck = stuck - 20
                 # plotting
                 if self.plotting == True:
-                    self.plotPoly(path_all,'b',1)
+                    path_all = Polygon.Polygon()
+                    for pt in path_robot:
+                        path_all += PolyShapes.Circle(self.radius,pt)
+                    self.plotPoly(PolyUtils.convexHull(path_all),'b',1)
 
                 if self.system_print == True:
                     print "node connected"
 
-                V = hstack((V,vstack((shape(V)[1],xPrev,yPrev))))
-                V_theta = hstack((V_theta,thetaPrev))
-                E = hstack((E,vstack((tree_index ,shape(V)[1]-1))))
-                Other = hstack((Other,vstack((self.velocity,omega))))
-                ##################### E should add omega and velocity
+                tree.add(xPrev, yPrev, thetaPrev, tree_index, self.velocity, omega)
                 connection_to_tree = True
                 append_after_latest_node  = True
             else:
@@ -681,7 +813,7 @@ class motionControlHandler:
         else:
             append_after_latest_node = False
 
-        return  V,V_theta,E,Other,stuck,append_after_latest_node, connection_to_tree
+        return  stuck,append_after_latest_node, connection_to_tree
 
 
     def orientation_bound(self,theta):
@@ -765,6 +897,79 @@ class motionControlHandler:
         ani = animation.FuncAnimation(self.fig, self.scope.update, self.data_gen)
         plt.show()
 
+class _Tree:
+    """
+    The nodes of a tree grown by buildTree(), kept in arrays that double in size when they
+    fill up, along with a grid of buckets (``cell_size`` wide) for finding the nodes near a point.
+    """
+
+    def __init__(self, x, y, theta, cell_size, capacity=256):
+        self.xy        = empty((capacity, 2))
+        self.theta     = empty(capacity)
+        self.parent    = empty(capacity, dtype=int)
+        self.other     = empty((capacity, 2))       # velocity and angular velocity (omega) used to reach each node
+        self.count     = 0
+        self.cell_size = float(cell_size)
+        self.grid      = {}
+
+        self.add(x, y, theta, -1)
+
+    def cell(self, x, y):
+        return (int(math.floor(x/self.cell_size)), int(math.floor(y/self.cell_size)))
+
+    def add(self, x, y, theta, parent, velocity=0, omega=0):
+        """
+        Add a node reached from node ``parent``, and return its index.
+        """
+
+        if self.count == len(self.theta):
+            for name in ('xy', 'theta', 'parent', 'other'):
+                old = getattr(self, name)
+                new = empty((2*old.shape[0],) + old.shape[1:], dtype=old.dtype)
+                new[:self.count] = old
+                setattr(self, name, new)
+
+        n = self.count
+        self.xy[n]     = (x, y)
+        self.theta[n]  = theta
+        self.parent[n] = parent
+        self.other[n]  = (velocity, omega)
+        self.grid.setdefault(self.cell(x, y), []).append(n)
+        self.count += 1
+
+        return n
+
+    def near(self, x, y, distance):
+        """
+        Return an array of the indices of the nodes closer than ``distance`` to (x, y).
+        """
+
+        reach = int(math.ceil(distance/self.cell_size))
+        cell_x, cell_y = self.cell(x, y)
+        candidates = array([n for i in range(cell_x-reach, cell_x+reach+1)
+                              for j in range(cell_y-reach, cell_y+reach+1)
+                              for n in self.grid.get((i, j), ())], dtype=int)
+        offsets = self.xy[candidates] - (x, y)
+        return candidates[sum(offsets*offsets, axis=1) < distance**2]
+
+    def path(self, n):
+        """
+        Return the indices of the nodes on the way from the root to node ``n``.
+        """
+
+        nodes = []
+        while n >= 0:
+            nodes.append(n)
+            n = self.parent[n]
+        return nodes[::-1]
+
+    def vertices(self):
+        """
+        Return the nodes as a 3 x N array of (index, x, y), as used by getVelocity().
+        """
+
+        return vstack((arange(self.count), self.xy[:self.count].T))
+
 class _Scope:
     def __init__(self, ax, motion, maxt=2, dt=0.02):
         self.i = 0
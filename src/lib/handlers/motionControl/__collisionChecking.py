@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+=============================================================
+__collisionChecking.py - Disk Robot/Region Collision Checking
+=============================================================
+
+Checks whether a disk-shaped robot stays inside a region while moving along
+straight segments, for the sampling-based motion controllers.
+
+The robot stays inside as long as its center starts inside the region and
+never comes closer than its radius to any of the region's edges, so each
+check is a point-in-polygon test and a segment-to-segment distance test
+against the edges, done for a whole batch of segments at once.
+"""
+
+import numpy
+import Polygon
+from regions import polygonEdges, pointsInPolygon
+
+# Maximum number of segment/edge pairs compared at once, to bound memory use
+SEGMENT_TEST_CHUNK_SIZE = 1 << 16
+
+def _cross(ax, ay, bx, by):
+    return ax*by - ay*bx
+
+def _pointSegmentDistances(px, py, x0, y0, x1, y1):
+    """ Distance from the points (px, py) to the segments (x0, y0)-(x1, y1), broadcasting """
+    dx = x1 - x0
+    dy = y1 - y0
+    length_sq = dx*dx + dy*dy
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t = ((px - x0)*dx + (py - y0)*dy)/length_sq
+    t = numpy.where(length_sq > 0, numpy.clip(t, 0, 1), 0)
+    return numpy.hypot(px - (x0 + t*dx), py - (y0 + t*dy))
+
+def segmentDistances(starts, ends, edges):
+    """
+    Return the shortest distance from each of the segments going from `starts` to
+    `ends` (both (M, 2) arrays) to any of the `edges` (a (4, N) array, as returned
+    by regions.polygonEdges()).  A segment can have the same start and end, to get
+    the distance from a point.
+    """
+
+    starts = numpy.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = numpy.asarray(ends, dtype=float).reshape(-1, 2)
+    distances = numpy.empty(len(starts))
+    distances.fill(numpy.inf)
+    if len(starts) == 0 or edges.shape[1] == 0:
+        return distances
+
+    qx0, qy0, qx1, qy1 = [e[numpy.newaxis, :] for e in edges]
+
+    step = max(1, SEGMENT_TEST_CHUNK_SIZE // edges.shape[1])
+    for start in xrange(0, len(starts), step):
+        px0 = starts[start:start+step, 0][:, numpy.newaxis]
+        py0 = starts[start:start+step, 1][:, numpy.newaxis]
+        px1 = ends[start:start+step, 0][:, numpy.newaxis]
+        py1 = ends[start:start+step, 1][:, numpy.newaxis]
+
+        # Distances between the endpoints of each segment and the other segment
+        d = numpy.minimum(numpy.minimum(_pointSegmentDistances(px0, py0, qx0, qy0, qx1, qy1),
+                                        _pointSegmentDistances(px1, py1, qx0, qy0, qx1, qy1)),
+                          numpy.minimum(_pointSegmentDistances(qx0, qy0, px0, py0, px1, py1),
+                                        _pointSegmentDistances(qx1, qy1, px0, py0, px1, py1)))
+
+        # ... unless they cross, in which case it's zero
+        d1 = _cross(qx1 - qx0, qy1 - qy0, px0 - qx0, py0 - qy0)
+        d2 = _cross(qx1 - qx0, qy1 - qy0, px1 - qx0, py1 - qy0)
+        d3 = _cross(px1 - px0, py1 - py0, qx0 - px0, qy0 - py0)
+        d4 = _cross(px1 - px0, py1 - py0, qx1 - px0, qy1 - py0)
+        d[(d1*d2 < 0) & (d3*d4 < 0)] = 0
+
+        distances[start:start+step] = d.min(axis=1)
+
+    return distances
+
+class RegionCollisionChecker(object):
+    """
+    Collision checker for a disk of the given `radius` moving inside `region`,
+    which can be a Polygon.Polygon (possibly with holes, or several contours) or
+    a sequence of points.
+    """
+
+    def __init__(self, region, radius):
+        if isinstance(region, Polygon.Polygon):
+            contours = [region.contour(i) for i in range(len(region))]
+        else:
+            contours = [region]
+
+        # All the contours together, for the even-odd test
+        self.edges = numpy.hstack([polygonEdges(c) for c in contours if len(c) > 0] or [numpy.zeros((4, 0))])
+        self.radius = radius
+
+    def pointsInside(self, points):
+        """
+        Return a boolean array telling whether each of the points (an (M, 2) array-like)
+        is inside the region, ignoring the robot's size.
+        """
+
+        return pointsInPolygon(numpy.asarray(points, dtype=float).reshape(-1, 2), self.edges)
+
+    def segmentsInside(self, starts, ends):
+        """
+        Return a boolean array telling whether the robot stays inside the region when
+        moving from each of the `starts` to the corresponding `ends` (both (M, 2) array-likes).
+        """
+
+        starts = numpy.asarray(starts, dtype=float).reshape(-1, 2)
+        ends = numpy.asarray(ends, dtype=float).reshape(-1, 2)
+        inside = self.pointsInside(starts)
+        if inside.any():
+            inside[inside] = segmentDistances(starts[inside], ends[inside], self.edges) >= self.radius
+        return inside
+
+    def disksInside(self, points):
+        """
+        Return a boolean array telling whether the robot fits inside the region
+        at each of the points (an (M, 2) array-like).
+        """
+
+        return self.segmentsInside(points, points)
+
+    def segmentInside(self, start, end):
+        """ Return True if the robot stays inside the region when moving from `start` to `end` """
+        return bool(self.segmentsInside([start], [end])[0])
+
+    def diskInside(self, point):
+        """ Return True if the robot fits inside the region at `point` """
+        return bool(self.segmentsInside([point], [point])[0])
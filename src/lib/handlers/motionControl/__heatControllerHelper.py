@@ -16,7 +16,14 @@ eps = 2**(-52) # A very small number, for noise tolerance in calculations
 
 def getController(Vertex, exitface, last):
     """
-    This function returns an initialized controller that will calculate
+    Return an initialized controller; see getControllerParameters() for the arguments.
+    """
+
+    return makeController(getControllerParameters(Vertex, exitface, last))
+
+def getControllerParameters(Vertex, exitface, last):
+    """
+    This function does all the (expensive) precalculation needed for a controller that will calculate
     the potential field based control law that will take a robot from an
     initial position in a region to the exit face that leads to the next
     region or to the map reference point (in the last region)
@@ -29,6 +36,9 @@ def getController(Vertex, exitface, last):
        last - True = this is the last region, False = it is NOT the last region 
 
       This function calls functions created by David Conner (dcconner@cmu.edu)
+
+    The result is a dictionary of the precalculated values, which can be pickled
+    and turned into a controller with makeController().
     """
 
     #******************************************************
@@ -78,24 +88,29 @@ def getController(Vertex, exitface, last):
 
     hessian = True # calculate the hessian terms
 
-    if last:
-        # Return a controller that heads to the "center" of the region
-        # NOTE: This will never converge perfectly due to discrete-time simulation;
-        # you should implement a distance threshold afterwhich the robot will stop
+    params = dict(P0=P0, N0=N0, Pin=Pin, Nin=Nin, qx=qx, ae1=ae1, ae2=ae2, Bmax=Bmax,
+                  hessian=hessian, Vtx=Vtx, Brad=Brad, last=last)
 
+    if last:
         # define the goal point within the polygon
-        qf = qx # map reference point
+        params['qf'] = qx # map reference point
         
         # alpha  - scaling factor for convergence   |X| = |q-qf|/(|q-qf| + alpha)
-        alpha = 0.25 # alpha > 0
-        
-        def controller(pos):    
-            return Xgoal_penn(pos, P0, N0, Pin, Nin, qx, ae1, ae2, Bmax, hessian, Vtx, Brad, qf, alpha)
-        
-    else:  # not last region
-        # Return a controller that heads out the center of the exitface, perpendicular to the face
-        def controller(pos):
-            return Xoq_penn(pos, P0, N0, Pin, Nin, qx, ae1, ae2, Bmax, hessian, Vtx, Brad)
+        params['alpha'] = 0.25 # alpha > 0
+
+    return params
+
+def makeController(params):
+    """
+    Return a controller function pos -> [X, DqX, F, inside, J] using the values
+    precalculated by getControllerParameters().
+    """
+
+    batch_controller = makeBatchController(params)
+
+    def controller(pos):
+        [X, DqX, F, inside, J] = batch_controller(pos)
+        return [mat(X), mat(DqX[0]), F[0], bool(inside[0]), mat(J[0])]
 
     return controller
 
@@ -1015,9 +1030,9 @@ def beta_function(q,qx,P0,N0,Pin,Nin,Vtx,hessian=False,Bfact=1):
                             Bp = -Bp
                         # otherwise positive
                   
-                        Dxx = Nin[0,j]*Bp 
-                        Dyy = Nin[1,j]*Bp
-                        Dxy = Nin[1,j]*Bp
+                    Dxx = Nin[0,j]*Bp 
+                    Dyy = Nin[1,j]*Bp
+                    Dxy = Nin[1,j]*Bp
                   
                 elif not P0.size == 0:
                     # i==j use this for the 0 edge
@@ -1312,7 +1327,6 @@ def disk_heat(q,ae1,ae2,hessian=False):
         G=mat([lDwF,lDzF])
         cn = 0
         discontinuity = 0
-        limit =1
         if hessian:
             lDwwF=(-sin(2*ae1) + sin(2*ae2))/pi
             lDzzF=(sin(2*ae1) - sin(2*ae2))/pi
@@ -1320,9 +1334,8 @@ def disk_heat(q,ae1,ae2,hessian=False):
             H = mat([[lDwwF, lDwzF],
                      [lDwzF, lDzzF]])
             cn=cond(H)
-        return [F,G,H,cn,discontinuity,limit]
+        return [F,G,H,cn,discontinuity]
     else:
-        limit=0
         # It gets a little crazy at these isolated points, so let's push off
         # from these points in the calculations
         if (abs(r-1) < 1e-8) and ((abs(ae1-theta) < 1e-6) or (abs(ae2-theta) < 1e-6)):
@@ -1405,3 +1418,618 @@ def disk_heat(q,ae1,ae2,hessian=False):
             cn = cond(H)
       
     return [F,G,H,cn,discontinuity]
+
+
+#*************************************************************************
+#     Vectorized versions
+#*************************************************************************
+#
+# The functions below do the same calculations as the ones above, but for a
+# whole batch of query points at once (given as a 2 x M array), and with the
+# faces handled as stacked 2 x F arrays instead of one column at a time.
+#
+# The few points that need special treatment (at the map center, in the
+# fillet around a vertex, within numerical noise of the boundary, ...) are
+# handed to the single-point versions above, so the results are the same.
+
+def _columns(q):
+    """ Return the query point(s) as a 2 x M float array """
+    return asarray(q, dtype=float).reshape(2, -1)
+
+def _products_excluding(A):
+    """
+    For an F x M array A, return the F x M array whose row i is the product
+    of all rows of A except row i.
+    """
+    one = ones((1,) + A.shape[1:])
+    before = concatenate((one, cumprod(A, axis=0)[:-1]), 0)
+    after = concatenate((cumprod(A[::-1], axis=0)[::-1][1:], one), 0)
+    return before*after
+
+def _face_distances(Q, P, N):
+    """ Signed distances (F x M) of the points Q (2 x M) from faces with points P and normals N (2 x F) """
+    P = asarray(P)
+    N = asarray(N)
+    return sum((Q[:,newaxis,:] - P[:,:,newaxis])*N[:,:,newaxis], axis=0)
+
+def _singular_values(A):
+    """ Singular values (largest first, M x 2) of a stack of 2 x 2 matrices A (M x 2 x 2) """
+    S = sum(sum(A**2, axis=2), axis=1)
+    det = A[:,0,0]*A[:,1,1] - A[:,0,1]*A[:,1,0]
+    root = sqrt(maximum(S**2 - 4*det**2, 0))
+    return sqrt(array([(S + root)/2, maximum(S - root, 0)/2]).T)
+
+def is_inside_batch(q, P0, N0, Pin, Nin, Vtx):
+    """
+    Return an array of booleans saying whether each of the points q (2 x M)
+    is inside the polygon; see is_inside()
+    """
+    Q = _columns(q)
+
+    # A point is out if it's far enough outside of any face, and in if it's
+    # not outside any of them.  Otherwise, it's close to the boundary and
+    # we have to look at the faces one at a time.
+    d = _face_distances(Q, Pin, Nin)
+    far = (d < -1e-8).any(axis=0)
+    close = (d < -1e-12).any(axis=0)
+    if not P0.size == 0:
+        d0 = _face_distances(Q, P0, -N0)[0]
+        far |= d0 < -1e-6
+        close |= d0 < -1e-12
+
+    inside = ~close
+    for m in flatnonzero(close & ~far):
+        inside[m] = is_inside(mat(Q[:,m]).T, P0, N0, Pin, Nin, Vtx)
+
+    return inside
+
+def beta_function_batch(q,qx,P0,N0,Pin,Nin,Vtx,hessian=False,Bfact=1):
+    """
+    Distance function and its partials for each of the points q (2 x M);
+    see beta_function().  Returns [B,DxB,DyB,DxxB,DyyB,DxyB] as arrays of length M.
+    """
+    Q = _columns(q)
+    M = Q.shape[1]
+    inside = is_inside_batch(Q,P0,N0,Pin,Nin,Vtx)
+    Nin = asarray(Nin)
+    Nx = Nin[0][:,newaxis]
+    Ny = Nin[1][:,newaxis]
+    exit = not P0.size == 0
+
+    # contribution of each face of polygon, limiting how large the negative can be
+    Bi = maximum(_face_distances(Q, Pin, Nin), -1.e-2*Bfact)
+    B = prod(Bi, axis=0)
+
+    # Calculate the distance product and partials
+    if exit:
+        N0x, N0y = asarray(N0).flat
+        B0 = maximum(_face_distances(Q, P0, -N0)[0], -1.e-2*Bfact) # inward pointing normal for exit face
+        DxB = -N0x*B
+        DyB = -N0y*B
+    else:
+        B0 = ones(M)
+        DxB = zeros(M)
+        DyB = zeros(M)
+
+    B = B*B0
+
+    # Must be in a vertex region (2 negatives - only 2 given convex polygon)
+    vertex_region = ~inside & (B > 0)
+    B = where(vertex_region, -B, B)
+    if exit:
+        # On the negative side of the exit face, movement along the inward normal increases B
+        exit_side = vertex_region & (B0 < 0)
+        DxB = where(exit_side, abs(DxB) if -N0x > 0 else -abs(DxB), where(vertex_region, -DxB, DxB))
+        DyB = where(exit_side, abs(DyB) if -N0y > 0 else -abs(DyB), where(vertex_region, -DyB, DyB))
+
+    # Now calculate the partials of the distance function
+    Bex = _products_excluding(Bi) # product of the distances to all inlet faces but one
+    Bp = where(vertex_region & (Bi != 0), -1, 1)*B0*Bex
+    DxB = DxB + sum(Bp*Nx, axis=0)
+    DyB = DyB + sum(Bp*Ny, axis=0)
+
+    if not hessian:
+        return [B,DxB,DyB,zeros(M),zeros(M),zeros(M)]
+
+    def flip(a, b):
+        # Where the sign of the distance product needs to be reversed (see beta_function())
+        return vertex_region & ~((a >= 0) & (b >= 0) & ((a == 0) | (b == 0)))
+
+    if exit:
+        # Calculate partial due to exit face
+        Bp = where(flip(B0, Bi), -Bex, Bex)
+        DxxB = -N0x*sum(Nx*Bp, axis=0)
+        DyyB = -N0y*sum(Ny*Bp, axis=0)
+        DxyB = -N0x*sum(Ny*Bp, axis=0)
+    else:
+        DxxB = zeros(M)
+        DyyB = zeros(M)
+        DxyB = zeros(M)
+
+    for i in xrange(Pin.shape[1]):
+        # consider partials with the other inlet faces, including the exit face
+        others = Bi.copy()
+        others[i] = 1
+        Bp = B0*_products_excluding(others)
+        Bp = where(flip(Bi[i], Bi), -Bp, Bp)
+        Bp[i] = 0
+
+        DxxS = sum(Nx*Bp, axis=0)
+        DyyS = sum(Ny*Bp, axis=0)
+        DxyS = DyyS.copy()
+
+        if exit:
+            # i==j use this for the 0 edge
+            Bp = where(flip(Bi[i], B0), -Bex[i], Bex[i])
+            DxxS += -N0x*Bp
+            DyyS += -N0y*Bp
+            DxyS += -N0y*Bp
+
+        DxxB = DxxB + DxxS*Nin[0,i]
+        DyyB = DyyB + DyyS*Nin[1,i]
+        DxyB = DxyB + DxyS*Nin[0,i]
+
+    return [B,DxB,DyB,DxxB,DyyB,DxyB]
+
+def map2diskScale_batch(q,P0,N0,Pin,Nin,qx,ae1,ae2,Bmax,hessian=False,Vtx=None,Brad=None):
+    """
+    Map each of the points q (2 x M) to the disk; see map2diskScale().
+
+    Returns [qc,qs,R,J,Hp,B,DxB,DyB,DxxB,DyyB,DxyB,vtx_check,limit], where qc and qs
+    are 2 x M, R is the 2 x 2 rotation, J is M x 2 x 2, Hp is M x 2 x 3 and the rest are
+    arrays of length M.
+    """
+    Q = _columns(q)
+    M = Q.shape[1]
+
+    if Brad is None:
+        Brad = mat([])
+
+    qv = Q - asarray(qx)
+    nq = sqrt(sum(qv**2, axis=0))
+
+    # Get rotation to place exit face bisector on negative x-axis
+    if not P0.size == 0:
+        qe = P0-qx
+        qe = qe/norm(qe)
+        a0 = atan2(qe[1,0],qe[0,0])
+    else:
+        a0 = pi
+
+    # rotation of polygon relative to x-axis
+    R = mat([[cos(pi-a0),-sin(pi-a0)],[sin(pi-a0),cos(pi-a0)]])
+    if P0.size == 0:
+        Ns0=mat([])
+        Ps0=mat([])
+    else:
+        Ns0=R*N0
+        Ps0=R*(P0-qx)
+
+    Ns = R*Nin
+    Ps = R*(Pin-qx*mat(ones((1,Pin.shape[1]))))
+
+    if Vtx is not None:
+        Vs = R*(Vtx-qx*ones((1,Vtx.shape[1])))
+    else:
+        Vs = []
+
+    qs = dot(asarray(R), qv)
+    inside = is_inside_batch(Q,P0,N0,Pin,Nin,Vtx)
+
+    # Points at the map center, or near a vertex (which might need to be
+    # mapped to the fillet curve) are done one at a time
+    special = nq < 100*eps
+    if Vtx is not None and not asarray(Brad).size == 0:
+        Va = asarray(Vs)
+        near = (sum((qs[:,newaxis,:] - Va[:,:,newaxis])**2, axis=0) < float(Brad)**2).any(axis=0)
+        special |= near & inside
+
+    # Get the beta function used in the mapping   
+    N = 1 + Pin.shape[1] 
+    Bfact = Bmax**(1/N)
+    [B,DxB,DyB,DxxB,DyyB,DxyB] = beta_function_batch(qs,mat([[0],[0]]),Ps0,Ns0,Ps,Ns,Vs,hessian,Bfact)
+    Bfact = Bfact/Bmax
+
+    nq = sqrt(sum(qs**2, axis=0))
+
+    B = B*Bfact
+    DxB=DxB*Bfact
+    DyB=DyB*Bfact
+    DxxB=DxxB*Bfact
+    DyyB=DyyB*Bfact
+    DxyB=DxyB*Bfact
+
+    with errstate(divide='ignore', invalid='ignore'):
+        qc = qs/(nq + B)
+
+        # Make sure we didn't futz it up with mapping near boundary
+        # We started inside, so make sure we stay inside
+        nc = sqrt(sum(qc**2, axis=0))
+        qc = where(inside & (nc > 1.0), qc/nc, qc)
+
+        # Now calculate the Jacobian
+        x = qs[0]
+        y = qs[1]
+        DxW = (B - DxB*x + y**2/nq)/(B + nq)**2
+        DyW = -((x*(DyB + y/nq))/(B + nq)**2)
+        DxZ = -(((DxB + x/nq)*y)/(B + nq)**2)
+        DyZ = (B + x**2/nq - DyB*y)/(B + nq)**2
+        J = array([[DxW,DyW],[DxZ,DyZ]]).transpose(2,0,1)
+
+        if hessian:
+            DxxW = (-2*(DxB + (x/nq))*(B - DxB*x + (y**2/nq)) + (B + nq)*(-(DxxB*x) - ((x*y**2)/nq**3)))/((B + nq)**3)
+            DyyW = x*(2*(DyB + y/nq)**2 - ((B + nq)*(x**2 + DyyB*nq**3))/nq**3)/(B + nq)**3
+            DxyW = (-2*(DyB + y/nq)*(B - DxB*x + y**2/nq) + (B + nq)*(DyB - DxyB*x + (2*x**2*y + y**3)/nq**3))/(B + nq)**3
+            DxxZ = (y*(2*(DxB + x/nq)**2 - ((B + nq)*(y**2 + DxxB*nq**3))/nq**3))/(B + nq)**3
+            DyyZ = (-2*(B + x**2/nq - DyB*y)*(DyB + y/nq) + (B + nq)*(-(DyyB*y) - (x**2*y)/nq**3))/(B + nq)**3
+            DxyZ = -(((B + nq)*(DxB + x/nq) - 2*(DxB + x/nq)*y*(DyB + y/nq) + (B + nq)*y*(DxyB - (x*y)/nq**3))/(B + nq)**3)
+            Hp = array([[DxxW,DyyW,DxyW],[DxxZ,DyyZ,DxyZ]]).transpose(2,0,1)
+        else:
+            DxxB = zeros(M)
+            DyyB = zeros(M)
+            DxyB = zeros(M)
+            Hp = zeros((M,2,3))
+
+    vtx_check = where(inside, -1, 0)
+    limit = zeros(M, dtype=int)
+
+    for m in flatnonzero(special):
+        result = map2diskScale(mat(Q[:,m]).T,P0,N0,Pin,Nin,qx,ae1,ae2,Bmax,hessian,Vtx,Brad)
+        qc[:,m] = asarray(result[0]).flat
+        qs[:,m] = asarray(result[1]).flat
+        J[m] = result[3]
+        if hessian:
+            Hp[m] = result[4]
+        for values, value in zip((B,DxB,DyB,DxxB,DyyB,DxyB,vtx_check,limit), result[5:]):
+            values[m] = value
+
+    return [qc,qs,R,J,Hp,B,DxB,DyB,DxxB,DyyB,DxyB,vtx_check,limit]
+
+def disk_heat_batch(q,ae1,ae2,hessian=False):
+    """
+    Heat solution on the unit disk for each of the points q (2 x M); see disk_heat().
+    Returns [F,G,H,discontinuity], where G is M x 2, H is M x 2 x 2 and the rest
+    are arrays of length M.
+    """
+    Q = _columns(q)
+    M = Q.shape[1]
+    ae1_in, ae2_in = ae1, ae2
+
+    dae = 2*pi - ae2 + ae1
+    ae1 = ae1 - 0.005*dae
+    ae2 = ae2 + 0.005*dae
+
+    r = sqrt(sum(Q**2, axis=0))    # Get the radius of the coordinate
+    theta = arctan2(Q[1], Q[0])    # Get the angle wrt x-axis
+
+    inside = sum(Q**2, axis=0) <= 1.0 # Is this point in the unit disk (including boundary)
+
+    # Assume numerical noise in conversion from boundary
+    noise = ~inside & ((r-1) < 100*eps)
+    Q = where(noise, Q/(r+50*eps), Q)
+    r = where(noise, 1.0, r)
+    inside |= noise
+
+    # Equation reduced using definition of the log of complex number 
+    with errstate(divide='ignore', invalid='ignore'):
+        F = where(inside,
+                  (ae2-ae1)/(2*pi) - arctan2((r*sin(ae1-theta)), 1 - r*cos(ae1-theta))/pi + \
+                  arctan2( r*sin(ae2-theta),  1 - r*cos(ae2-theta))/pi,
+                  where((theta > ae1) | (theta < ae2), 0.0, 1.0))
+
+        near_ae = (abs(ae1-theta) < 1e-6) | (abs(ae2-theta) < 1e-6)
+        discontinuity = where((abs(r-1) < 1e-6) & near_ae, -1, 0) # Warning
+
+        w = Q[0] # Extract for cosmetic reasons 
+        z = Q[1]
+
+        c1 = cos(ae1 - theta)
+        s1 = sin(ae1 - theta)
+        c2 = cos(ae2 - theta)
+        s2 = sin(ae2 - theta)
+
+        DwF= ((-2*r*z + 2*z*c1 + 2*w*s1)/(-(r*(1 + r**2)) + \
+              2*r**2*c1) + (-2*r*z + 2*z*c2 + 2*w*s2)/(r*(1 + r**2) - \
+              2*r**2*c2))/(2.*pi)
+
+        DzF= ((2*(r*w - w*c1 + z*s1))/(-(r*(1 + r**2)) + \
+               2*r**2*c1) + (2*(r*w - w*c2 + z*s2))/(r*(1 + r**2) - \
+               2*r**2*c2))/(2.*pi)
+
+        G = array([DwF,DzF]).T
+
+        if not hessian:
+            H = zeros((M,2,2))
+        else:
+            DwwF= -((-((w*(w**2*z + z**3 - r*z*c1 - r*w*s1))/(1 + r**2 - 2*r*c1)) + \
+                  (r*(r*z - z*c1 - w*s1)*(w + 3*r**2*w - 4*r*w*c1 + \
+                  2*r*z*s1))/(1 + r**2 - 2*r*c1)**2 + \
+                  (w*(w**2*z + z**3 - r*z*c2 - r*w*s2))/(1 + r**2 - 2*r*c2) + \
+                  (r*(-(r*z) + z*c2 + w*s2)*\
+                  (w + 3*r**2*w - 4*r*w*c2 + 2*r*z*s2))/(1 + r**2 - 2*r*c2)**2)/(pi*r**4))
+
+            DzzF=((-(r*w*z) + w*z*c1 + (-r**2 + w**2)*s1)/(1 + r**2 - 2*r*c1) + \
+                  ((z + 3*r**2*z - 4*r*z*c1 - 2*r*w*s1)*(r*w - w*c1 + z*s1))/\
+                  (1 + r**2 - 2*r*c1)**2 + (r*w*z - w*z*c2 + (r**2 - w**2)*s2)/\
+                  (1 + r**2 - 2*r*c2) - ((z + 3*r**2*z - 4*r*z*c2 - 2*r*w*s2)*\
+                  (r*w - w*c2 + z*s2))/\
+                  (1 + r**2 - 2*r*c2)**2)/(pi*r**3)
+      
+            DwzF= -(((r*(r*z - z*c1 - w*s1)*(z + 3*r**2*z - 4*r*z*c1 - \
+                  2*r*w*s1))/(1 + r**2 - 2*r*c1)**2 + \
+                  (-w**4 - 3*w**2*z**2 - 2*z**4 + r*z**2*c1 + r*w*z*s1)/\
+                  (1 + r**2 - 2*r*c1) - (r*(r*z - z*c2 - w*s2)*\
+                  (z + 3*r**2*z - 4*r*z*c2 - 2*r*w*s2))/\
+                  (1 + r**2 - 2*r*c2)**2 + \
+                  (w**4 + 3*w**2*z**2 + 2*z**4 - r*z**2*c2 - \
+                  r*w*z*s2)/(1 + r**2 - 2*r*c2))/(pi*r**4))
+      
+            H = array([[DwwF, DwzF],
+                       [DwzF, DzzF]]).transpose(2,0,1)
+
+    # The limit at the center of the disk, and the singularities on the boundary,
+    # are handled one point at a time
+    special = (r < 2*eps) | ((abs(r-1) < 1e-8) & near_ae)
+    for m in flatnonzero(special):
+        result = disk_heat(mat(_columns(q)[:,m]).T,ae1_in,ae2_in,hessian)
+        F[m] = result[0]
+        G[m] = result[1]
+        if hessian:
+            H[m] = result[2]
+        discontinuity[m] = result[4]
+
+    return [F,G,H,discontinuity]
+
+def disk_goal_batch(q,qf,hessian=False):
+    """
+    Goal potential on the unit disk for each of the points q (2 x M); see disk_goal().
+    Returns [F,G,H], where G is M x 2, H is M x 2 x 2 and F is an array of length M.
+    """
+    Q = _columns(q)
+    M = Q.shape[1]
+
+    r = sqrt(sum(Q**2, axis=0))
+
+    # Assume numerical noise in conversion from boundary
+    noise = (sum(Q**2, axis=0) > 1.0) & ((r-1) < 100*eps)
+    Q = where(noise, Q/(r+50*eps), Q)
+
+    w  = Q[0] # Extract for cosmetic reasons 
+    z  = Q[1]
+    wf = qf[0,0]
+    zf = qf[1,0]
+
+    with errstate(divide='ignore', invalid='ignore'):
+        D = -2*w*wf + wf**2*z**2 + (-1 + z*zf)**2 + w**2*(wf**2 + zf**2)
+
+        F = (w**2 - 2*w*wf + wf**2 + (z - zf)**2)/(2.*D)
+
+        DwF =  -(((-1 + wf**2 + zf**2)*(-(w**2*wf) + wf*(-1 + z**2) + w*(1 + wf**2 - 2*z*zf + zf**2)))/D**2)
+
+        DzF =  -(((-1 + wf**2 + zf**2)*((-1 + w**2)*zf - z**2*zf + z*(1 - 2*w*wf + wf**2 + zf**2)))/D**2)
+
+        G = array([DwF,DzF]).T
+
+        if not hessian:
+            H = zeros((M,2,2))
+        else:
+            DwwF =  ((-1 + wf**2 + zf**2)*(-((1 - 2*w*wf + wf**2 - 2*z*zf + zf**2)*D) + \
+                    2*(-2*wf + 2*w*(wf**2 + zf**2))*(-(w**2*wf) + wf*(-1 + z**2) + w*(1 + wf**2 - 2*z*zf + zf**2))))/D**3
+
+            DzzF =  ((-1 + wf**2 + zf**2)*(-((1 - 2*w*wf + wf**2 - 2*z*zf + zf**2)*D) + \
+                    2*(2*wf**2*z + 2*zf*(-1 + z*zf))*((-1 + w**2)*zf - z**2*zf + z*(1 - 2*w*wf + wf**2 + zf**2))))/D**3
+
+            DwzF =  ((-1 + wf**2 + zf**2)*(-((2*wf*z - 2*w*zf)*D) + \
+                    2*(2*wf**2*z + 2*zf*(-1 + z*zf))*(-(w**2*wf) + wf*(-1 + z**2) + w*(1 + wf**2 - 2*z*zf + zf**2))))/D**3
+
+            H = array([[DwwF, DwzF],[DwzF, DzzF]]).transpose(2,0,1)
+
+    return [F,G,H]
+
+def _pull_back_hessian(J, Hp, Gc, Hc, NG32):
+    """
+    Change in the normalized gradient field, pulled back from the disk with the
+    mapping jacobian J and "Hessian" Hp (all stacked M x ...); see polygon_heat_penn().
+    """
+    DxW = J[:,0,0]
+    DyW = J[:,0,1]
+    DxZ = J[:,1,0]
+    DyZ = J[:,1,1]
+
+    DwF = Gc[:,0]
+    DzF = Gc[:,1]
+
+    DxxW = Hp[:,0,0]
+    DyyW = Hp[:,0,1]
+    DxyW = Hp[:,0,2]
+    DxxZ = Hp[:,1,0]
+    DyyZ = Hp[:,1,1]
+    DxyZ = Hp[:,1,2]
+
+    DwwF = Hc[:,0,0]
+    DzzF = Hc[:,1,1]
+    DwzF = Hc[:,0,1]
+
+    DxxF= ((DwF*DyW + DyZ*DzF)*(DwF**2*(-(DxW*DxyW) + DxxW*DyW) + \
+      DzF*(DwwF*DxW*(-(DxZ*DyW) + DxW*DyZ) + \
+      DwzF*DxZ*(-(DxZ*DyW) + DxW*DyZ) - DxyZ*DxZ*DzF + DxxZ*DyZ*DzF) + \
+      DwF*(DwzF*DxW*(DxZ*DyW - DxW*DyZ) - DxyW*DxZ*DzF + DxxZ*DyW*DzF + \
+      DxxW*DyZ*DzF + DxZ**2*DyW*DzzF - \
+      DxW*(DxyZ*DzF + DxZ*DyZ*DzzF))))/NG32
+    DxyF= ((DwF*DyW + DyZ*DzF)*(DwF**2*(DxyW*DyW - DxW*DyyW) + \
+      DzF*(DwwF*DyW*(-(DxZ*DyW) + DxW*DyZ) + \
+      DwzF*DyZ*(-(DxZ*DyW) + DxW*DyZ) - DxZ*DyyZ*DzF + DxyZ*DyZ*DzF) + \
+      DwF*(DwzF*DyW*(DxZ*DyW - DxW*DyZ) + DxyZ*DyW*DzF - DxZ*DyyW*DzF -\
+      DxW*DyyZ*DzF + DxyW*DyZ*DzF + DxZ*DyW*DyZ*DzzF - \
+      DxW*DyZ**2*DzzF)))/NG32
+    DyxF= ((DwF*DxW + DxZ*DzF)*(DwF**2*(DxW*DxyW - DxxW*DyW) + \
+      DzF*(DwzF*DxZ**2*DyW - DwzF*DxW*DxZ*DyZ + \
+      DwwF*DxW*(DxZ*DyW - DxW*DyZ) + DxyZ*DxZ*DzF - DxxZ*DyZ*DzF) + \
+      DwF*(DwzF*DxW*(-(DxZ*DyW) + DxW*DyZ) + DxW*DxyZ*DzF + DxyW*DxZ*DzF - \
+      DxxZ*DyW*DzF - DxxW*DyZ*DzF - DxZ**2*DyW*DzzF + \
+      DxW*DxZ*DyZ*DzzF)))/NG32
+    DyyF= ((DwF*DxW + DxZ*DzF)*(DwF**2*(-(DxyW*DyW) + DxW*DyyW) + \
+      DzF*(DwzF*DxZ*DyW*DyZ - DwzF*DxW*DyZ**2 + \
+      DwwF*DyW*(DxZ*DyW - DxW*DyZ) + DxZ*DyyZ*DzF - DxyZ*DyZ*DzF) + \
+      DwF*(DwzF*DyW*(-(DxZ*DyW) + DxW*DyZ) - DxyZ*DyW*DzF + DxZ*DyyW*DzF + \
+      DxW*DyyZ*DzF - DxyW*DyZ*DzF - DxZ*DyW*DyZ*DzzF + \
+      DxW*DyZ**2*DzzF)))/NG32
+
+    # change in vector field of negative gradient so use negative sign with matrix 
+    return -array([[DxxF,DxyF],[DyxF,DyyF]]).transpose(2,0,1)
+
+def _normalized_pull_back(J, Gc):
+    """
+    Pull the disk gradients Gc (M x 2) back through the jacobians J (M x 2 x 2).
+    Returns the negative normalized gradient (M x 2) and NG**3 (protected against 0).
+    """
+    DwF = Gc[:,0]
+    DzF = Gc[:,1]
+
+    # Vector norms
+    Gx = DwF*J[:,0,0] + J[:,1,0]*DzF
+    Gy = DwF*J[:,0,1] + J[:,1,1]*DzF
+    NG = sqrt(Gx**2 + Gy**2)
+    moving = NG > 0
+    NG = where(moving, NG, 1) # Protect against divide by 0
+
+    G = -array([where(moving, Gx/NG, 0), where(moving, Gy/NG, 0)]).T
+    return [G, NG**3]
+
+def polygon_heat_penn_batch(q,P0,N0,Pin,Nin,qx,ae1,ae2,Bmax,hessian,Vtx,Brad):
+    """
+    Heat controller field for each of the points q (2 x M); see polygon_heat_penn().
+    Returns [F,inside,G,H,Hn,J,vtx_check], where G is M x 2, H and J are M x 2 x 2
+    and the rest are arrays of length M.
+    """
+    Q = _columns(q)
+    M = Q.shape[1]
+    inside = is_inside_batch(Q,P0,N0,Pin,Nin,Vtx)
+
+    # Map to the disk world return coordinates (w,z) in disk world and
+    # the coordinate in the recentered and rotated polygon
+    [qc,qs,R,J,Hp,B,DxB,DyB,DxxB,DyyB,DxyB,vtx_check,limit] = map2diskScale_batch(Q,P0,N0,Pin,Nin,qx,ae1,ae2,Bmax,hessian,Vtx,Brad)
+    [Fc,Gc,Hc,discontinuity] = disk_heat_batch(qc,ae1,ae2,hessian)
+
+    F = Fc  # Just the pull back - ignore the result of scaling gradient
+
+    [G, NG32] = _normalized_pull_back(J, Gc)
+
+    # Rotate back to original frame
+    R = asarray(R)
+    G = dot(G, R)
+
+    if hessian:
+        H = _pull_back_hessian(J, Hp, Gc, Hc, NG32)
+
+        # Rotate back to original frame
+        H = einsum('ji,mjk,kl->mil', R, H, R)  # transform into the original polygon coordinate frame
+
+        # Spectral Norm
+        Hn = _singular_values(H)[:,0]
+    else:
+        H = zeros((M,2,2))
+        Hn = zeros(M)
+
+    # A final check
+    s = _singular_values(J)
+    with errstate(divide='ignore', invalid='ignore'):
+        singular = ~(s[:,0]/s[:,-1] <= 1e8)
+    for m in flatnonzero(singular):
+        result = polygon_heat_penn(mat(Q[:,m]).T,P0,N0,Pin,Nin,qx,ae1,ae2,Bmax,hessian,Vtx,Brad)
+        G[m] = result[2]
+        H[m] = result[3]
+        Hn[m] = result[4]
+
+    return [F,inside,G,H,Hn,J,vtx_check]
+
+def Xoq_penn_batch(q,P0,N0,Pin,Nin,qx,ae1,ae2,Bmax,hessian,Vtx,Brad):
+    """
+    Heat controller for each of the points q (2 x M); see Xoq_penn().
+    Returns [X,DqX,F,inside,J], where X is 2 x M, DqX and J are M x 2 x 2,
+    and F and inside are arrays of length M.
+    """
+
+    [F,inside,G,H,Hn,J,vtx_check] = \
+       polygon_heat_penn_batch(q,P0,N0,Pin,Nin,qx,ae1,ae2,Bmax,hessian,Vtx,Brad)
+
+    # Assign reference vector
+    X   = G.T
+    DqX = H
+
+    return [X,DqX,F,inside,J]
+
+def Xgoal_penn_batch(q,P0,N0,Pin,Nin,qx,ae1,ae2,Bmax,hessian,Vtx,Brad,qf,alpha,goal_map=None):
+    """
+    Goal controller for each of the points q (2 x M); see Xgoal_penn().
+    Returns [X,DqX,F,inside,J], where X is 2 x M, DqX and J are M x 2 x 2,
+    and F and inside are arrays of length M.
+
+    goal_map can be the result of map2diskScale() for qf, if it has already been calculated.
+    """
+    Q = _columns(q)
+    M = Q.shape[1]
+    inside = is_inside_batch(Q,P0,N0,Pin,Nin,Vtx)
+
+    # Distance from current location to the goal
+    qv = Q - asarray(qf)
+
+    # Map to the disk world
+    qc = map2diskScale_batch(Q,P0,N0,Pin,Nin,qx,-pi,pi,Bmax,hessian,Vtx,Brad)[0]
+    if goal_map is None:
+        goal_map = map2diskScale(qf,P0,N0,Pin,Nin,qx,-pi,pi,Bmax,hessian,Vtx,Brad)
+    [qcf,qs,Rot,Jf,Hpf,B,DxB,DyB,DxxB,DyyB,DxyB,vtx_check,limit] = goal_map
+
+    # Find gradient in the disk world
+    [Fc,Gc,Hc] = disk_goal_batch(qc,qcf,hessian)
+
+    # Pull back (like Xgoal_penn(), this uses the mapping at the goal point)
+    F = Fc
+    J = repeat(asarray(Jf)[newaxis], M, axis=0)
+    [G, NG32] = _normalized_pull_back(J, Gc)
+
+    if hessian:
+        H = _pull_back_hessian(J, repeat(asarray(Hpf)[newaxis], M, axis=0), Gc, Hc, NG32)
+        # Hessian but not inside polygon C**2 approximation
+        H[~inside] = 0
+    else:
+        H = zeros((M,2,2))
+
+    # Scaling factor a' la Rizzi '98
+    D2 = sum(qv**2, axis=0)
+    S = D2/(D2+alpha)
+
+    # Final version
+    X = S*G.T
+
+    if hessian:
+        # Recalculate based on convergence scaling
+        DqS = 2*alpha*qv/((D2+alpha)**2)
+        # (only the first term of the outer product, as in Xgoal_penn())
+        DqX = S[:,newaxis,newaxis]*H + (G[:,0]*DqS[0])[:,newaxis,newaxis]
+    else:
+        DqX = H
+
+    return [X,DqX,F,inside,J]
+
+def makeBatchController(params):
+    """
+    Like makeController(), but the returned function takes a 2 x M array of positions
+    and returns [X,DqX,F,inside,J] for all of them (X is 2 x M, DqX and J are M x 2 x 2,
+    and F and inside are arrays of length M).
+    """
+
+    P0, N0, Pin, Nin, Vtx = [params[k] for k in ('P0', 'N0', 'Pin', 'Nin', 'Vtx')]
+    qx, ae1, ae2, Bmax, hessian, Brad = [params[k] for k in ('qx', 'ae1', 'ae2', 'Bmax', 'hessian', 'Brad')]
+
+    if params['last']:
+        qf, alpha = params['qf'], params['alpha']
+        goal_map = map2diskScale(qf, P0, N0, Pin, Nin, qx, -pi, pi, Bmax, hessian, Vtx, Brad)
+
+        def controller(positions):
+            return Xgoal_penn_batch(positions, P0, N0, Pin, Nin, qx, ae1, ae2, Bmax, hessian, Vtx, Brad, qf, alpha, goal_map)
+    else:
+        def controller(positions):
+            return Xoq_penn_batch(positions, P0, N0, Pin, Nin, qx, ae1, ae2, Bmax, hessian, Vtx, Brad)
+
+    return controller
@@ -8,6 +8,7 @@ A Python implementation of the ray to infinity even-odd test to determin if a po
 """
 
 from numpy import *
+from regions import polygonEdges, pointsInPolygon
 
 def is_inside(p, vert):
     """
@@ -21,26 +22,20 @@ def is_inside(p, vert):
 
     Uses the 'ray to infinity' even-odd test.
     Let the ray be the horizontal ray starting at p and going to +inf in x.
+    The test itself is done by the vectorized kernel in regions.pointsInPolygon().
     """
-    
-    V = hstack((vert, [[vert[0,0]],[vert[1,0]]]))
-
-    inside = False
-    x,y=p[0],p[1]
-    for i in range(V.shape[1]-1):
-        v0 = V[:, i]
-        v1 = V[:, i+1]
-        # Check if both verts to the left of ray
-        if v0[0]<x and v1[0]<x:
-            continue
-        # check if both on the same side of ray
-        if (v0[1]<y and v1[1]<y) or (v0[1]>y and v1[1]>y):
-            continue
-        #check for horizontal line - another horz line can't intersect it
-        if (v0[1]==v1[1]):
-            continue
-        # compute x intersection value
-        xisect = v0[0] + (v1[0]-v0[0])*((y-v0[1])/(v1[1]-v0[1]))
-        if xisect >= x:
-            inside = not inside
-    return inside
+
+    return bool(are_inside([[p[0]], [p[1]]], vert)[0])
+
+def are_inside(points, vert):
+    """
+    Batch version of is_inside().
+    Arguments:
+    	points - (2,M) array of the 2d points to test
+    	vert - (2,N) array of points difining the polygon
+
+    Returns:
+    - boolean array of length M with the result of the in/out test for each point.
+    """
+
+    return pointsInPolygon(asarray(points, dtype=float).T, polygonEdges(asarray(vert, dtype=float).T))
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+"""
+=========================================================
+__roadmap.py - Precomputed Roadmap for Region Transitions
+=========================================================
+
+A probabilistic roadmap over the decomposed regions, in lab coordinates, for a
+disk-shaped robot of a given radius.  Each region gets a set of collision-free
+nodes, connected by straight edges that stay inside that region, and each
+transition face the robot fits through gets a pair of gate nodes, one on each
+side, pushed away from the face so that the robot fits.
+
+The roadmap is expensive to build but only depends on the regions, the robot
+radius and the calibration, so it is saved to <project>_roadmap.cache (next to
+the _decomposed.regions file) and reused on later runs.  It can be built ahead
+of time with src/etc/utils/build_roadmap.py.  A controller then finds a path for
+a region transition by connecting the robot's pose to the nodes of the current
+region and searching the roadmap for the cheapest way to a gate.
+"""
+
+import os
+import math
+import heapq
+import cPickle
+import numpy
+import fileMethods
+from __collisionChecking import RegionCollisionChecker
+
+# Number of nodes sampled in each region: one per (NODE_SPACING*radius)^2 area, within these bounds
+NODE_SPACING = 3
+MIN_REGION_NODES = 10
+MAX_REGION_NODES = 100
+
+# Number of nearest nodes each node is connected to, and the number of samples drawn at once
+NEIGHBORS = 8
+SAMPLE_BATCH_SIZE = 200
+
+# How far (in robot radii) the gate nodes are from the transition face
+GATE_OFFSET = 1.5
+
+# Version of the stored data, so old cache files are ignored
+ROADMAP_VERSION = 2
+
+def roadmapFilename(proj):
+    """ Return the name of the file the roadmaps for a project are stored in """
+    return proj.getFilenamePrefix() + "_roadmap.cache"
+
+def roadmapKey(rfi, transform, radius):
+    """
+    Key that identifies a roadmap by the region geometry (in map coordinates),
+    the calibration and the robot radius it was built for.
+    """
+
+    geometry = tuple((tuple((pt.x, pt.y) for pt in region.getPoints()),
+                      tuple(tuple((pt.x, pt.y) for pt in region.getPoints(hole_id=i)) for i in xrange(len(region.holeList))))
+                     for region in rfi.regions)
+    calibration = tuple(round(v, 9) for v in transform.lab2mapMatrix.flat)
+    return (ROADMAP_VERSION, geometry, calibration, round(radius, 9))
+
+def loadRoadmap(proj, radius):
+    """
+    Return the stored roadmap for the project's current regions and calibration
+    and the given robot radius, or None if there isn't one.
+    """
+
+    filename = roadmapFilename(proj)
+    if not os.path.exists(filename):
+        return None
+
+    try:
+        with open(filename, 'rb') as f:
+            stored = cPickle.load(f)
+        data = stored.get(roadmapKey(proj.rfi, proj.coordTransform, radius))
+    except Exception, e:
+        print "WARNING: Could not load roadmap from %s (%s)" % (filename, e)
+        return None
+
+    if data is None:
+        return None
+    return Roadmap(data)
+
+def saveRoadmap(proj, roadmap):
+    """
+    Add the roadmap to the project's roadmap file.  Roadmaps stored for other
+    radii are kept; ones for other region geometry or calibrations are dropped.
+    """
+
+    filename = roadmapFilename(proj)
+    key = roadmapKey(proj.rfi, proj.coordTransform, roadmap.radius)
+
+    stored = {}
+    if os.path.exists(filename):
+        try:
+            with open(filename, 'rb') as f:
+                stored = cPickle.load(f)
+        except Exception:
+            stored = {}
+    stored = dict((k, v) for k, v in stored.iteritems() if k[:3] == key[:3])
+    stored[key] = roadmap.getData()
+
+    def write(tmpname):
+        with open(tmpname, 'wb') as f:
+            cPickle.dump(stored, f, cPickle.HIGHEST_PROTOCOL)
+
+    # Written under a temporary name and renamed, so that a run that is
+    # interrupted (or another one loading the roadmap) never sees half a file
+    fileMethods.replaceFile(filename, write)
+
+def buildRoadmap(geometry, radius, seed=0):
+    """
+    Build a roadmap over the regions of a regions.RegionGeometry (see
+    Project.getRegionGeometry()) for a robot of the given radius.
+    """
+
+    random = numpy.random.RandomState(seed)
+    polygons = [geometry.getPolygon(i) for i in xrange(len(geometry.rfi.regions))]
+    checkers = [RegionCollisionChecker(poly, radius) for poly in polygons]
+
+    points = []
+    regions = []
+
+    # Gate nodes on both sides of each transition face, where the robot fits through it
+    gates = {}
+    for i, j, faces in geometry.rfi.transitions.iterTransitions():
+        if i == j or (j, i) in gates:
+            continue
+        pairChecker = RegionCollisionChecker(geometry.getUnion([i, j]), radius)
+        for middle, normal in zip(*geometry.getTransitionFaces(i, j)):
+            a, b = middle - normal*GATE_OFFSET*radius, middle + normal*GATE_OFFSET*radius
+            if not (checkers[i].diskInside(a) and checkers[j].diskInside(b) and pairChecker.segmentInside(a, b)):
+                continue
+
+            gates.setdefault((i, j), []).append((len(points), len(points)+1))
+            gates.setdefault((j, i), []).append((len(points)+1, len(points)))
+            points.extend([a, b])
+            regions.extend([i, j])
+
+    # Random nodes inside each region
+    for i, (poly, checker) in enumerate(zip(polygons, checkers)):
+        count = int(poly.area()/(NODE_SPACING*radius)**2)
+        count = max(MIN_REGION_NODES, min(MAX_REGION_NODES, count))
+        xmin, xmax, ymin, ymax = poly.boundingBox()
+
+        found = []
+        for attempt in xrange(50):
+            samples = numpy.column_stack((random.uniform(xmin, xmax, SAMPLE_BATCH_SIZE),
+                                          random.uniform(ymin, ymax, SAMPLE_BATCH_SIZE)))
+            found.extend(samples[checker.disksInside(samples)])
+            if len(found) >= count:
+                break
+
+        points.extend(found[:count])
+        regions.extend([i]*len(found[:count]))
+
+    points = numpy.array(points, dtype=float).reshape(-1, 2)
+    regions = numpy.array(regions, dtype=int)
+
+    # Connect each node to its nearest neighbors in the same region
+    edges = set()
+    for i, checker in enumerate(checkers):
+        nodes = numpy.flatnonzero(regions == i)
+        if len(nodes) < 2:
+            continue
+
+        xy = points[nodes]
+        distances = numpy.hypot(xy[:, 0, numpy.newaxis] - xy[:, 0], xy[:, 1, numpy.newaxis] - xy[:, 1])
+        nearest = numpy.argsort(distances, axis=1)[:, 1:NEIGHBORS+1]
+
+        pairs = set()
+        for a in xrange(len(nodes)):
+            for b in nearest[a]:
+                pairs.add((min(a, b), max(a, b)))
+        pairs = numpy.array(sorted(pairs), dtype=int)
+
+        free = checker.segmentsInside(xy[pairs[:, 0]], xy[pairs[:, 1]])
+        edges.update((nodes[a], nodes[b]) for a, b in pairs[free])
+
+    edges = numpy.array(sorted(edges), dtype=int).reshape(-1, 2).T
+
+    return Roadmap({'radius': radius, 'points': points, 'regions': regions, 'edges': edges, 'gates': gates})
+
+class Roadmap(object):
+    """
+    A roadmap built by buildRoadmap().  It is stored as a plain dictionary of
+    arrays (see getData()) so that it can be pickled.
+    """
+
+    def __init__(self, data):
+        self.radius = data['radius']
+        self.points = data['points']
+        self.regions = data['regions']
+        self.edges = data['edges']
+        self.gates = data['gates']
+
+        # node -> list of (neighbor, distance)
+        lengths = numpy.hypot(*(self.points[self.edges[0]] - self.points[self.edges[1]]).T)
+        self.neighbors = [[] for n in xrange(len(self.points))]
+        for a, b, length in zip(self.edges[0], self.edges[1], lengths):
+            self.neighbors[a].append((b, length))
+            self.neighbors[b].append((a, length))
+
+    def getData(self):
+        """ Return the roadmap as a dictionary that can be passed back to Roadmap() """
+        return {'radius': self.radius, 'points': self.points, 'regions': self.regions,
+                'edges': self.edges, 'gates': self.gates}
+
+    def findPath(self, current_reg, next_reg, p, regionPoly):
+        """
+        Return an (N, 2) array of waypoints going from the x-y position `p` in
+        region `current_reg` into region `next_reg`, or None if the roadmap has no
+        way to get there.  `regionPoly` is the polygon the robot may move in while
+        getting onto the roadmap (usually the current region, plus some space
+        around the robot in case it is on the region's edge).
+        """
+
+        gates = self.gates.get((current_reg, next_reg))
+        if not gates:
+            return None
+
+        # Nodes of the current region we can drive to in a straight line
+        nodes = numpy.flatnonzero(self.regions == current_reg)
+        checker = RegionCollisionChecker(regionPoly, self.radius)
+        start = numpy.array(p[0:2], dtype=float)
+        free = checker.segmentsInside(numpy.tile(start, (len(nodes), 1)), self.points[nodes])
+        if not free.any():
+            return None
+
+        # Dijkstra's algorithm within the current region, to the nearest gate
+        goals = dict(gates)
+        cost = {}
+        previous = {}
+        queue = [(math.hypot(*(self.points[n] - start)), n, None) for n in nodes[free]]
+        heapq.heapify(queue)
+        goal = None
+        while queue:
+            c, n, parent = heapq.heappop(queue)
+            if n in cost:
+                continue
+            cost[n] = c
+            previous[n] = parent
+            if n in goals:
+                goal = n
+                break
+            for m, length in self.neighbors[n]:
+                if m not in cost and self.regions[m] == current_reg:
+                    heapq.heappush(queue, (c + length, m, n))
+
+        if goal is None:
+            return None
+
+        path = [goals[goal]]
+        n = goal
+        while n is not None:
+            path.append(n)
+            n = previous[n]
+        path.reverse()
+
+        waypoints = numpy.vstack((start, self.points[path]))
+        return self.shortcut(waypoints, checker)
+
+    def shortcut(self, waypoints, checker):
+        """
+        Skip waypoints (except the last two, which cross the transition face) that
+        the robot can get past by driving straight to a later one.
+        """
+
+        result = [waypoints[0]]
+        i = 0
+        while i < len(waypoints) - 2:
+            # the furthest waypoint before the gate that can be reached directly
+            candidates = numpy.arange(i+1, len(waypoints)-1)
+            free = checker.segmentsInside(numpy.tile(waypoints[i], (len(candidates), 1)), waypoints[candidates])
+            free[0] = True
+            i = candidates[numpy.flatnonzero(free)[-1]]
+            result.append(waypoints[i])
+        result.append(waypoints[-1])
+
+        return numpy.array(result)
@@ -29,16 +29,49 @@ def getController(p, vert, exit, last=False):
 			 = False, if the current region is NOT the last region
 	"""
 	
-	[d, min_d, ROI] = getRegion(p, vert)
-	s = getSParam(d, ROI)
-	b = getBump(s)
-	if size(array(ROI))==1:
-		Vf = getFaceVF(vert, ROI, exit)
+	return makeController(getControllerParameters(vert, exit, last))(p)
+
+
+def getControllerParameters(vert, exit, last=False):
+	"""
+	This function does the calculations for getController() that only depend on
+	the region and the exit face, so that they can be done once per transition.
+	The inputs are the same as those of getController(), and the result is a
+	dictionary to pass to makeController() or getControllerBatch().
+	"""
+	
+	vert = asarray(vert, dtype=float)
+	n = vert.shape[1]
+	A = vert
+	B = roll(vert, -1, axis=1)
+	D = B - A
+	length = sqrt(sum(square(D), axis=0))
+	
+	# Unit normal of each face, pointing into the cell (out of it for the exit face)
+	if last:
+		exit = None
+	normals = array([getFaceVF(vert, i, exit) for i in range(n)]).T
+	
+	if exit is None:
+		# Head for the middle of the cell
+		target = vert.mean(axis=1)
 	else:
-		Vf = [0, 0]
-	Vc = getCellVF(p, vert, exit)
-	Vel = getGlobalVF(b, Vf, Vc)
-	return Vel
+		target = A[:, exit] + D[:, exit]/float(2)
+	
+	return {'start': A, 'direction': D, 'length': length, 'normals': normals,
+		'target': target, 'exit': exit, 'last': last}
+
+
+def makeController(params):
+	"""
+	Return a function that takes the current x-y position of the robot and returns
+	the velocity vector, using parameters from getControllerParameters().
+	"""
+	
+	def controller(p):
+		P = array([[p[0]], [p[1]]], dtype=float)
+		return getControllerBatch(P, params)[:, 0]
+	return controller
 
 	
 def getRegion(p, v):
@@ -173,3 +206,75 @@ def getGlobalVF(bp,Vf,Vc):
 	V = bp*Vf + (1 - bp)*Vc
 	V = V / norm(V)
 	return V
+
+
+#*************************************************************************
+#     Vectorized versions
+#*************************************************************************
+#
+# The functions below do the same calculations as getController(), but for a
+# whole batch of points at once (given as a 2 x M array), with the faces of
+# the cell handled together instead of one at a time.
+
+def getRegionBatch(P, params):
+	"""
+	Like getRegion(), for every column of P.  Returns the distances to the faces
+	(No. of faces x M) and the index of the closest face for each point.
+	"""
+	
+	A, D, length = params['start'], params['direction'], params['length']
+	px = P[0][newaxis, :]
+	py = P[1][newaxis, :]
+	cross = abs(D[0][:, newaxis]*(A[1][:, newaxis] - py) - (A[0][:, newaxis] - px)*D[1][:, newaxis])
+	length = length[:, newaxis]
+	d = where(length == 0, abs(px - A[0][:, newaxis]), cross/where(length == 0, 1, length))
+	return d, d.argmin(axis=0)
+
+
+def getSParamBatch(d, ROI):
+	"""
+	Like getSParam(), for every column of d.
+	"""
+	
+	d_min = d[ROI, arange(d.shape[1])]
+	with errstate(divide='ignore', invalid='ignore'):
+		ratio = (d - d_min)/d
+	# On a vertex, both faces are at zero distance
+	ratio[d == 0] = 0
+	ratio[ROI, arange(d.shape[1])] = 1
+	return 1 - prod(ratio, axis=0)
+
+
+def getBumpBatch(s):
+	"""
+	Like getBump(), for an array of s-parameters.
+	"""
+	
+	t = clip(s, 1e-9, 1 - 1e-9)
+	Ls = (1 / t) * exp(-1 / t)
+	Ls_2 = (1 / (1-t)) * exp(-1 / (1-t))
+	b = 1 - Ls / (Ls + Ls_2)
+	b[s <= 0] = 1
+	b[s >= 1] = 0
+	return b
+
+
+def getControllerBatch(P, params):
+	"""
+	Return the velocity vectors (2 x M) at each of the points in the columns of P,
+	using parameters from getControllerParameters().
+	"""
+	
+	P = asarray(P, dtype=float)
+	d, ROI = getRegionBatch(P, params)
+	b = getBumpBatch(getSParamBatch(d, ROI))
+	
+	Vf = params['normals'][:, ROI]
+	
+	Vc = params['target'][:, newaxis] - P
+	Vc_norm = sqrt(sum(square(Vc), axis=0))
+	Vc = Vc / where(Vc_norm > 0, Vc_norm, 1)
+	
+	V = b*Vf + (1 - b)*Vc
+	V_norm = sqrt(sum(square(V), axis=0))
+	return V / where(V_norm > 0, V_norm, 1)
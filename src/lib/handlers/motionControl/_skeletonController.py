@@ -31,9 +31,7 @@ class motionControlHandler:
         pose = self.pose_handler.getPose()
 
         # NOTE: Information about region geometry can be found in self.rfi.regions:
-        pointArray = [x for x in self.rfi.regions[current_reg].getPoints()]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        vertices = mat(pointArray).T 
+        vertices = mat(self.rfi.getLabVertices(current_reg)).T
 
         # TODO: Calculate a velocity vector in the *GLOBAL REFERENCE FRAME* 
         # that will get us on our way to the next region
@@ -10,19 +10,44 @@ Uses the heat-controller to take a current position, current region, and destina
 import __heatControllerHelper as heatControllerHelper
 from numpy import *
 from __is_inside import is_inside
-import time
+import time, os, threading
+import cPickle
+import fileMethods
+from multiprocessing import Pool, cpu_count
 
 class motionControlHandler:
-    def __init__(self, proj, shared_data):
+    def __init__(self, proj, shared_data, precompute=True, persist=True):
         """
         Heat motion planning controller
+
+        precompute (bool): Calculate the controllers for all region transitions in the background at startup (default=True)
+        persist (bool): Save calculated controllers to a file next to the project and reuse them on later runs (default=True)
         """
         self.drive_handler = proj.h_instance['drive']
         self.pose_handler = proj.h_instance['pose']
         self.fwd_coordmap = proj.coordmap_map2lab
+        self.rev_coordmap = proj.coordmap_lab2map
         self.rfi = proj.rfi
         self.last_warning = 0
 
+        # (current, next, exit face, last) -> controller
+        self.controllers = {}
+
+        # region geometry key -> controller parameters (see heatControllerHelper.getControllerParameters())
+        self.parameters = {}
+        self.pending = {}   # geometry key -> AsyncResult, for parameters being calculated in the background
+        self.unsaved = False    # whether there are parameters that aren't in the cache file yet
+        self.lock = threading.Lock()
+        self.pool = None
+
+        self.cache_file = None
+        if persist and proj.project_root is not None:
+            self.cache_file = proj.getFilenamePrefix() + "_heat.cache"
+            self.loadParameters()
+
+        if precompute:
+            self.precomputeControllers()
+
     def gotoRegion(self, current_reg, next_reg, last=False):
         """
         If ``last`` is true, we will move to the center of the region.
@@ -44,8 +69,7 @@ class motionControlHandler:
         self.drive_handler.setVelocity(X[0,0], X[1,0], pose[2])
         
         # Transform the region vertices into real coordinates
-        pointArray = [self.fwd_coordmap(x) for x in self.rfi.regions[next_reg].getPoints()]
-        vertices = mat(pointArray).T 
+        vertices = mat(self.rfi.getLabVertices(next_reg)).T
 
         # Figure out whether we've reached the destination region
         if is_inside([pose[0], pose[1]], vertices):
@@ -56,69 +80,188 @@ class motionControlHandler:
         if (arrived != (not inside)) and (time.time()-self.last_warning) > 0.5:
             print "WARNING: Left current region but not in expected destination region"
             # Figure out what region we think we stumbled into
-            for r in self.rfi.regions:
-                pointArray = [self.fwd_coordmap(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T 
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    print "I think I'm in " + r.name
-                    print pose
-                    break
+            r = self.rfi.regionContainingPoint(*self.rev_coordmap(pose[0:2]))
+            if r is not None:
+                print "I think I'm in " + self.rfi.regions[r].name
+                print pose
             self.last_warning = time.time()
 
         return arrived
 
 
-    def get_controller(self, current, next, last, cache={}):
+    def get_controller(self, current, next, last):
         """
         Wrapper for the controller factory, with caching.
         """
 
-        # Check to see if we already have an appropriate controller stored in the cache.
-        # TODO: Account for last in cache
+        transFaceIdx = self.get_exit_face(current, next, last)
 
-        if current in cache and next in cache[current]:
-            return cache[current][next]
+        # Check to see if we already have an appropriate controller stored in the cache.
+        key = (current, next, transFaceIdx, last)
+        if key not in self.controllers:
+            # Let's go get a controller!
+            params = self.get_parameters(current, transFaceIdx, last)
+            self.controllers[key] = heatControllerHelper.makeController(params)
 
-        # If not, create a space in the cache to put our new controller.
+        return self.controllers[key]
 
-        cache[current] = {}
-        
-        # Let's go get a controller!
+    def get_exit_face(self, current, next, last):
+        """
+        Return the index of the face of region ``current`` to leave through to get to region ``next``,
+        or None if ``last`` is true.
+        """
 
         if last:
-            transFaceIdx = None
-        else:
-            # Find a face to go through
-            # TODO: Account for non-determinacy?
-            # For now, let's just choose the largest face available, because we are probably using a big clunky robot
-            # TODO: Why don't we just store this as the index?
-            transFaceIdx = None
-            max_magsq = 0
-            for i, face in enumerate(self.rfi.regions[current_reg].getFaces()):
-                if face not in self.rfi.transitions[current_reg][next_reg]:
-                    continue
-
-                tf_pta, tf_ptb = face
-                tf_vector = tf_ptb - tf_pta
-                magsq = (tf_vector.x)**2 + (tf_vector.y)**2
-                if magsq > max_magsq:
-                    transFaceIdx = i
-                    max_magsq = magsq
-                
-            if transFaceIdx is None:
-                print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.rfi.regions[current_reg].name, self.rfi.regions[next_reg].name)
-         
-        # Transform the region vertices into real coordinates
-        pointArray = [x for x in self.rfi.regions[current].getPoints()]
-        pointArray = map(self.fwd_coordmap, pointArray)
-        vertices = mat(pointArray).T 
-        
-        # Get a controller function
-        controller = heatControllerHelper.getController(vertices, transFaceIdx, last)
+            return None
+
+        # Find a face to go through
+        # TODO: Account for non-determinacy?
+        # For now, let's just choose the largest face available, because we are probably using a big clunky robot
+        # TODO: Why don't we just store this as the index?
+        transFaceIdx = None
+        max_magsq = 0
+        for i, face in enumerate(self.rfi.regions[current].getFaces()):
+            if face not in self.rfi.transitions[current][next]:
+                continue
+
+            tf_pta, tf_ptb = face
+            tf_vector = tf_ptb - tf_pta
+            magsq = (tf_vector.x)**2 + (tf_vector.y)**2
+            if magsq > max_magsq:
+                transFaceIdx = i
+                max_magsq = magsq
+            
+        if transFaceIdx is None:
+            print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.rfi.regions[current].name, self.rfi.regions[next].name)
+
+        return transFaceIdx
+
+    def get_vertices(self, region):
+        """ Transform the region vertices into real coordinates """
+        return mat(self.rfi.getLabVertices(region)).T
+
+    def geometry_key(self, vertices, transFaceIdx, last):
+        """ Key that identifies a controller by the geometry it was calculated for """
+        return (tuple(round(v, 6) for v in vertices.A.flat), transFaceIdx, last)
+
+    def get_parameters(self, current, transFaceIdx, last):
+        """
+        Return the precalculated controller parameters for leaving region ``current`` through
+        face ``transFaceIdx``, calculating them (or waiting for the background calculation) if necessary.
+        """
+
+        vertices = self.get_vertices(current)
+        key = self.geometry_key(vertices, transFaceIdx, last)
+
+        with self.lock:
+            if key in self.parameters:
+                return self.parameters[key]
+            pending = self.pending.get(key)
+
+        params = None
+        if pending is not None and pending.ready():
+            try:
+                params = pending.get()
+            except Exception, e:
+                print "WARNING: Background heat controller calculation failed (%s)" % e
+
+        if params is None:
+            # Get a controller function
+            params = heatControllerHelper.getControllerParameters(vertices, transFaceIdx, last)
+
+        # These are saved along with the background results, or when we stop
+        with self.lock:
+            self.parameters[key] = params
+            self.pending.pop(key, None)
+            self.unsaved = True
+
+        return params
+
+    def precomputeControllers(self):
+        """
+        Start calculating the controller parameters for every transition in the region file
+        (and for stopping in every region) on a process pool, so that they are ready by the
+        time we need them.
+        """
+
+        jobs = {}
+        for current in xrange(len(self.rfi.regions)):
+            for next in self.rfi.transitions.neighbors(current):
+                if current != next:
+                    jobs[(current, self.get_exit_face(current, next, False), False)] = None
+            jobs[(current, None, True)] = None
+
+        jobs = [(self.get_vertices(current), transFaceIdx, last) for current, transFaceIdx, last in jobs
+                if last or transFaceIdx is not None]
+        jobs = [(self.geometry_key(*job), job) for job in jobs]
+        jobs = [(key, job) for key, job in jobs if key not in self.parameters]
+        if not jobs:
+            return
+
+        try:
+            self.pool = Pool(min(len(jobs), cpu_count()))
+        except (OSError, NotImplementedError), e:
+            print "WARNING: Could not start process pool for heat controllers (%s)" % e
+            return
+
+        def store(key):
+            def callback(params):
+                with self.lock:
+                    self.parameters[key] = params
+                    self.pending.pop(key, None)
+                    self.unsaved = True
+                    done = not self.pending
+                if done:
+                    self.saveParameters()
+            return callback
+
+        with self.lock:
+            for key, job in jobs:
+                self.pending[key] = self.pool.apply_async(heatControllerHelper.getControllerParameters, job,
+                                                          callback=store(key))
+        self.pool.close()
+
+    def loadParameters(self):
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return
+
+        try:
+            with open(self.cache_file, 'rb') as f:
+                self.parameters.update(cPickle.load(f))
+        except Exception, e:
+            print "WARNING: Could not load heat controller cache %s (%s)" % (self.cache_file, e)
+
+    def saveParameters(self):
+        """
+        Write the controller parameters to the cache file, if any have been added since
+        it was last written.  The file is written under a temporary name and then renamed,
+        so that it is never left half-written.
+        """
+
+        if self.cache_file is None:
+            return
+
+        with self.lock:
+            if not self.unsaved:
+                return
+
+            def write(tmpname):
+                with open(tmpname, 'wb') as f:
+                    cPickle.dump(self.parameters, f, cPickle.HIGHEST_PROTOCOL)
 
-        # Cache it in
-        cache[current][next] = controller
+            try:
+                fileMethods.replaceFile(self.cache_file, write)
+            except (IOError, OSError), e:
+                print "WARNING: Could not save heat controller cache %s (%s)" % (self.cache_file, e)
+            else:
+                self.unsaved = False
 
-        return controller
+    def _stop(self):
+        # Don't leave the worker processes behind; anything they haven't finished
+        # yet will just be calculated again next time
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
 
+        self.saveParameters()
@@ -25,8 +25,12 @@ class motionControlHandler:
         # Get information about regions
         self.rfi = proj.rfi
         self.coordmap_map2lab = proj.coordmap_map2lab
+        self.coordmap_lab2map = proj.coordmap_lab2map
         self.last_warning = 0
 
+        # Controllers already calculated for each transition
+        self.controllers = {}
+
     def gotoRegion(self, current_reg, next_reg, last=False):
         """
         If ``last`` is True, we will move to the center of the destination region.
@@ -50,10 +54,43 @@ class motionControlHandler:
             time.sleep(1)
             return False
 
+        # Run algorithm to find a velocity vector (global frame) to take the robot to the next region
+        controller = self.get_controller(current_reg, next_reg, last)
+        V = controller([pose[0], pose[1]])
+
+        # Pass this desired velocity on to the drive handler
+        self.drive_handler.setVelocity(V[0], V[1], pose[2])
+        
+        vertices = mat(self.rfi.getLabVertices(current_reg)).T
+        departed = not is_inside([pose[0], pose[1]], vertices)
+        vertices = mat(self.rfi.getLabVertices(next_reg)).T
+        # Figure out whether we've reached the destination region
+        arrived = is_inside([pose[0], pose[1]], vertices)
+
+        if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
+            #print "WARNING: Left current region but not in expected destination region"
+            # Figure out what region we think we stumbled into
+            r = self.rfi.regionContainingPoint(*self.coordmap_lab2map(pose[0:2]))
+            #if r is not None:
+            #    print "I think I'm in " + self.rfi.regions[r].name
+            #    print pose
+            self.last_warning = time.time()
+
+        return arrived
+
+    def get_controller(self, current, next, last):
+        """
+        Return the controller for leaving region ``current`` for region ``next``
+        (or for moving to the center of ``current``, if ``last`` is True), calculating it
+        the first time that transition is needed.
+        """
+
+        key = (current, next, last)
+        if key in self.controllers:
+            return self.controllers[key]
+
         # NOTE: Information about region geometry can be found in self.rfi.regions:
-        pointArray = [x for x in self.rfi.regions[current_reg].getPoints()]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        vertices = mat(pointArray).T 
+        vertices = mat(self.rfi.getLabVertices(current)).T
 
         if last:
             transFaceIdx = None
@@ -64,8 +101,8 @@ class motionControlHandler:
             # TODO: Why don't we just store this as the index?
             transFaceIdx = None
             max_magsq = 0
-            for i, face in enumerate(self.rfi.regions[current_reg].getFaces()):
-                if face not in self.rfi.transitions[current_reg][next_reg]:
+            for i, face in enumerate(self.rfi.regions[current].getFaces()):
+                if face not in self.rfi.transitions[current][next]:
                     continue
 
                 tf_pta, tf_ptb = face
@@ -76,33 +113,9 @@ class motionControlHandler:
                     max_magsq = magsq
                 
             if transFaceIdx is None:
-                print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.rfi.regions[current_reg].name, self.rfi.regions[next_reg].name)
-         
-
-		# Run algorithm to find a velocity vector (global frame) to take the robot to the next region
-        V = vectorControllerHelper.getController([pose[0], pose[1]], vertices, transFaceIdx)
-
-        # Pass this desired velocity on to the drive handler
-        self.drive_handler.setVelocity(V[0], V[1], pose[2])
-        
-        departed = not is_inside([pose[0], pose[1]], vertices)
-        pointArray = [x for x in self.rfi.regions[next_reg].getPoints()]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        vertices = mat(pointArray).T 
-        # Figure out whether we've reached the destination region
-        arrived = is_inside([pose[0], pose[1]], vertices)
+                print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.rfi.regions[current].name, self.rfi.regions[next].name)
 
-        if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
-            #print "WARNING: Left current region but not in expected destination region"
-            # Figure out what region we think we stumbled into
-            for r in self.rfi.regions:
-                pointArray = [self.coordmap_map2lab(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T 
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    #print "I think I'm in " + r.name
-                    #print pose
-                    break
-            self.last_warning = time.time()
+        params = vectorControllerHelper.getControllerParameters(vertices, transFaceIdx, last)
+        self.controllers[key] = vectorControllerHelper.makeController(params)
 
-        return arrived
+        return self.controllers[key]
@@ -11,11 +11,12 @@ from numpy import *
 from simulator.ode.pioneer import DiffDriveSim
 
 class PioneerODEInitHandler:
-    def __init__(self, proj, init_region):
+    def __init__(self, proj, init_region, headless=False):
         """
         Initialization handler for pioneer ode simulated robot.
 
         init_region (region): The name of the region where the simulated robot starts
+        headless (bool): Run the simulator without drawing it, so that no display is needed (default=False)
         """
 
         
@@ -53,7 +54,10 @@ class PioneerODEInitHandler:
         regc =  str(region_calib)
         UDPServer = subprocess.Popen([sys.executable,os.path.join(proj.ltlmop_root,"lib","simulator","ode","pioneer","UDPServer.py")], stderr=subprocess.PIPE, stdin=subprocess.PIPE)
                 
-        drive = subprocess.Popen([sys.executable,os.path.join(proj.ltlmop_root,"lib", "simulator","ode","pioneer", "PioneerSim.py"), regionfile,regc,pose])
+        options = []
+        if headless:
+            options.append("--headless")
+        drive = subprocess.Popen([sys.executable,os.path.join(proj.ltlmop_root,"lib", "simulator","ode","pioneer", "PioneerSim.py")] + options + [regionfile,regc,pose])
         
         
     def getSharedData(self):
@@ -192,13 +192,8 @@ class initHandler:
         """
         This function takes in the region points and make it a Polygon.
         """
-        if hole == None:
-            pointArray = [x for x in region.getPoints()]
-        else:
-            pointArray = [x for x in region.getPoints(hole_id = hole)]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        regionPoints = [(pt[0],pt[1]) for pt in pointArray]
-        formedPolygon= Polygon.Polygon(regionPoints)
+        regionPoints = self.proj.coordTransform.map2lab(region.getPoints(hole_id = hole))
+        formedPolygon= Polygon.Polygon(regionPoints.tolist())
         return formedPolygon
     
     def addBox(self,i,length,depth , height, pose):
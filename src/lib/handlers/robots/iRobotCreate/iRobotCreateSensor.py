@@ -241,12 +241,10 @@ class sensorHandler:
         if len(raw) > 0:
             #print 'I see some markers in the raw vicon stream!'
             # first find current region
-            curr_region = 0
             map_pose = self.proj.coordmap_lab2map(pose[0:2])
-            for i in range(0,len(regions)):
-                if regions[i].objectContainsPoint(map_pose[0],map_pose[1]):
-                    curr_region = i
-                    break
+            curr_region = self.rfi.regionContainingPoint(map_pose[0],map_pose[1])
+            if curr_region is None:
+                curr_region = 0
             #print 'time to see if any of them lie in the region: ',curr_region
 
             for i in range(0,len(raw)):
@@ -160,12 +160,12 @@ class SensorEditorFrame(wx.Frame):
 
         x = event.GetX()/self.map_scales[panel_key]
         y = event.GetY()/self.map_scales[panel_key]
-        for region in self.decomposedRFI.regions:
-            if region.objectContainsPoint(x, y):
-                if region.name != self.map_state[panel_key]:
-                    self.map_state[panel_key] = region.name
-                    self.UDPSock.sendto(panel_key + "=" + region.name, self.addr)
-                break
+        region_idx = self.decomposedRFI.regionContainingPoint(x, y)
+        if region_idx is not None:
+            region = self.decomposedRFI.regions[region_idx]
+            if region.name != self.map_state[panel_key]:
+                self.map_state[panel_key] = region.name
+                self.UDPSock.sendto(panel_key + "=" + region.name, self.addr)
 
         self.onResize() # Force map redraw
         event.Skip()
@@ -1,14 +1,146 @@
 #!/usr/bin/env python
 
-import math,re, os, random
+import math,re, os, random, copy
+import cPickle
 import Polygon, Polygon.IO, Polygon.Utils
 import project
 from regions import *
 import itertools
 import decomposition
+from multiprocessing import Pool, cpu_count
 
 Polygon.setTolerance(0.1)
 
+# Set to False to run the per-region and per-portion jobs serially, e.g. for debugging
+USE_MULTIPROCESSING = True
+
+def runMap(function, inputs):
+    """ Wrapper for single- and multi-process versions of map, to make
+        it easy to disable multiprocessing for debugging purposes.
+        Outputs are always in the same order as the inputs.
+    """
+    inputs = list(inputs)
+
+    if USE_MULTIPROCESSING and len(inputs) > 1:
+        try:
+            pool = Pool(min(len(inputs), cpu_count()))
+        except (OSError, NotImplementedError), e:
+            print "WARNING: Could not start process pool (%s); running serially" % e
+        else:
+            try:
+                return pool.map(function, inputs, chunksize = 1)
+            finally:
+                pool.terminate()
+
+    return map(function, inputs)
+
+def findRegionNearJob(args):
+    region, dist, name = args
+    return region.findRegionNear(dist,mode="overEstimate",name=name)
+
+def findRegionBetweenJob(args):
+    regionA, regionB, name = args
+    return findRegionBetween(regionA,regionB,name=name)
+
+class LocativeRegionCache(object):
+    """
+    Remembers the regions generated for locative prepositions ("near", "within", "between"),
+    keyed by the geometry of the regions they were generated from, so that they don't need to be
+    recomputed on every compile.  Entries are kept in memory for the life of the process, and
+    in a file next to the project.
+    """
+
+    # Version of the generated regions.  Change it whenever the way they are generated
+    # changes (e.g. regions.offsetPolygon()), so that entries made by older code are ignored.
+    VERSION = 1
+
+    # shared by all compiles in this process
+    memory = {}
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.entries = {} # the entries used by this compile, which are what gets saved
+        self.stored = {}  # entries loaded from the cache file
+
+        if filename is not None and os.path.exists(filename):
+            try:
+                with open(filename, 'rb') as f:
+                    self.stored = cPickle.load(f)
+            except Exception, e:
+                print "WARNING: Could not load locative region cache %s (%s); ignoring it" % (filename, e)
+                self.stored = {}
+
+    @staticmethod
+    def geometryKey(region):
+        return (tuple((pt.x, pt.y) for pt in region.getPoints()),
+                tuple(tuple((pt.x, pt.y) for pt in region.getPoints(hole_id=i)) for i in xrange(len(region.holeList))))
+
+    @staticmethod
+    def colorKey(region):
+        return tuple(region.color[i] for i in xrange(3))
+
+    @classmethod
+    def nearKey(cls, region, distance, mode):
+        # the color of the new region is derived from that of the old one
+        return (cls.VERSION, 'near', mode, distance, cls.colorKey(region), cls.geometryKey(region))
+
+    @classmethod
+    def betweenKey(cls, regionA, regionB):
+        return (cls.VERSION, 'between', cls.colorKey(regionA), cls.geometryKey(regionA),
+                cls.colorKey(regionB), cls.geometryKey(regionB))
+
+    def get(self, key, name):
+        """ Return a copy of the cached region for key, renamed to name, or None """
+        region = self.memory.get(key, self.stored.get(key))
+        if region is None:
+            return None
+
+        self.memory[key] = self.entries[key] = region
+        region = copy.deepcopy(region)
+        region.name = name
+        return region
+
+    def put(self, key, region):
+        if region is not None:
+            self.memory[key] = self.entries[key] = copy.deepcopy(region)
+
+    def save(self):
+        if self.filename is None or set(self.entries) == set(self.stored):
+            return
+
+        try:
+            with open(self.filename, 'wb') as f:
+                cPickle.dump(self.entries, f, cPickle.HIGHEST_PROTOCOL)
+        except IOError, e:
+            print "WARNING: Could not save locative region cache %s (%s)" % (self.filename, e)
+
+def decomposePortion(args):
+    """
+    Decompose one portion into convex polygons, using the given method
+    Return a list of polygons
+    """
+    poly, method = args
+
+    if len(poly)>1:
+        # the polygon contains holes
+        holes = [] # list holds polygon stands for holes
+        for i,contour in enumerate(poly):
+            if poly.isHole(i):
+                holes.append(Polygon.Polygon(poly[i]))
+            else:
+                newPoly = Polygon.Polygon(poly[i])
+                
+        de = decomposition.decomposition(newPoly,holes)
+    else:
+        # if the polygon doesn't have any hole, decompose it if it is concave, 
+        # nothing will be done if it is convex
+        de = decomposition.decomposition(poly)
+
+    if method == "hertel_mehlhorn":
+        return de.hertelMehlhorn()
+    else:
+        return de.MP5()
+
 class parseLP:
     """
     A parser to parse the locative prepositions in specification
@@ -96,14 +228,16 @@ class parseLP:
         Generate new regions for locative prepositions
         """
         
+        cache = LocativeRegionCache(self.proj.getFilenamePrefix()+'_locative.cache')
+
         # regions related with "near/within" preposition
+        jobs = []
         for (regionName,dist) in self.regionNear:
             for region in self.proj.rfi.regions:
                 if region.name == regionName:
                     oldRegion = region
-            newRegion = oldRegion.findRegionNear(dist,mode="overEstimate",name='near$'+regionName+'$'+str(dist))
-            self.proj.rfi.regions.append(newRegion)
-            
+            jobs.append((findRegionNearJob, cache.nearKey(oldRegion,dist,"overEstimate"),
+                         (oldRegion,dist,'near$'+regionName+'$'+str(dist))))
             
         # regions related with "between" preposition
         for (regionNameA,regionNameB) in self.regionBetween:
@@ -114,8 +248,28 @@ class parseLP:
                 elif region.name == regionNameB:
                     regionB = region
                     
-            newRegion = findRegionBetween(regionA,regionB,name='between$'+regionNameA+'$and$'+regionNameB+"$")
-            self.proj.rfi.regions.append(newRegion)            
+            jobs.append((findRegionBetweenJob, cache.betweenKey(regionA,regionB),
+                         (regionA,regionB,'between$'+regionNameA+'$and$'+regionNameB+"$")))
+
+        # only compute the regions we haven't seen before (each one just once)
+        newRegions = [cache.get(key, args[-1]) for function, key, args in jobs]
+        missing = {}
+        for (function, key, args), newRegion in zip(jobs, newRegions):
+            if newRegion is None and key not in missing:
+                missing[key] = (function, args)
+
+        # the new regions are independent of each other, so compute them all at once
+        for function in (findRegionNearJob, findRegionBetweenJob):
+            keys = [key for key in missing if missing[key][0] is function]
+            for key, newRegion in zip(keys, runMap(function, [missing[key][1] for key in keys])):
+                cache.put(key, newRegion)
+
+        for i, (function, key, args) in enumerate(jobs):
+            if newRegions[i] is None:
+                newRegions[i] = cache.get(key, args[-1])
+
+        self.proj.rfi.regions.extend(newRegions)
+        cache.save()
             
     def checkOverLapping(self):
         """
@@ -134,25 +288,13 @@ class parseLP:
         oldRegionNames = sorted(self.oldPolys.keys())
         self.newPolysMap['others'] = [] # parts out side of all regions
         
-        # set up a iterator of lists of boolean value (0/1) for finding overlapping regions
-        # each item is corrsponding to one possible overlapping
-        # each boolean value is corresponding to one region
-        boolList = itertools.product([0,1],repeat=len(oldRegionNames))
+        # enumerate the non-empty portions of the boundary for each combination of
+        # included (inside) and excluded (outside) regions
+        boundary = self.intAllPoints(Polygon.Polygon([(pt.x,pt.y) for pt in self.boundaryRegion.getPoints()])) # starts with the boundary region
         
         self.count = 1 # for naming the portion
         # break the overlapping regions
-        for expr in boolList:
-            tempRegionList = []
-            result = self.intAllPoints(Polygon.Polygon([(pt.x,pt.y) for pt in self.boundaryRegion.getPoints()])) # starts with the boundary region
-            for i,item in enumerate(expr):
-                if item == 1:
-                    # when the region is included
-                    result = result & self.oldPolys[oldRegionNames[i]]
-                    tempRegionList.append(oldRegionNames[i])
-                else:
-                    # when the region is excluded
-                    result = result - self.oldPolys[oldRegionNames[i]]
-                   
+        for tempRegionList, result in self.overlayRegions(boundary, oldRegionNames):
             if result.nPoints()>0:
                 # there is a portion of region left
                 holeList = []
@@ -180,6 +322,45 @@ class parseLP:
                         self.count = self.count + 1
 
         
+    def overlayRegions(self, boundary, regionNames):
+        """
+        Generate (names of included regions, polygon) for every non-empty portion of the boundary
+        obtained by intersecting it with some of the given regions and subtracting all the others.
+
+        The portions come out in the same order as a plain enumeration of all 2^n include/exclude
+        combinations (first region most significant, excluded before included), but whole
+        branches are pruned as soon as the partial result becomes empty, or when an included
+        region's bounding box does not even overlap it, so only actually overlapping clusters
+        of regions are explored.
+        """
+
+        boxes = [self.oldPolys[name].boundingBox() for name in regionNames]
+
+        def boxesOverlap(a, b):
+            # boundingBox() returns (xmin, xmax, ymin, ymax)
+            return a[0] <= b[1] and b[0] <= a[1] and a[2] <= b[3] and b[2] <= a[3]
+
+        def refine(result, i, included):
+            if result.nPoints() == 0:
+                # nothing left; no combination in this branch can produce a portion
+                return
+            if i == len(regionNames):
+                yield included, result
+                return
+
+            region = self.oldPolys[regionNames[i]]
+
+            # when the region is excluded
+            for portion in refine(result - region, i + 1, included):
+                yield portion
+
+            # when the region is included
+            if boxesOverlap(result.boundingBox(), boxes[i]):
+                for portion in refine(result & region, i + 1, included + [regionNames[i]]):
+                    yield portion
+
+        return refine(boundary, 0, [])
+
     def decomposeWithOverlappingPoint(self,polygon):
         """
         When there are points overlapping each other in a given polygon
@@ -221,25 +402,13 @@ class parseLP:
         tempDic = {} # temporary variable for storing polygon
                      # will be merged at the end to self.portionOfRegion
 
-        for nameOfPortion,poly in self.portionOfRegion.iteritems():
-            result = [] # result list of polygon from decomposition
-            if len(poly)>1:
-                # the polygon contains holes
-                holes = [] # list holds polygon stands for holes
-                for i,contour in enumerate(poly):
-                    if poly.isHole(i):
-                        holes.append(Polygon.Polygon(poly[i]))
-                    else:
-                        newPoly = Polygon.Polygon(poly[i])
-                        
-                de = decomposition.decomposition(newPoly,holes)
-                result = de.MP5()
-            else:
-                # if the polygon doesn't have any hole, decompose it if it is concave, 
-                # nothing will be done if it is convex
-                de = decomposition.decomposition(poly)
-                result = de.MP5()
-            
+        # decompose all the portions at once; new portions are then named in the same order
+        # as when running serially, so the output does not depend on the number of processes
+        method = self.proj.compile_options.get("decomposition_method", "mp5")
+        portions = self.portionOfRegion.items()
+        results = runMap(decomposePortion, [(poly, method) for nameOfPortion,poly in portions])
+
+        for (nameOfPortion,poly),result in zip(portions, results):
             if len(result)>1:
                 # the region is decomposed to smaller parts
                 newPortionName=[]
@@ -333,12 +502,13 @@ class parseLP:
                 
             self.proj.rfi.regions.append(newRegion)
         
-        # Giant loop!
-        for obj1 in self.proj.rfi.regions:
-            for obj2 in self.proj.rfi.regions:
-                self.proj.rfi.splitSubfaces(obj1, obj2)
+        # Split any faces that partially overlap those of neighbouring regions
+        self.proj.rfi.splitAllSubfaces()
 
         self.proj.rfi.recalcAdjacency()
-        self.proj.rfi.writeFile(fileName)
+        if self.proj.compile_options.get("binary_regions", False):
+            self.proj.rfi.writeBinaryFile(fileName)
+        else:
+            self.proj.rfi.writeFile(fileName)
         
 
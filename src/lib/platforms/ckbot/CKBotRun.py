@@ -2,6 +2,7 @@
 
 import pygame
 import math, time, copy, sys, os
+import numpy
 sys.path.append("../../../../../Downloads/CKBot/trunk")
 from ckbot.logical import Cluster
 
@@ -176,6 +177,33 @@ class CKBotRun:
 						temprow.append( float(elem)*(math.pi/180.0)*(1/100.0) )
 					gaitrows.append(temprow)		    
 
+		self.compileGaits()
+
+	def compileGaits(self):
+		"""
+		Converts the gaits into arrays that the reference angles of all the modules
+		can be computed from at once (see gaitangles()).  Like in the simulator, any
+		entries in a row past the number of modules are ignored.
+		"""
+
+		nummodules = len(self.connM)
+		self.compiled_gaits = []
+		for gait in self.gaits:
+			# ROW 1: Amplitudes, ROW 2: Frequencies, ROW 3: Phases
+			if self.gaittype == "Periodic":
+				self.compiled_gaits.append(tuple(numpy.array(row[:nummodules], dtype=float) for row in gait[0:3]))
+
+			# The time the gait loops in, followed by a table of reference angles evenly spaced in time.
+			else:
+				gaittime = float(gait[0])
+				table = numpy.array([row[:nummodules] for row in gait[1:]], dtype=float)
+				if len(table) > 1 and gaittime > 0:
+					singletime = gaittime/(len(table)-1)
+				else:
+					# A single row (or no time to move in) just holds that pose.
+					singletime = 0.0
+				self.compiled_gaits.append((gaittime, singletime, table))
+
 	def getKeyOrders(self,config):
 		"""
 		Get the Key Orders from the KeyOrders.txt file for Module ID correspondence.
@@ -210,69 +238,36 @@ class CKBotRun:
 		"""
 
 		t = time.time() - self.starttime
-		gait = self.gaits[self.gait - 1]
 
 		# If the gait is set to zero, stop moving all hinges.
 		if self.gait == 0:
 			pass
 
 		else:
-	
-			#If the gait is of periodic type, read the rows in the following format.
-			#ROW 1: Amplitudes
-			#ROW 2: Frequencies
-			#ROW 3: Phases
-			if self.gaittype == "Periodic":
-				for module_idx in range(len(self.connM)):
-					amplitude = gait[0][module_idx]
-					frequency = gait[1][module_idx]
-					phase = gait[2][module_idx]
-
-					ref_ang = amplitude*math.sin(frequency*t*0.25 + phase)
+			ref_angs = self.gaitangles(self.compiled_gaits[self.gait - 1], t)*(0.5*18000.0/math.pi)
+			for module_idx in range(len(self.connM)):
+				self.cluster[self.key_orders[module_idx]].set_pos(ref_angs[module_idx])
 
-					ref_ang = ref_ang*(0.5*18000.0/math.pi)
-		
-					self.cluster[self.key_orders[module_idx]].set_pos(ref_ang)
-
-			# If the gait is of fixed type, run the function "gaitangle" to interpolate between
-			# reference hinge angles at the current time.
-			else:
-				for module_idx in range(len(self.connM)):   
-					ref_ang = self.gaitangle(gait,t,module_idx)
-	
-					ref_ang = ref_ang*(0.5*18000.0/math.pi)
-		
-					self.cluster[self.key_orders[module_idx]].set_pos(ref_ang)
-
-	def gaitangle(self,gait,time,module):
+	def gaitangles(self,compiled,time):
 		"""
-		Takes in a gait matrix and returns the reference angle at that point in time.
+		Takes in a compiled gait and returns an array of the reference angles of all
+		the modules at that point in time.
 		"""
 
-		nummoves = len(gait)-1
-		gaittime = gait[0]
-		singletime = float(gaittime)/(nummoves-1)
+		if self.gaittype == "Periodic":
+			amplitudes, frequencies, phases = compiled
+			return amplitudes*numpy.sin(frequencies*time*0.25 + phases)
 
-		timearray = []
-		for i in range(0,nummoves):
-			if i==0:
-				timearray.append(0)
-			else:
-				timearray.append(timearray[i-1]+singletime)
-	
-		currenttime = (time%gaittime)/singletime
-		globalref = gait[int(math.ceil(currenttime))+1][module]
-		globalprev = gait[int(math.floor(currenttime))+1][module]
-
-		if globalref==globalprev:
-			# If the current time coincides with the time of a given gait angle direction, then there is no need to interpolate.
-			localref = globalref
 		else:
-			# Linear interpolation step.
-			interp = (currenttime*singletime - timearray[int(math.floor(currenttime))])/(timearray[int(math.ceil(currenttime))] - timearray[int(math.floor(currenttime))])
-			localref = globalprev + interp*(globalref-globalprev)
-
-		return localref
+			# Linear interpolation between the two rows of the gait table around the current time.
+			gaittime, singletime, table = compiled
+			if singletime == 0:
+				return table[0].copy()
+			currenttime = (time%gaittime)/singletime
+			prev = int(math.floor(currenttime))
+			next = int(math.ceil(currenttime))
+			interp = currenttime - prev
+			return table[prev] + interp*(table[next] - table[prev])
 
 
 	def run(self):
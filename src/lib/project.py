@@ -41,6 +41,8 @@ class Project:
         self.silent = False
         self.regionMapping = None
         self.rfi = None
+        self.coordTransform = None
+        self.regionGeometry = None
         self.specText = ""
         self.all_sensors = []
         self.enabled_sensors = []
@@ -58,6 +60,9 @@ class Project:
                                 "fastslow": False,  # Enable "fast-slow" synthesis algorithm
                                 "decompose": True,  # Create regions for free space and region overlaps (required for Locative Preposition support)
                                 "use_region_bit_encoding": True, # Use a vector of "bitX" propositions to represent regions, for efficiency
+                                "simplify_ltl": True, # Remove redundant and trivially true subformulas before synthesis
+                                "binary_regions": False, # Save the decomposed regions in the (faster to load) binary region file format
+                                "decomposition_method": "mp5", # Convex decomposition algorithm: MP5 ("mp5") or ear clipping with Hertel-Mehlhorn merging ("hertel_mehlhorn")
                                 "parser": "structured"}  # Spec parser: SLURP ("slurp"), structured English ("structured"), or LTL ("ltl")
 
         # Climb the tree to find out where we are
@@ -128,15 +133,17 @@ class Project:
 
         logging.info("Found definitions for %d regions." % len(rfi.regions))
 
+        rfi.setCoordTransform(self.coordTransform)
+
         return rfi
 
-    def getCoordMaps(self):
+    def getCoordTransform(self):
         """
-        Returns forward (map->lab) and reverse (lab->map) coordinate mapping functions, in that order
+        Returns a regions.CoordinateTransform for the main robot's calibration, or None if there is no configuration
         """
 
         if self.currentConfig is None:
-            return (None, None)
+            return None
 
         r = self.currentConfig.getRobotByName(self.currentConfig.main_robot)
         if r.calibrationMatrix is None:
@@ -150,11 +157,51 @@ class Project:
             logging.warning("Singular calibration matrix.  Ignoring, and using identity matrix.")
             T = eye(3)
 
+        return regions.CoordinateTransform(T)
+
+    def getCoordMaps(self):
+        """
+        Returns forward (map->lab) and reverse (lab->map) coordinate mapping functions, in that order
+        """
+
+        transform = self.getCoordTransform()
+        if transform is None:
+            return (None, None)
+
         #### Create the coordmap functions
-        coordmap_map2lab = lambda pt: (linalg.inv(T) * mat([pt[0], pt[1], 1]).T).T.tolist()[0][0:2]
-        coordmap_lab2map = lambda pt: (T * mat([pt[0], pt[1], 1]).T).T.tolist()[0][0:2]
+        return transform.map2labPoint, transform.lab2mapPoint
+
+    def updateCoordMaps(self):
+        """
+        (Re)compute the coordinate mappings from the current calibration, and pass them on to the
+        loaded regions.  This needs to be called again whenever the calibration changes.
+        """
+
+        self.coordTransform = self.getCoordTransform()
+        if self.coordTransform is None:
+            self.coordmap_map2lab, self.coordmap_lab2map = (None, None)
+        else:
+            self.coordmap_map2lab, self.coordmap_lab2map = self.coordTransform.map2labPoint, self.coordTransform.lab2mapPoint
+
+        for rfi in (self.rfi, getattr(self, "rfiold", None)):
+            if rfi is not None:
+                rfi.setCoordTransform(self.coordTransform)
+
+    def getRegionGeometry(self):
+        """
+        Returns the regions.RegionGeometry shared by the motion controllers, for the current regions
+        and calibration, or None if there are no regions or no calibration.  A new one is made
+        whenever either of them changes.
+        """
+
+        if self.rfi is None or self.coordTransform is None:
+            return None
+
+        if self.regionGeometry is None or self.regionGeometry.rfi is not self.rfi \
+                or self.regionGeometry.transform is not self.coordTransform:
+            self.regionGeometry = regions.RegionGeometry(self.rfi, self.coordTransform)
 
-        return coordmap_map2lab, coordmap_lab2map
+        return self.regionGeometry
 
     def loadSpecFile(self, spec_file):
         # Figure out where we should be looking for files, based on the spec file name & location
@@ -181,10 +228,10 @@ class Project:
                     continue
 
                 k,v = l.split(":", 1)
-                if k.strip().lower() == "parser":
+                if isinstance(self.compile_options.get(k.strip().lower()), basestring):
                     self.compile_options[k.strip().lower()] = v.strip().lower()
                 else:
-                    # convert to boolean if not a parser type
+                    # convert to boolean if not a string option (e.g. parser type)
                     self.compile_options[k.strip().lower()] = (v.strip().lower() in ['true', 't', '1'])
 
         return spec_data
@@ -268,7 +315,7 @@ class Project:
         self.currentConfig = self.loadConfig()
         self.regionMapping = self.loadRegionMapping()
         self.rfi = self.loadRegionFile()
-        self.coordmap_map2lab, self.coordmap_lab2map = self.getCoordMaps()
+        self.updateCoordMaps()
         self.determineEnabledPropositions()
 
         return True
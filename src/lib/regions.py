@@ -18,8 +18,9 @@
 import os, sys, copy
 import fileMethods
 import re, random, math
-import Polygon, Polygon.Utils, os
+import Polygon, Polygon.Utils, Polygon.Shapes, os
 import json
+import numpy
 from numbers import Number
 
 Polygon.setTolerance(0.01)
@@ -143,6 +144,514 @@ class prettierJSONEncoder(json.JSONEncoder):
             return super(prettierJSONEncoder, self)._newline_indent()
 
 
+# Binary region files start with this magic string, followed by the format version
+BINARY_REGION_FILE_MAGIC = "LTLMoPRB"
+BINARY_REGION_FILE_VERSION = 1
+
+def isBinaryRegionFile(filename):
+    """
+    Return True if the given file is in the binary region file format (see
+    RegionFileInterface.writeBinaryFile()) rather than the text one.
+    """
+    with open(filename, "rb") as f:
+        return f.read(len(BINARY_REGION_FILE_MAGIC)) == BINARY_REGION_FILE_MAGIC
+
+# Number of decimal places kept when matching up the faces of different regions
+FACE_KEY_PRECISION = 6
+
+def pointKey(pt):
+    """
+    Return a hashable, normalized version of a point, such that points that are
+    equal up to FACE_KEY_PRECISION have the same key.
+    """
+    return (round(pt[0], FACE_KEY_PRECISION), round(pt[1], FACE_KEY_PRECISION))
+
+def faceKey(face):
+    """
+    Return a hashable, normalized version of a face (a pair of points) that does
+    not depend on the order of its endpoints.
+    """
+    return frozenset(pointKey(pt) for pt in face)
+
+class AdjacencyMatrix(object):
+    """
+    Sparse storage for region adjacency.  It can be indexed just like the
+    (# of regions) x (# of regions) list of lists it replaces, i.e.
+    transitions[i][j] is the list of faces shared by regions i and j, and is
+    empty if the regions are not adjacent.
+
+    Only non-empty entries are stored.  Note that for empty entries a new list
+    is returned, so use setFaces() or addFace() instead of modifying it in place.
+    """
+
+    def __init__(self, size=0):
+        self.size = size
+        self.entries = {}   # region index -> {other region index -> list of faces}
+
+    @classmethod
+    def fromLists(cls, lists):
+        """ Create from a dense list-of-lists adjacency matrix """
+        adj = cls(len(lists))
+        for i, row in enumerate(lists):
+            for j, faces in enumerate(row):
+                adj.setFaces(i, j, faces)
+        return adj
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in xrange(*i.indices(self.size))]
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("adjacency matrix index out of range")
+        return AdjacencyRow(self, i)
+
+    def __iter__(self):
+        for i in xrange(self.size):
+            yield AdjacencyRow(self, i)
+
+    def getFaces(self, i, j):
+        return self.entries.get(i, {}).get(j, [])
+
+    def setFaces(self, i, j, faces):
+        if faces:
+            self.entries.setdefault(i, {})[j] = faces
+        elif j in self.entries.get(i, {}):
+            del self.entries[i][j]
+            if not self.entries[i]:
+                del self.entries[i]
+
+    def addFace(self, i, j, face):
+        self.entries.setdefault(i, {}).setdefault(j, []).append(face)
+
+    def removeFace(self, i, j, face):
+        self.setFaces(i, j, [f for f in self.getFaces(i, j) if f is not face])
+
+    def neighbors(self, i):
+        """ Return a sorted list of the indices of all regions adjacent to region i """
+        return sorted(self.entries.get(i, {}).keys())
+
+    def iterTransitions(self):
+        """ Iterate over (region index 1, region index 2, faces) for all adjacent pairs """
+        for i in sorted(self.entries.keys()):
+            row = self.entries[i]
+            for j in sorted(row.keys()):
+                yield i, j, row[j]
+
+class AdjacencyRow(object):
+    """ A view of one row of an AdjacencyMatrix """
+
+    def __init__(self, matrix, index):
+        self.matrix = matrix
+        self.index = index
+
+    def __len__(self):
+        return self.matrix.size
+
+    def __getitem__(self, j):
+        if isinstance(j, slice):
+            return [self[k] for k in xrange(*j.indices(self.matrix.size))]
+        if j < 0:
+            j += self.matrix.size
+        if not 0 <= j < self.matrix.size:
+            raise IndexError("adjacency matrix index out of range")
+        return self.matrix.getFaces(self.index, j)
+
+    def __setitem__(self, j, faces):
+        self.matrix.setFaces(self.index, j, faces)
+
+    def __iter__(self):
+        for j in xrange(self.matrix.size):
+            yield self.matrix.getFaces(self.index, j)
+
+# Maximum number of edge/point pairs tested at once by pointsInPolygon(), to bound memory use
+POINT_TEST_CHUNK_SIZE = 1 << 18
+
+def polygonEdges(vertices):
+    """
+    Precompute the edges of a closed polygon for use with pointsInPolygon().
+    `vertices` is a sequence of points (anything indexable as pt[0], pt[1]) or an
+    (N, 2) array.  Returns a (4, N) array whose rows are the x0, y0, x1, y1
+    coordinates of each edge's endpoints.
+    """
+    v = _pointsToArray(vertices)
+    w = numpy.roll(v, -1, axis=0)
+    return numpy.vstack((v[:, 0], v[:, 1], w[:, 0], w[:, 1]))
+
+def offsetPolygon(vertices, distance):
+    """
+    Push every edge of a closed polygon outwards by `distance`, and cut off each corner with a
+    line at `distance` from the vertex, perpendicular to the corner's bisector.  This gives a
+    polygon that contains every point within `distance` of the original one (if it is convex;
+    otherwise take the convex hull of the result).
+
+    `vertices` is a sequence of points or an (N, 2) array.  Returns a (2N, 2) array holding
+    the two bevel points of each vertex, in order.
+    """
+    v = _pointsToArray(vertices)
+
+    # Drop repeated vertices, which have no direction
+    keep = numpy.any(v != numpy.roll(v, 1, axis=0), axis=1)
+    if keep.any():
+        v = v[keep]
+    if len(v) < 2:
+        return v.copy()
+
+    edges = numpy.roll(v, -1, axis=0) - v
+    normals = numpy.column_stack((edges[:, 1], -edges[:, 0]))
+    normals /= numpy.hypot(normals[:, 0], normals[:, 1])[:, numpy.newaxis]
+
+    # Make the normals point outwards
+    area = numpy.sum(v[:, 0]*numpy.roll(v[:, 1], -1) - numpy.roll(v[:, 0], -1)*v[:, 1])
+    if area < 0:
+        normals = -normals
+
+    # The faces before and after each vertex, and the bisector of their normals
+    n1 = numpy.roll(normals, 1, axis=0)
+    n2 = normals
+    bisectors = n1 + n2
+    length = numpy.hypot(bisectors[:, 0], bisectors[:, 1])
+    # Where the boundary doubles back on itself (a spike of zero width), cut the
+    # corner square to the incoming face, beyond the tip of the spike
+    spike = length < 1e-9
+    incoming = numpy.roll(edges, 1, axis=0)
+    bisectors[spike] = incoming[spike]
+    length[spike] = numpy.hypot(incoming[spike, 0], incoming[spike, 1])
+    bisectors /= length[:, numpy.newaxis]
+
+    # Intersect each offset face with the bevel line through the vertex's corner
+    cosine = numpy.sum(n1*bisectors, axis=1)[:, numpy.newaxis]
+    pt1 = v + distance*(n1 + bisectors)/(1 + cosine)
+    pt2 = v + distance*(n2 + bisectors)/(1 + cosine)
+
+    return numpy.column_stack((pt1, pt2)).reshape(-1, 2)
+
+def _pointsToArray(points):
+    """ Convert a sequence of points (or an array-like) into an (M, 2) float array """
+    if isinstance(points, numpy.ndarray):
+        return numpy.asarray(points, dtype=float).reshape(-1, 2)
+    return numpy.array([(pt[0], pt[1]) for pt in points], dtype=float).reshape(-1, 2)
+
+def _rayCrossingsOdd(edges, x, y):
+    """ Even-odd ray test of the (1, M) point arrays x, y against a (4, N) edge array """
+    x0, y0, x1, y1 = [e[:, numpy.newaxis] for e in edges]
+
+    # Only count edges that straddle the ray.  Each edge includes its lower endpoint
+    # only, so a ray through a vertex is counted once (or not at all, if the vertex
+    # is a local top or bottom), and horizontal edges are never counted.
+    straddles = (y0 > y) != (y1 > y)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        xisect = x0 + (x1 - x0) * ((y - y0) / (y1 - y0))
+        crossing = straddles & (xisect >= x)
+
+    return (crossing.sum(axis=0) % 2).astype(bool)
+
+def _onEdges(edges, x, y):
+    """ Test whether the (1, M) point arrays x, y lie exactly on any edge of a (4, N) edge array """
+    x0, y0, x1, y1 = [e[:, numpy.newaxis] for e in edges]
+
+    collinear = (x1 - x0)*(y - y0) == (y1 - y0)*(x - x0)
+    within = (numpy.minimum(x0, x1) <= x) & (x <= numpy.maximum(x0, x1)) & \
+             (numpy.minimum(y0, y1) <= y) & (y <= numpy.maximum(y0, y1))
+
+    return (collinear & within).any(axis=0)
+
+def pointsInPolygon(points, edges, holes=()):
+    """
+    Test many points against a polygon at once.  `points` is an (M, 2) array-like of
+    points, `edges` is the output of polygonEdges() for the polygon boundary and
+    `holes` an optional list of the same for each of its holes.  Returns a boolean
+    array of length M.
+
+    Uses the 'ray to infinity' even-odd test, with the ray going from each point to
+    +inf in x.  Points on the boundary of the polygon or of a hole count as inside.
+    """
+    pts = _pointsToArray(points)
+    inside = numpy.zeros(len(pts), dtype=bool)
+    if len(pts) == 0 or edges.shape[1] == 0:
+        return inside
+
+    step = max(1, POINT_TEST_CHUNK_SIZE // edges.shape[1])
+    for start in xrange(0, len(pts), step):
+        x = pts[start:start+step, 0][numpy.newaxis, :]
+        y = pts[start:start+step, 1][numpy.newaxis, :]
+        result = _rayCrossingsOdd(edges, x, y) | _onEdges(edges, x, y)
+        for hole in holes:
+            if hole.shape[1] > 0:
+                result &= ~(_rayCrossingsOdd(hole, x, y) & ~_onEdges(hole, x, y))
+        inside[start:start+step] = result
+
+    return inside
+
+class CoordinateTransform(object):
+    """
+    Affine mapping between map coordinates (as used in region files) and lab
+    coordinates (as used by the robot), given by a 3x3 calibration matrix that
+    converts lab->map.  The matrix and its inverse are computed once.
+
+    map2lab() and lab2map() convert an (M, 2) array-like of points at once and
+    return an (M, 2) array, while map2labPoint() and lab2mapPoint() convert a
+    single point into an [x, y] list, as expected by the existing coordmap
+    callables.
+    """
+
+    def __init__(self, T):
+        self.lab2mapMatrix = numpy.array(T, dtype=float)
+        self.map2labMatrix = numpy.linalg.inv(self.lab2mapMatrix)
+
+        # Plain float coefficients for fast single-point conversion
+        self._lab2mapCoeffs = tuple(float(v) for v in self.lab2mapMatrix[0:2, :].flat)
+        self._map2labCoeffs = tuple(float(v) for v in self.map2labMatrix[0:2, :].flat)
+
+    @staticmethod
+    def _transform(M, points):
+        pts = _pointsToArray(points)
+        return pts.dot(M[0:2, 0:2].T) + M[0:2, 2]
+
+    @staticmethod
+    def _transformPoint(coeffs, pt):
+        a, b, c, d, e, f = coeffs
+        x, y = float(pt[0]), float(pt[1])
+        return [a*x + b*y + c, d*x + e*y + f]
+
+    def map2lab(self, points):
+        """ Convert an (M, 2) array-like of points from map to lab coordinates """
+        return self._transform(self.map2labMatrix, points)
+
+    def lab2map(self, points):
+        """ Convert an (M, 2) array-like of points from lab to map coordinates """
+        return self._transform(self.lab2mapMatrix, points)
+
+    def map2labPoint(self, pt):
+        """ Convert a single point from map to lab coordinates """
+        return self._transformPoint(self._map2labCoeffs, pt)
+
+    def lab2mapPoint(self, pt):
+        """ Convert a single point from lab to map coordinates """
+        return self._transformPoint(self._lab2mapCoeffs, pt)
+
+class RegionGridIndex(object):
+    """
+    A uniform grid over the bounding boxes of a list of regions, used to quickly
+    find the few regions that might contain a given point.  Each cell stores the
+    indices (in ascending order) of all regions whose bounding box overlaps it.
+    """
+
+    def __init__(self, regions):
+        self.numRegions = len(regions)
+        self.cells = {}
+
+        boxes = [(r.position.x, r.position.y, r.position.x + r.size.x, r.position.y + r.size.y) for r in regions]
+        if not boxes:
+            self.origin = (0.0, 0.0)
+            self.cellSize = 1.0
+            return
+
+        min_x = min(b[0] for b in boxes)
+        min_y = min(b[1] for b in boxes)
+        width = max(b[2] for b in boxes) - min_x
+        height = max(b[3] for b in boxes) - min_y
+
+        # Aim for roughly one cell per region
+        self.origin = (min_x, min_y)
+        self.cellSize = math.sqrt(width * height / len(boxes)) or max(width, height) or 1.0
+
+        for idx, (x0, y0, x1, y1) in enumerate(boxes):
+            cx0, cy0 = self._cell(x0, y0)
+            cx1, cy1 = self._cell(x1, y1)
+            for cx in xrange(cx0, cx1 + 1):
+                for cy in xrange(cy0, cy1 + 1):
+                    self.cells.setdefault((cx, cy), []).append(idx)
+
+    def _cell(self, x, y):
+        return (int(math.floor((x - self.origin[0]) / self.cellSize)),
+                int(math.floor((y - self.origin[1]) / self.cellSize)))
+
+    def candidates(self, x, y):
+        """ Return the indices of all regions whose bounding box might contain (x, y) """
+        if math.isnan(x) or math.isnan(y) or math.isinf(x) or math.isinf(y):
+            return []
+        return self.cells.get(self._cell(x, y), [])
+
+# Number of sides of the polygons used in place of circles when inflating and deflating regions
+OFFSET_CIRCLE_POINTS = 16
+
+class RegionGeometry(object):
+    """
+    Lab-frame Polygon geometry of the regions of a RegionFileInterface for one
+    calibration, built on demand and cached, so that all the motion controllers
+    can share it (see Project.getRegionGeometry()).  Regions are given by index.
+
+    The Polygons and arrays handed out are shared, so they must not be modified
+    in place (``+``, ``-`` and ``&`` return new Polygons, but ``shift()`` and the
+    like don't).
+    """
+
+    def __init__(self, rfi, transform):
+        self.rfi = rfi
+        self.transform = transform
+
+        self._polygons = {}      # region index -> Polygon
+        self._offsets = {}       # (region index, distance) -> Polygon
+        self._unions = {}        # frozenset of region indices -> Polygon
+        self._faces = {}         # (region index, region index) -> (midpoints, normals)
+        self._byName = None
+
+    def getPolygon(self, region):
+        """ Return a Polygon of the region (minus its holes) in lab coordinates """
+        poly = self._polygons.get(region)
+        if poly is None:
+            r = self.rfi.regions[region]
+            poly = Polygon.Polygon(self.transform.map2lab(r.getPoints()).tolist())
+            for n in xrange(len(r.holeList)):
+                poly -= Polygon.Polygon(self.transform.map2lab(r.getPoints(hole_id=n)).tolist())
+            self._polygons[region] = poly
+        return poly
+
+    def getPolygonsByName(self):
+        """ Return a dictionary of the Polygons of all regions, by region name """
+        if self._byName is None:
+            self._byName = dict((r.name, self.getPolygon(i)) for i, r in enumerate(self.rfi.regions))
+        return self._byName
+
+    def getUnion(self, regions):
+        """ Return the union of the Polygons of the given regions """
+        key = frozenset(regions)
+        poly = self._unions.get(key)
+        if poly is None:
+            poly = Polygon.Polygon()
+            for i in sorted(key):
+                poly += self.getPolygon(i)
+            self._unions[key] = poly
+        return poly
+
+    def getBoundary(self):
+        """ Return the union of the Polygons of all regions """
+        return self.getUnion(xrange(len(self.rfi.regions)))
+
+    def getOffsetPolygon(self, region, distance):
+        """
+        Return the region's Polygon grown by `distance` (or, if it is negative, shrunk, to the
+        points at least that far from its edges, e.g. where a disk robot of that radius fits).
+        """
+
+        key = (region, distance)
+        poly = self._offsets.get(key)
+        if poly is None:
+            poly = self.getPolygon(region)
+            if distance > 0:
+                poly = poly + self._edgeBand(poly, distance)
+            elif distance < 0:
+                poly = poly - self._edgeBand(poly, -distance)
+            self._offsets[key] = poly
+        return poly
+
+    @staticmethod
+    def _edgeBand(poly, distance):
+        """ The points within `distance` of the edges of `poly` (and a little more, at the corners) """
+        # Circumscribe the circles, so the band covers everything within `distance`
+        radius = distance/math.cos(math.pi/OFFSET_CIRCLE_POINTS)
+
+        band = Polygon.Polygon()
+        for c in xrange(len(poly)):
+            v = numpy.array(poly.contour(c), dtype=float)
+            for (x0, y0), (x1, y1) in zip(v, numpy.roll(v, -1, axis=0)):
+                band += Polygon.Shapes.Circle(radius, (x0, y0), OFFSET_CIRCLE_POINTS)
+                length = math.hypot(x1 - x0, y1 - y0)
+                if length > 0:
+                    nx, ny = (y0 - y1)/length*distance, (x1 - x0)/length*distance
+                    band += Polygon.Polygon([(x0 + nx, y0 + ny), (x1 + nx, y1 + ny), (x1 - nx, y1 - ny), (x0 - nx, y0 - ny)])
+        return band
+
+    def getTransitionFaces(self, i, j):
+        """
+        Return the midpoints and the unit normals (pointing from region i into region j) of
+        the faces between regions i and j, as two (N, 2) arrays in lab coordinates.
+        """
+
+        faces = self._faces.get((i, j))
+        if faces is None:
+            midpoints = []
+            normals = []
+            for face in self.rfi.transitions[i][j]:
+                ends = self.transform.map2lab([(pt.x, pt.y) for pt in face])
+                direction = ends[1] - ends[0]
+                length = math.hypot(*direction)
+                if length == 0:
+                    continue
+                middle = ends.mean(axis=0)
+                normal = numpy.array([-direction[1], direction[0]])/length
+
+                # Point the normal away from region i
+                step = max(length*1e-3, 1e-9)
+                if self.getPolygon(i).isInside(*(middle + step*normal)):
+                    normal = -normal
+
+                midpoints.append(middle)
+                normals.append(normal)
+
+            faces = (numpy.array(midpoints, dtype=float).reshape(-1, 2), numpy.array(normals, dtype=float).reshape(-1, 2))
+            self._faces[(i, j)] = faces
+        return faces
+
+# Maximum distance (in pixels) from a face's line for a point to count as collinear with it,
+# when splitting overlapping faces
+SUBFACE_COLLINEAR_TOLERANCE = 1
+
+def regionSegments(region):
+    """
+    Yield the faces of a region's boundary as (pta, ptb) pairs of points in absolute coordinates,
+    in order and skipping any of zero length.
+    """
+    points = [pt for pt in region.getPoints()]
+    for i in xrange(len(points)):
+        pta, ptb = points[i], points[(i+1) % len(points)]
+        if pta != ptb:
+            yield pta, ptb
+
+class FaceGridIndex(object):
+    """
+    A spatial hash of the boundary faces of a list of regions: each face is stored in every
+    cell of a uniform grid that its bounding box (grown by SUBFACE_COLLINEAR_TOLERANCE) overlaps,
+    so that faces near a given segment can be found quickly.
+    """
+
+    def __init__(self, regions):
+        self.faces = [(idx, pta, ptb) for idx, r in enumerate(regions) for pta, ptb in regionSegments(r)]
+        self.cells = {}
+
+        if not self.faces:
+            self.cellSize = 1.0
+            return
+
+        # Aim for cells about as large as an average face
+        total = sum(math.hypot(ptb.x-pta.x, ptb.y-pta.y) for _, pta, ptb in self.faces)
+        self.cellSize = max(total / len(self.faces), 2.0*SUBFACE_COLLINEAR_TOLERANCE)
+
+        for faceIdx, (_, pta, ptb) in enumerate(self.faces):
+            for cell in self._cells(pta, ptb):
+                self.cells.setdefault(cell, []).append(faceIdx)
+
+    def _cells(self, pta, ptb):
+        tol = SUBFACE_COLLINEAR_TOLERANCE
+        cx0 = int(math.floor((min(pta.x, ptb.x) - tol) / self.cellSize))
+        cx1 = int(math.floor((max(pta.x, ptb.x) + tol) / self.cellSize))
+        cy0 = int(math.floor((min(pta.y, ptb.y) - tol) / self.cellSize))
+        cy1 = int(math.floor((max(pta.y, ptb.y) + tol) / self.cellSize))
+        for cx in xrange(cx0, cx1 + 1):
+            for cy in xrange(cy0, cy1 + 1):
+                yield (cx, cy)
+
+    def facesNear(self, pta, ptb):
+        """ Return (region index, pta, ptb) for all faces that might be close to the segment pta-ptb """
+        found = set()
+        for cell in self._cells(pta, ptb):
+            found.update(self.cells.get(cell, []))
+        return [self.faces[faceIdx] for faceIdx in sorted(found)]
+
 class RegionFileInterface(object):
     """
     A wrapper class for handling collections of regions and associated metadata.
@@ -151,7 +660,7 @@ class RegionFileInterface(object):
 
         - background (string): relative path of background image file
         - regions (list): list of Region objects, with properties defined below
-        - transitions (list of lists):
+        - transitions (AdjacencyMatrix, indexed like a list of lists):
             * key1 = Region object index
             * key2 = Region object index
             * values = Lists of faces connecting the two regions
@@ -163,6 +672,18 @@ class RegionFileInterface(object):
         self.transitions = transitions
         self.filename = None
 
+        # Face index used to compute and incrementally update adjacency
+        self._faceIndex = None       # face key -> [face, list of indices of regions with this face]
+        self._regionFaceKeys = {}    # region index -> (geometry signature, set of face keys)
+        self._indexedRegions = []    # snapshot of self.regions at the time the index was built
+
+        # Spatial index for point location, built on demand
+        self._spatialIndex = None
+
+        # Calibration used by getLabVertices(), and its cached results
+        self.coordTransform = None
+        self._labVertexCache = {}    # (id(region), hole_id) -> (geometry key, vertex array, references)
+
     def setToDefaultName(self, region):
         if region.name is '':
             # Find an available name
@@ -212,6 +733,105 @@ class RegionFileInterface(object):
         # Everything was full, so let's just append to the end
         return last + 1
 
+    def invalidateSpatialIndex(self):
+        """
+        Discard the spatial index used for point queries.  This needs to be called
+        after moving or reshaping regions; adding or removing regions is detected
+        automatically.
+        """
+        self._spatialIndex = None
+
+    def _getSpatialIndex(self):
+        if self._spatialIndex is None or self._spatialIndex.numRegions != len(self.regions):
+            self._spatialIndex = RegionGridIndex(self.regions)
+        return self._spatialIndex
+
+    def regionsContainingPoint(self, x, y):
+        """
+        Return the indices (in ascending order) of all regions containing the point (x, y),
+        given in map coordinates.
+        """
+
+        return [i for i in self._getSpatialIndex().candidates(x, y) if self.regions[i].objectContainsPoint(x, y)]
+
+    def regionContainingPoint(self, x, y, excludeBoundary=False):
+        """
+        Return the index of the first region containing the point (x, y), given in map
+        coordinates, or None if the point is not inside any region.
+        If excludeBoundary is True, the region named "boundary" is never returned.
+        """
+
+        for i in self.regionsContainingPoint(x, y):
+            if excludeBoundary and self.regions[i].name.lower() == "boundary":
+                continue
+            return i
+
+        return None
+
+    def regionContainingPoints(self, points, excludeBoundary=False):
+        """
+        Batch version of regionContainingPoint(): given a sequence of (x, y) points in
+        map coordinates, return a list with the index of the region containing each
+        one (or None).  All the points falling into a region's bounding box are tested
+        against it at once.
+        """
+
+        pts = _pointsToArray(points)
+        index = self._getSpatialIndex()
+
+        # Group the points by candidate region
+        pending = {}
+        for i, (x, y) in enumerate(pts):
+            for r in index.candidates(x, y):
+                pending.setdefault(r, []).append(i)
+
+        result = [None] * len(pts)
+        for r in sorted(pending.keys()):
+            if excludeBoundary and self.regions[r].name.lower() == "boundary":
+                continue
+            idx = numpy.array(pending[r])
+            for i in idx[self.regions[r].objectContainsPoints(pts[idx])]:
+                if result[i] is None:
+                    result[i] = r
+
+        return result
+
+    def setCoordTransform(self, transform):
+        """
+        Set the CoordinateTransform used to convert region vertices into lab coordinates
+        for getLabVertices().  This discards any vertices cached for the old calibration.
+        """
+        self.coordTransform = transform
+        self._labVertexCache = {}
+
+    def getLabVertices(self, region, hole_id=None):
+        """
+        Return an (N, 2) array with the vertices of a region (or of one of its holes, as
+        in Region.getPoints()) in lab coordinates.  `region` can be a Region object or an
+        index into self.regions.
+
+        Results are cached until the region is modified or the calibration changes, so
+        this is cheap enough to call on every control loop iteration.
+        """
+
+        if self.coordTransform is None:
+            raise ValueError("No calibration set; call setCoordTransform() first")
+
+        if isinstance(region, Number):
+            region = self.regions[region]
+
+        pts = region.pointArray if hole_id is None else region.holeList[hole_id]
+        key = (region.type, region.position.x, region.position.y, region.size.x, region.size.y, id(pts), len(pts))
+
+        cached = self._labVertexCache.get((id(region), hole_id))
+        if cached is None or cached[0] != key:
+            vertices = self.coordTransform.map2lab(region.getPoints(hole_id=hole_id))
+            # Hold on to the region and its point list so that their ids can't be reused while cached
+            cached = (key, vertices, (region, pts))
+            self._labVertexCache[(id(region), hole_id)] = cached
+
+        return cached[1].copy()
+
     def getMaximumHeight(self):
 	    return max(r.height for r in self.regions)
 
@@ -220,90 +840,235 @@ class RegionFileInterface(object):
         If we have a face of region obj1 that overlaps with the face of another region obj2,
         (i.e. the obj1 face is collinear with and has at least one point on the obj2 face)
         we split the larger face into two or three parts as appropriate. 
+
+        Returns True if any points were added to obj2.
         """
 
         # Doesn't make any sense to check against self
         if obj1 is obj2:
-            return
+            return False
 
-        # TODO: Optimize this code; use numpy instead of wx
-
-        COLLINEAR_TOLERANCE = 1  # pixel
-
-        # Iterate over faces in obj1
-        for pta, ptb in obj1.getFaces():
-            # Since we are modifying obj2, it's easier to re-run the loop than keep track of indices
-            # in the case that we are adding two points.  Lazy, yes, but effective for now.
-            clean = False
-            while not clean:
-                clean = True
-                for other_pta, other_ptb in obj2.getFaces():
-                    [on_segment_a, d_a, pint_a] = pointLineIntersection(other_pta, other_ptb, pta)
-                    [on_segment_b, d_b, pint_b] = pointLineIntersection(other_pta, other_ptb, ptb)
-                    if d_a < COLLINEAR_TOLERANCE and d_b < COLLINEAR_TOLERANCE: # Check for collinearity
-                        points = [x for x in obj2.getPoints()]
-
-                        # Figure out where we would add a new point
-                        idxa = points.index(other_pta)
-                        idxb = points.index(other_ptb)
-                        if (idxa == 0 and idxb == len(points)-1) or (idxb == 0 and idxa == len(points)-1):  
-                            idx = 0
-                        else:
-                            idx = max(idxa, idxb)
-
-                        # Add a point if appropriate
-                        if on_segment_a and not (pta == other_pta or pta == other_ptb): 
-                            obj2.addPoint(pta-obj2.position, idx)
-                            clean = False
-                            break
-                        if on_segment_b and not (ptb == other_pta or ptb == other_ptb): 
-                            obj2.addPoint(ptb-obj2.position, idx)
-                            clean = False
-                            break
+        faces1 = list(regionSegments(obj1))
+        return self._splitFacesOf(obj2, lambda pta, ptb: faces1)
+
+    def splitSubfacesNear(self, obj):
+        """
+        Split the faces of the region obj at the vertices of any other region with an overlapping
+        collinear face, and vice versa (see splitSubfaces()).  Only regions with faces near those
+        of obj are looked at.
+
+        Returns the list of regions to which points were added.
+        """
+
+        grid = FaceGridIndex(self.regions)
+        objFaces = list(regionSegments(obj))
+
+        neighbors = set()
+        for pta, ptb in objFaces:
+            neighbors.update(idx for idx, _, _ in grid.facesNear(pta, ptb) if self.regions[idx] is not obj)
+
+        modified = []
+        for idx in sorted(neighbors):
+            if self._splitFacesOf(self.regions[idx], lambda pta, ptb: objFaces):
+                modified.append(self.regions[idx])
+
+        if self._splitFacesOf(obj, lambda pta, ptb: [(a, b) for idx, a, b in grid.facesNear(pta, ptb)
+                                                     if self.regions[idx] is not obj]):
+            modified.append(obj)
+
+        return modified
+
+    def splitAllSubfaces(self):
+        """
+        Equivalent to calling splitSubfaces() on every pair of regions, but only compares faces
+        that are near each other.
+
+        Returns the list of regions to which points were added.
+        """
+
+        grid = FaceGridIndex(self.regions)
+
+        modified = []
+        for i, region in enumerate(self.regions):
+            if self._splitFacesOf(region, lambda pta, ptb: [(a, b) for idx, a, b in grid.facesNear(pta, ptb)
+                                                            if idx != i]):
+                modified.append(region)
+
+        return modified
+
+    def _splitFacesOf(self, region, candidateFaces):
+        """
+        Split each face of the region at the endpoints of any overlapping collinear faces out of
+        candidateFaces(pta, ptb).  All the new points are inserted at once, in order along each face.
+
+        Returns True if any points were added.
+        """
+
+        points = [pt for pt in region.getPoints()]
+        insertions = {}
+
+        for i in xrange(len(points)):
+            pta, ptb = points[i], points[(i+1) % len(points)]
+            if pta == ptb:
+                continue
+
+            newPoints = []
+            for other_pta, other_ptb in candidateFaces(pta, ptb):
+                [on_segment_a, d_a, pint_a] = pointLineIntersection(pta, ptb, other_pta)
+                [on_segment_b, d_b, pint_b] = pointLineIntersection(pta, ptb, other_ptb)
+                if d_a < SUBFACE_COLLINEAR_TOLERANCE and d_b < SUBFACE_COLLINEAR_TOLERANCE: # Check for collinearity
+                    # Add the points of the other face that lie inside this one
+                    for on_segment, pt in ((on_segment_a, other_pta), (on_segment_b, other_ptb)):
+                        if on_segment and not (pt == pta or pt == ptb) and pt not in newPoints:
+                            newPoints.append(pt)
+
+            if newPoints:
+                newPoints.sort(key=lambda pt: (pt.x-pta.x)*(ptb.x-pta.x) + (pt.y-pta.y)*(ptb.y-pta.y))
+                insertions[i] = newPoints
+
+        if not insertions:
+            return False
+
+        # Rebuild the point list in one go
+        newPointArray = []
+        newAlignmentPoints = []
+        for i, pt in enumerate(points):
+            newPointArray.append(pt - region.position)
+            newAlignmentPoints.append(i < len(region.alignmentPoints) and region.alignmentPoints[i])
+            for newPt in insertions.get(i, []):
+                newPointArray.append(newPt - region.position)
+                newAlignmentPoints.append(False)
+
+        # Convert from rect to poly if necessary
+        region.type = reg_POLY
+        region.pointArray = newPointArray
+        region.alignmentPoints = newAlignmentPoints
+        region.recalcBoundingBox()
+
+        return True
 
     def recalcAdjacency(self):
         """
         Calculate the region adjacency matrix and a list of shared faces
 
-        Returns a list of shared faces
+        Returns a dictionary whose keys are the shared faces, and whose values
+        are lists of the regions sharing each face
         """
 
-        # Create empty adjacency matrix
-        self.transitions = [[[] for j in range(len(self.regions))] for i in range(len(self.regions))]
+        self._indexedRegions = list(self.regions)
+        self._faceIndex = {}
+        self.invalidateSpatialIndex()
+        self._regionFaceKeys = {}
+        for i, region in enumerate(self.regions):
+            self._indexRegion(i, *self._regionGeometry(region))
 
-        transitionFaces = {} # This is just a list of faces to draw dotted lines on
+        self.transitions = AdjacencyMatrix(len(self.regions))
+        for key in self._faceIndex:
+            self._linkFace(key)
 
-        for obj in self.regions:
-            for face in obj.getFaces(includeHole=True):                
-                if face not in transitionFaces: transitionFaces[face] = []
-                ignore = False
-                for other_obj in transitionFaces[face]:
-                    # Prevent detection of adjoining faces when Duplicate 
-                    # command creates object on top of itself
-                    if other_obj.position == obj.position and \
-                       [x for x in other_obj.getPoints()] == [x for x in obj.getPoints()]:
-                        ignore = True
-    
-                if not ignore:
-                    transitionFaces[face].append(obj)
-
-        toDelete = []
-        for face, objarray in transitionFaces.iteritems():
-            if len(objarray) > 1:
-                # If this face is shared by multiple regions
-                for obj in objarray:
-                    key = self.regions.index(obj)
-                    for other_obj in objarray:
-                        if other_obj == obj: continue
-                        key2 = self.regions.index(other_obj)
-                        self.transitions[key][key2].append(face)
-            else:
-                # Otherwise mark for deletion (we can't delete it in the middle of iteration)
-                toDelete.append(face)
+        return self._sharedFaces()
+
+    def updateAdjacency(self, region):
+        """
+        Update the adjacency matrix after a single region has been modified
+        (e.g. moved, resized, or had points added or removed), only looking
+        at the faces that region had before and has now.
+
+        If regions have been added, removed, or reordered since the last
+        call to recalcAdjacency(), a full recalculation is done instead.
 
-        # Delete all those dudes
-        for unused_face in toDelete:
-            del transitionFaces[unused_face]                    
+        Returns a dictionary of shared faces, like recalcAdjacency()
+        """
+
+        if self._faceIndex is None or len(self._indexedRegions) != len(self.regions) \
+           or any(a is not b for a, b in zip(self._indexedRegions, self.regions)):
+            return self.recalcAdjacency()
+
+        idx = [i for i, r in enumerate(self.regions) if r is region][0]
+        self.invalidateSpatialIndex()
+
+        signature, faces = self._regionGeometry(region)
+        affected = self._regionFaceKeys[idx][1] | set(faces)
+
+        for key in affected:
+            if key in self._faceIndex:
+                self._linkFace(key, unlink=True)
+
+        self._unindexRegion(idx)
+        self._indexRegion(idx, signature, faces)
+
+        for key in affected:
+            if key in self._faceIndex:
+                self._linkFace(key)
+
+        return self._sharedFaces()
+
+    def _regionGeometry(self, region):
+        """
+        Return a signature of the region's outline (used to detect duplicate regions),
+        and a dictionary mapping the keys of all its faces (including holes) to the faces.
+        """
+
+        signature = tuple(pointKey(pt) for pt in region.getPoints())
+        faces = {}
+        for face in region.getFaces(includeHole=True):
+            faces.setdefault(faceKey(face), face)
+
+        return signature, faces
+
+    def _indexRegion(self, idx, signature, faces):
+        self._regionFaceKeys[idx] = (signature, set(faces))
+        for key, face in faces.iteritems():
+            self._faceIndex.setdefault(key, [face, []])[1].append(idx)
+
+    def _unindexRegion(self, idx):
+        signature, keys = self._regionFaceKeys.pop(idx)
+        for key in keys:
+            entry = self._faceIndex[key]
+            entry[1].remove(idx)
+            if not entry[1]:
+                del self._faceIndex[key]
+
+    def _faceOwners(self, key):
+        """
+        Return the indices of the regions sharing a face.  Regions that are exact copies
+        of an earlier owner are ignored, to prevent detection of adjoining faces when the
+        Duplicate command creates an object on top of itself.
+        """
+
+        owners = []
+        signatures = set()
+        for idx in self._faceIndex[key][1]:
+            signature = self._regionFaceKeys[idx][0]
+            if signature in signatures:
+                continue
+            signatures.add(signature)
+            owners.append(idx)
+
+        return owners
+
+    def _linkFace(self, key, unlink=False):
+        """ Add (or remove) a face to the transitions between all regions that share it """
+
+        owners = self._faceOwners(key)
+        if len(owners) < 2:
+            return
+
+        face = self._faceIndex[key][0]
+        for i in owners:
+            for j in owners:
+                if i == j: continue
+                if unlink:
+                    self.transitions.removeFace(i, j, face)
+                else:
+                    self.transitions.addFace(i, j, face)
+
+    def _sharedFaces(self):
+        transitionFaces = {} # This is just a list of faces to draw dotted lines on
+        for key, (face, _) in self._faceIndex.iteritems():
+            owners = self._faceOwners(key)
+            if len(owners) > 1:
+                transitionFaces[face] = [self.regions[i] for i in owners]
 
         return transitionFaces
 
@@ -355,18 +1120,20 @@ class RegionFileInterface(object):
         je = prettierJSONEncoder(indent=4)
         regionData = [je.encode(regionData)]
        
+        if not isinstance(self.transitions, AdjacencyMatrix):
+            self.transitions = AdjacencyMatrix.fromLists(self.transitions)
+
         transitionData = []
-        for region1, destinations in enumerate(self.transitions):
+        for region1, region2, faces in self.transitions.iterTransitions():
             # Note: We are assuming all transitions are bidirectional so we only have to include
             # the parts of the adjacency matrix above the diagonal
-            for region2, faces in enumerate(destinations[region1+1:]):
-                if faces == []: continue    # No transition between these regions, so skip
+            if region2 <= region1: continue
 
-                faceData = [coord for face in faces for pt in face for coord in pt]
+            faceData = [coord for face in faces for pt in face for coord in pt]
 
-                transitionData.append("\t".join([self.regions[region1].name,
-                                                 self.regions[region1 + 1 + region2].name] +
-                                                 map(str, faceData)))
+            transitionData.append("\t".join([self.regions[region1].name,
+                                             self.regions[region2].name] +
+                                             map(str, faceData)))
 
         calibPoints = []
         for region in self.regions:
@@ -384,7 +1151,153 @@ class RegionFileInterface(object):
                 "CalibrationPoints": calibPoints,
                 "Obstacles": obstacleRegions}
 
-        fileMethods.writeToFile(filename, data, comments)
+        fileMethods.replaceFile(filename, lambda tmpname: fileMethods.writeToFile(tmpname, data, comments))
+        self.filename = filename
+
+        return True
+
+    def writeBinaryFile(self, filename):
+        """
+        Save the regions in the binary region file format, which holds the same information
+        as the text format written by writeFile() but can be loaded (lazily) much faster.
+        readFile() recognizes both formats.
+
+        The file consists of the magic string BINARY_REGION_FILE_MAGIC, the format version and
+        the length of a JSON header (both as little-endian uint32), the JSON header itself, and
+        then a number of little-endian arrays, each aligned to 8 bytes.  The header holds the
+        background, the region names, and the offset (from the start of the array data),
+        dtype and shape of each array:
+
+            - 'regions'      int64 (# of regions) x 8: type, index of first contour, number of
+                             contours (the boundary, then any holes; none for rects), red,
+                             green, blue, isObstacle, and whether the height is an integer
+            - 'geometry'     float64 (# of regions) x 5: x, y, width, height, and (3D) height
+            - 'contours'     int64 (# of contours) x 2: index of first vertex, number of vertices
+            - 'vertices'     float64 (# of vertices) x 2: x, y relative to the region position
+            - 'alignment'    int64 (# of calibration points) x 2: region index, vertex index
+            - 'transitions'  int64 (# of transitions) x 4: region 1 index, region 2 index (above
+                             the diagonal only), index of first face, number of faces
+            - 'faces'        float64 (# of faces) x 4: x1, y1, x2, y2
+        """
+
+        if not isinstance(self.transitions, AdjacencyMatrix):
+            self.transitions = AdjacencyMatrix.fromLists(self.transitions)
+
+        regionTable, geometry, contours, vertices, alignment = [], [], [], [], []
+        for idx, r in enumerate(self.regions):
+            boundaries = [r.pointArray] + r.holeList if r.type == reg_POLY else []
+            regionTable.append([r.type, len(contours), len(boundaries),
+                                r.color.Red(), r.color.Green(), r.color.Blue(),
+                                int(r.isObstacle), int(isinstance(r.height, (int, long)))])
+            geometry.append([r.position.x, r.position.y, r.size.width, r.size.height, r.height])
+            for pts in boundaries:
+                contours.append([len(vertices), len(pts)])
+                vertices.extend((pt.x, pt.y) for pt in pts)
+            alignment.extend([idx, i] for i, isAP in enumerate(r.alignmentPoints) if isAP)
+
+        transitions, faces = [], []
+        for region1, region2, faceList in self.transitions.iterTransitions():
+            # As in the text format, only store the part above the diagonal
+            if region2 <= region1: continue
+            transitions.append([region1, region2, len(faces), len(faceList)])
+            faces.extend([coord for pt in face for coord in pt] for face in faceList)
+
+        arrays = [("regions", numpy.array(regionTable, dtype="<i8").reshape(-1, 8)),
+                  ("geometry", numpy.array(geometry, dtype="<f8").reshape(-1, 5)),
+                  ("contours", numpy.array(contours, dtype="<i8").reshape(-1, 2)),
+                  ("vertices", numpy.array(vertices, dtype="<f8").reshape(-1, 2)),
+                  ("alignment", numpy.array(alignment, dtype="<i8").reshape(-1, 2)),
+                  ("transitions", numpy.array(transitions, dtype="<i8").reshape(-1, 4)),
+                  ("faces", numpy.array(faces, dtype="<f8").reshape(-1, 4))]
+
+        header = {"background": self.background,
+                  "names": [r.name for r in self.regions],
+                  "arrays": {}}
+        offset = 0
+        for name, array in arrays:
+            header["arrays"][name] = [offset, array.dtype.str, list(array.shape)]
+            offset += array.nbytes
+
+        headerData = json.dumps(header)
+        prefixLength = len(BINARY_REGION_FILE_MAGIC) + 8 + len(headerData)
+        headerData += " " * (-prefixLength % 8)  # pad so the arrays are aligned
+
+        def write(tmpname):
+            f = open(tmpname, "wb")
+            f.write(BINARY_REGION_FILE_MAGIC)
+            f.write(numpy.array([BINARY_REGION_FILE_VERSION, len(headerData)], dtype="<u4").tostring())
+            f.write(headerData)
+            for name, array in arrays:
+                f.write(array.tostring())
+            f.close()
+
+        fileMethods.replaceFile(filename, write)
+
+        self.filename = filename
+
+        return True
+
+    def readBinaryFile(self, filename, lazy=True):
+        """
+        Load regions saved by writeBinaryFile().  If lazy is True, the file is memory-mapped
+        and the vertices of each region are only read the first time they are used.
+        """
+
+        data = numpy.memmap(filename, dtype=numpy.uint8, mode="r")
+        prefix = len(BINARY_REGION_FILE_MAGIC)
+        if data[:prefix].tostring() != BINARY_REGION_FILE_MAGIC:
+            return False
+
+        version, headerLength = numpy.frombuffer(data[prefix:prefix+8].tostring(), dtype="<u4")
+        if version > BINARY_REGION_FILE_VERSION:
+            print "ERROR: Region file %s uses an unsupported format version (%d)" % (filename, version)
+            return False
+
+        header = json.loads(data[prefix+8:prefix+8+headerLength].tostring())
+        start = prefix + 8 + headerLength
+
+        arrays = {}
+        for name, (offset, dtype, shape) in header["arrays"].iteritems():
+            if numpy.prod(shape) == 0:
+                arrays[name] = numpy.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = numpy.ndarray(shape, dtype=dtype, buffer=data, offset=start+offset)
+            if not lazy:
+                arrays[name] = numpy.array(arrays[name])
+
+        self.background = header["background"]
+        regionTable = arrays["regions"].tolist()
+        geometry = arrays["geometry"].tolist()
+        contours = arrays["contours"].tolist()
+
+        self.regions = []
+        for idx, name in enumerate(header["names"]):
+            type, firstContour, numContours, red, green, blue, isObstacle, intHeight = regionTable[idx]
+            x, y, width, height, z = geometry[idx]
+            newRegion = MappedRegion(arrays["vertices"], contours[firstContour:firstContour+numContours],
+                                     type=type, position=Point(x, y), size=Size(width, height),
+                                     height=int(z) if intHeight else z, color=Color(red, green, blue),
+                                     name=name)
+            newRegion.isObstacle = bool(isObstacle)
+            if not lazy:
+                newRegion.pointArray, newRegion.holeList
+            self.regions.append(newRegion)
+
+        for region, index in arrays["alignment"].tolist():
+            self.regions[region].alignmentPoints[index] = True
+
+        self.transitions = AdjacencyMatrix(len(self.regions))
+        self._faceIndex = None
+        self.invalidateSpatialIndex()
+        self._labVertexCache = {}
+        faces = arrays["faces"].tolist()
+        for region1, region2, firstFace, numFaces in arrays["transitions"].tolist():
+            faceList = [frozenset((Point(x1, y1), Point(x2, y2)))
+                        for x1, y1, x2, y2 in faces[firstFace:firstFace+numFaces]]
+            # During adjacency matrix reconstruction, we'll mirror over the diagonal
+            self.transitions.setFaces(region1, region2, faceList)
+            self.transitions.setFaces(region2, region1, list(faceList))
+
         self.filename = filename
 
         return True
@@ -397,6 +1310,9 @@ class RegionFileInterface(object):
         if not os.path.exists(filename):
             return False
 
+        if isBinaryRegionFile(filename):
+            return self.readBinaryFile(filename)
+
         data = fileMethods.readFromFile(filename)
 
         if data is None:
@@ -427,7 +1343,10 @@ class RegionFileInterface(object):
             self.regions.append(newRegion)
 
         # Make an empty adjacency matrix of size (# of regions) x (# of regions)
-        self.transitions = [[[] for j in range(len(self.regions))] for i in range(len(self.regions))]
+        self.transitions = AdjacencyMatrix(len(self.regions))
+        self._faceIndex = None
+        self.invalidateSpatialIndex()
+        self._labVertexCache = {}
         for transition in data["Transitions"]:
             transData = transition.split("\t");
             region1 = self.indexOfRegionWithName(transData[0])
@@ -439,8 +1358,8 @@ class RegionFileInterface(object):
                 faces.append(frozenset((p1, p2)))
                 
             # During adjacency matrix reconstruction, we'll mirror over the diagonal
-            self.transitions[region1][region2] = faces
-            self.transitions[region2][region1] = faces
+            self.transitions.setFaces(region1, region2, faces)
+            self.transitions.setFaces(region2, region1, faces)
 
         if "CalibrationPoints" in data:
             for point in data["CalibrationPoints"]:
@@ -805,33 +1724,58 @@ class Region(object):
             # point is within their bounds.
             return True
 
-        return self.polyContainsPoint(self.pointArray, x - self.position.x, y - self.position.y) and \
-               not any([self.polyContainsPoint(h_pts, x - self.position.x, y - self.position.y) for h_pts in self.holeList])
+        boundary, holes = self.getEdgeArrays()
+        return bool(pointsInPolygon([(x - self.position.x, y - self.position.y)], boundary, holes)[0])
+
+    def objectContainsPoints(self, points):
+        """ Batch version of objectContainsPoint(): given an (M, 2) array-like of
+            points, return a boolean array saying which of them this object contains.
+        """
+        pts = _pointsToArray(points)
+        x, y = pts[:, 0], pts[:, 1]
+
+        # Firstly, ignore any points outside of the object's bounds.
+        inside = (x >= self.position.x) & (x <= self.position.x + self.size.x) & \
+                 (y >= self.position.y) & (y <= self.position.y + self.size.y)
+
+        if self.type in [reg_RECT]:
+            return inside
+
+        candidates = numpy.flatnonzero(inside)
+        if len(candidates) > 0:
+            boundary, holes = self.getEdgeArrays()
+            offset = numpy.array([self.position.x, self.position.y])
+            inside[candidates] = pointsInPolygon(pts[candidates] - offset, boundary, holes)
+
+        return inside
+
+    def getEdgeArrays(self):
+        """ Return a tuple (boundary, holes) with the edges of this polygon and of each
+            of its holes, relative to the region position, as given by polygonEdges().
+
+            These are cached, and recomputed whenever pointArray or holeList is
+            replaced or resized (e.g. by recalcBoundingBox()).
+        """
+        refs = (self.pointArray,) + tuple(self.holeList)
+        key = (self.type, len(self.holeList)) + tuple((id(pts), len(pts)) for pts in refs)
+
+        if getattr(self, "_edgeCacheKey", None) != key:
+            boundary = polygonEdges(self.getPoints(relative=True))
+            holes = [polygonEdges(h_pts) for h_pts in self.holeList]
+            self._edgeCache = (boundary, holes)
+            self._edgeCacheKey = key
+            # Hold on to the point lists so that their ids can't be reused while cached
+            self._edgeCacheRefs = refs
+
+        return self._edgeCache
 
     def polyContainsPoint(self, poly_pts, x, y):
 
         # For polygons, we have to check whether the clicked point is
-        # inside or outside the polygon.
-        # The algorithm used here was taken from:
-        # http://local.wasp.uwa.edu.au/~pbourke/geometry/insidepoly/
-
-        sum = 0
-        n = len(poly_pts)
-        for i in range(n):
-            v1_y = poly_pts[i].y - y
-            v1_x = poly_pts[i].x - x
-            v2_y = poly_pts[(i+1)%n].y - y
-            v2_x = poly_pts[(i+1)%n].x - x
-            angle_v1 = math.atan2(v1_y, v1_x)
-            angle_v2 = math.atan2(v2_y, v2_x)
-            angle = angle_v2 - angle_v1
-            while(angle > math.pi):
-                angle -= 2 * math.pi
-            while(angle < -math.pi):
-                angle += 2 * math.pi
-            sum += angle
-
-        return not (abs(sum) < math.pi)
+        # inside or outside the polygon, using the even-odd test from
+        # pointsInPolygon().
+
+        return bool(pointsInPolygon([(x, y)], polygonEdges(poly_pts))[0])
 
     def getSelectionHandleContainingPoint(self, x, y, boundFunc=None):
         """ Return the selection handle containing the given point, if any.
@@ -947,37 +1891,13 @@ class Region(object):
         newRegion.type              = reg_POLY
         newRegion.color             = Color(255-self.color[0], 255-self.color[1], 255-self.color[2])
         newRegion.pointArray        = []
-        center=self.getCenter()
         
         if mode == 'overEstimate':
-            for i,pt in enumerate(self.getPoints()):
-                twoFaces = [face for face in self.getFaces() if pt in face] # faces that connected by pt
-                        
-                face1_pt1_new,face1_pt2_new = self.findPointsNear(twoFaces[0], center, distance)
-                face2_pt1_new,face2_pt2_new = self.findPointsNear(twoFaces[1], center, distance)
-                
-                
-                if math.sqrt((face1_pt1_new.x-pt.x)**2+(face1_pt1_new.y-pt.y)**2) > math.sqrt((face1_pt2_new.x-pt.x)**2+(face1_pt2_new.y-pt.y)**2):
-                    pt1 = face1_pt2_new
-                else:
-                    pt1 = face1_pt1_new
-                    
-                if math.sqrt((face2_pt1_new.x-pt.x)**2+(face2_pt1_new.y-pt.y)**2) > math.sqrt((face2_pt2_new.x-pt.x)**2+(face2_pt2_new.y-pt.y)**2):
-                    pt2 = face2_pt2_new
-                else:
-                    pt2 = face2_pt1_new
-                    
-                pt1_new, pt2_new = self.findPointsNear((pt1,pt2), center, distance-math.sqrt(distance**2-((pt1.x-pt2.x)**2+(pt1.y-pt2.y)**2)/4))
-        
-                #newRegion.pointArray.append(pt1_new)
-                #newRegion.pointArray.append(pt2_new)
-                
-                newTwoFaces = [(face1_pt1_new,face1_pt2_new),
-                               (face2_pt1_new,face2_pt2_new)]
-                interPoint = self.faceAndFaceIntersection(newTwoFaces[0],tuple(sorted((pt1_new,pt2_new))))
-                newRegion.pointArray.append(interPoint)
-                interPoint = self.faceAndFaceIntersection(newTwoFaces[1],tuple(sorted((pt1_new,pt2_new))))
-                newRegion.pointArray.append(interPoint)
+            # push each face out by the distance, bevelling the corners, and keep the
+            # original vertices too, so that the hull below always covers the region itself.
+            # Bevel points can coincide, and convexHull() doesn't cope with repeated points.
+            points = numpy.vstack((offsetPolygon(self.getPoints(), distance), _pointsToArray(self.getPoints())))
+            newRegion.pointArray = [Point(x, y) for x, y in sorted(set(map(tuple, points.tolist())))]
                     
         # TODO: fix this
         # put the vertex in the right order
@@ -1053,6 +1973,55 @@ class Region(object):
 
 
 ############################################################
+class MappedRegion(Region):
+    """ A region loaded from a binary region file, whose pointArray and holeList are only
+        built from the file's vertex array the first time they are accessed.
+    """
+
+    def __init__(self, vertices, contours, type=reg_POLY, position=Point(0, 0), size=Size(0, 0),
+                 height=0, color=None, name=''):
+        self._vertices = vertices
+        self._contours = contours
+        numPoints = contours[0][1] if type == reg_POLY and contours else 4
+
+        super(MappedRegion, self).__init__(type, position, size, height, color, name=name)
+
+        # Region.__init__() assigned empty point lists; forget them until they are needed
+        del self.__dict__['_pointArray']
+        del self.__dict__['_holeList']
+        self.alignmentPoints = [False] * numPoints
+
+    def _loadContour(self, index):
+        start, count = self._contours[index]
+        return [Point(x, y) for x, y in self._vertices[start:start+count].tolist()]
+
+    def _getPointArray(self):
+        if '_pointArray' not in self.__dict__:
+            self.__dict__['_pointArray'] = self._loadContour(0) if self._contours else []
+        return self.__dict__['_pointArray']
+
+    def _setPointArray(self, value):
+        self.__dict__['_pointArray'] = value
+
+    def _getHoleList(self):
+        if '_holeList' not in self.__dict__:
+            self.__dict__['_holeList'] = [self._loadContour(i) for i in xrange(1, len(self._contours))]
+        return self.__dict__['_holeList']
+
+    def _setHoleList(self, value):
+        self.__dict__['_holeList'] = value
+
+    pointArray = property(_getPointArray, _setPointArray)
+    holeList = property(_getHoleList, _setHoleList)
+
+    def __getstate__(self):
+        # Copies (and pickles) don't need to keep the file mapped
+        self.pointArray, self.holeList
+        state = self.__dict__.copy()
+        state['_vertices'] = numpy.zeros((0, 2))
+        state['_contours'] = []
+        return state
+
 def findRegionBetween(regionA, regionB,name = 'newRegion'):
     """
     Find the region between two given regions (doesn't include the given regions)
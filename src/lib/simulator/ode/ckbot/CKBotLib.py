@@ -4,6 +4,13 @@
 # python robots/CKBot/CKBotLib.py
 
 import sys, os
+import cPickle
+
+# Library of config-gait pairs, listed by trait
+LIBRARY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'library', 'CKBotTraits.libe')
+
+# Version of the cached index, so old cache files are ignored
+LIBRARY_CACHE_VERSION = 1
 
 class CKBotLib:
 
@@ -29,88 +36,197 @@ class CKBotLib:
 		#gait8 = Gait("Hexapod-run",["fast","handles rough surfaces"])
 		#self.poss_gaits = [gait0,gait1, gait2, gait3, gait4, gait5, gait6, gait7, gait8]
 		self.poss_gaits = []	
+
+		# trait -> indices in self.poss_gaits of the gaits that have it, in library order
+		self.index = {}
+		# gait name -> index in self.poss_gaits
+		self.gait_index = {}
+		self.filename = None
                 
 
-	def readLibe(self):
+	def readLibe(self, filename=None):
 		"""
-		Parse library file
+		Parse library file, or load it from the cache file next to it if
+		the library has not changed since it was last parsed
 		"""
 
-		curdir = os.getcwd()
-		if ("simulator" in curdir) and ("ode" in curdir) and ("ckbot" in curdir):
-			f = open('library/CKBotTraits.libe','r')
-		else:
-			f = open('lib/simulator/ode/ckbot/library/CKBotTraits.libe','r')
+		if filename is None:
+			filename = LIBRARY_FILE
+		self.filename = filename
+
+		if not self.loadIndex():
+			self.parseLibe()
+			self.saveIndex()
+
+	def parseLibe(self):
+		"""
+		Build the index from the library file
+		"""
+
+		f = open(self.filename,'r')
+
+		self.words = []
+		self.poss_gaits = []
+		self.index = {}
+		self.gait_index = {}
 
 		reading_trait = 0
-		gait_number = 0
 		cgpair = []
-		
-		
-		# Make temporary gaitnames variable
-		gaitnames = [] # Will have same indices of self.poss_gaits, but is a list of names, not gaits
-		
+
 		for line in f:
 			# Find Config-Gait pairs in a trait
 			# if we just read a trait, add config-pairs to self.poss_gaits
 			if (reading_trait == 1):
-				if line == "\n":
+				if line.strip() == "":
 					reading_trait = 0
 					# Loop through cgpairs with this specific trait so we can build self.poss_gaits[]
 					for pair in cgpair:
-						# Make a new gait object if one with the same name doesn't exist
-						if (pair not in gaitnames):
-							# specify current cgpair with last trait in self.words
-							gaitnames.append(pair) 
-							self.poss_gaits.append(Gait(pair,[self.words[-1]]))
-						# Add trait to already made gait object self.poss_gaits[i].words
-						else: 
-							idx = gaitnames.index(pair)
-							self.poss_gaits[idx].words.append(self.words[-1])
+						self._addTrait(pair, self.words[-1])
 					# Restart cgpair
 					cgpair = []
 				# Add config-gait to cgpair list
 				elif (line[0] != "#") and not (line.strip() in cgpair):
 					cgpair.append(line.strip())
 			# Find Gait Traits
-			if (line.split().count("Trait:")>0): 
+			if (line.split().count("Trait:")>0):
 				info = line.split(": ")
-				self.words.append(info[1].strip())
-				gait_number = gait_number + 1
+				word = info[1].strip()
+				# The same trait can be listed more than once (see addGait())
+				if word in self.words:
+					self.words.remove(word)
+				self.words.append(word)
 				reading_trait = 1
-				
+
+		f.close()
+
+	def _addTrait(self, name, word):
+		"""
+		Record that the gait with the given name has a trait
+		"""
+
+		# Make a new gait object if one with the same name doesn't exist
+		if name not in self.gait_index:
+			self.gait_index[name] = len(self.poss_gaits)
+			self.poss_gaits.append(Gait(name,[]))
+		idx = self.gait_index[name]
+
+		# Add trait to already made gait object self.poss_gaits[i].words
+		gait = self.poss_gaits[idx]
+		if word not in gait.words:
+			gait.words.append(word)
+			self.index.setdefault(word, []).append(idx)
+
+	def _cacheKey(self):
+		stat = os.stat(self.filename)
+		return (LIBRARY_CACHE_VERSION, os.path.abspath(self.filename), stat.st_mtime, stat.st_size)
+
+	def loadIndex(self):
+		"""
+		Load the index from the cache file, if it is up to date.
+		Return True if it was loaded.
+		"""
+
+		cachefile = self.filename + ".cache"
+		if not os.path.exists(cachefile):
+			return False
+
+		try:
+			f = open(cachefile, 'rb')
+			try:
+				key, words, gaits, index = cPickle.load(f)
+			finally:
+				f.close()
+		except Exception:
+			return False
+
+		if key != self._cacheKey():
+			return False
+
+		self.words = words
+		self.poss_gaits = [Gait(name,gaitwords) for name, gaitwords in gaits]
+		self.gait_index = dict((gait.name, idx) for idx, gait in enumerate(self.poss_gaits))
+		self.index = index
+
+		return True
+
+	def saveIndex(self):
+		"""
+		Save the index to the cache file.  Failing to write it is not an error,
+		the library is just parsed again next time.
+		"""
+
+		gaits = [(gait.name, gait.words) for gait in self.poss_gaits]
+		try:
+			f = open(self.filename + ".cache", 'wb')
+			try:
+				cPickle.dump((self._cacheKey(), self.words, gaits, self.index), f, cPickle.HIGHEST_PROTOCOL)
+			finally:
+				f.close()
+		except (IOError, OSError):
+			pass
+
 	def findGait(self,desired_words):
-		
-		# Find gaits that meet specification
-		gait_match = 0	# does a specific gait match?
-		gait_found = 0  # is there at least one gait that matches
-		goodgaits = []
-		for gait in self.poss_gaits:
-			for word in desired_words:
-				if word in gait.words:
-					#print "gait", gait.name,"has trait",word
-					gait_match = gait_match + 1
-					if gait_match == len(desired_words):
-						#print "gait is", gait.name
-						goodgaits.append(gait.name)
-						gait_found = 1
-			gait_match = 0
-
-		#print goodgaits
-
-		# If no gaits were found, print "gait not found"
-		if gait_found == 0:
-			#print "gait not found"
+		"""
+		Return the configuration of the first gait in the library that has all
+		of the desired traits, or None if there is no such gait
+		"""
+
+		# Gaits that meet specification
+		if not desired_words:
+			return
+		goodgaits = None
+		for word in desired_words:
+			if goodgaits is None:
+				goodgaits = set(self.index.get(word, []))
+			else:
+				goodgaits.intersection_update(self.index.get(word, []))
+			if not goodgaits:
+				# No gaits were found
+				return
+
+		# Use first goodgait if we have more than one gait
+		[config,gait] = self.poss_gaits[min(goodgaits)].name.split("-")
+		return config
+
+	def addGait(self, config, gaitname, traits, definitions=None):
+		"""
+		Add a config-gait pair with the given traits to the library, by appending
+		new trait lists to the end of the library file instead of rewriting it.
+		New traits are listed with their definition from `definitions`, if any.
+		"""
+
+		if definitions is None:
+			definitions = {}
+
+		pair = config + '-' + gaitname
+		idx = self.gait_index.get(pair)
+		traits = [trait for trait in traits if idx is None or trait not in self.poss_gaits[idx].words]
+		if not traits:
 			return
-		# If a gait was found, run it in the simulator
-		else:
-			# Use first goodgait if we have more than one gait
-			#print goodgaits
-			[config,gait] = goodgaits[0].split("-")
-			#print config
-			#print gait
-			return config
-			
+
+		f = open(self.filename, 'ab+')
+		# Make sure that the first new trait starts on a line of its own
+		f.seek(0, os.SEEK_END)
+		if f.tell() > 0:
+			f.seek(-1, os.SEEK_END)
+			if f.read(1) != '\n':
+				f.write('\n')
+		for trait in traits:
+			f.write('\n')
+			if trait in definitions:
+				f.write('# \"' + trait + '\" = ' + definitions[trait] + '\n')
+			f.write('Trait: ' + trait + '\n')
+			f.write(pair + '\n')
+		f.write('\n')
+		f.close()
+
+		# Update the index and its cache to match the file
+		for trait in traits:
+			if trait in self.words:
+				self.words.remove(trait)
+			self.words.append(trait)
+			self._addTrait(pair, trait)
+		self.saveIndex()
 
 class Gait:
 	def __init__(self,name,words):
@@ -5,13 +5,16 @@ import pygame
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
-import math, time, copy, sys
+import math, time, copy, sys, os
 
 from loadModules import *
 from parseTextFiles import *
 from matrixFunctions import *
 from CKBotSimHelper import *
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import collisionSpaces
+
 # needs to add the path of ltlmop_root to sys path
 sys.path.append('../../../..')
 import lib.regions
@@ -37,9 +40,12 @@ class CKBotSim:
     clip = 1000.0
     res = (800, 600)
 
-    def __init__(self, robotfile, standalone=0,obstaclefile=None,regionfile=None,region_calib=None,startingpose=None,heightmap=None):
+    def __init__(self, robotfile, standalone=0,obstaclefile=None,regionfile=None,region_calib=None,startingpose=None,heightmap=None,spacetype="hash"):
         """
         Initialize the simulator.
+
+        spacetype is the broadphase used for collision detection (one of
+        collisionSpaces.SPACE_TYPES).
         """
 
         # Simulation world parameters.
@@ -47,8 +53,9 @@ class CKBotSim:
         self.world = ode.World()
         self.world.setGravity((0, -9.81, 0))
         self.world.setERP(0.1)
-        self.space = ode.Space()
-        self.ground = ode.GeomPlane(space=self.space, normal=(0,1,0), dist=0)
+        self.space = collisionSpaces.createSpace(spacetype)
+        self.staticSpace = collisionSpaces.createSpace(spacetype)
+        self.ground = ode.GeomPlane(space=self.staticSpace, normal=(0,1,0), dist=0)
 
         # CKBot module parameters.
         self.cubesize = 6.0
@@ -491,7 +498,7 @@ class CKBotSim:
             rungait(self)
             
             # Simulation Step
-            self.space.collide((), self._nearcb)
+            collisionSpaces.collide(self.space, self.staticSpace, (), self._nearcb)
             self.world.step(1/self.fps)
             self._cjoints.empty()
             self.render()
@@ -514,7 +521,7 @@ class CKBotSim:
         rungait(self)
 
         # Simulation Step
-        self.space.collide((), self._nearcb)
+        collisionSpaces.collide(self.space, self.staticSpace, (), self._nearcb)
         self.world.step(1/self.fps)
         self._cjoints.empty()
         self.render()
@@ -5,22 +5,29 @@ import pygame
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
-import math, time, copy, sys
+import math, time, copy, sys, os
 
 from loadModules import *
 from parseTextFiles import *
 from matrixFunctions import *
 from CKBotSimHelper import *
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import collisionSpaces
+
 
 class CKBotSim:
 	"""
 	CKBot Simulator Class
 	"""
 
-	def __init__(self, robotfile,obstaclefile=None,regionfile=None,region_calib=None,startingpose=None,heightmap=None):
+	def __init__(self, robotfile,obstaclefile=None,regionfile=None,region_calib=None,startingpose=None,heightmap=None,spacetype="hash"):
 		"""
 		Initialize the simulator.
+
+		spacetype is the broadphase used for collision detection (one of
+		collisionSpaces.SPACE_TYPES).  The robot file is only read once; reset()
+		rebuilds the simulation from it.
 		"""
 
 		self.fps = 30.0
@@ -34,13 +41,6 @@ class CKBotSim:
 			loadRegionData(self, regionfile)
 			self.region_calib = region_calib
 
-		# Simulation world parameters.
-		self.world = ode.World()
-		self.world.setGravity((0, -9.81, 0))
-		self.world.setERP(0.1)
-		self.space = ode.Space()
-		self.ground = ode.GeomPlane(space=self.space, normal=(0,1,0), dist=0)
-
 		# CKBot module parameters.
 		self.cubesize = 6.0
 		self.cubemass = 10.0
@@ -82,16 +82,36 @@ class CKBotSim:
 			tempz = self.basepos[2] + self.startingpose[2]	 
 			self.basepos = (tempx, tempy, tempz)
 
+		self.obstaclefile = obstaclefile
+		self.heightmap = heightmap
+		self.spacetype = spacetype
+		self.reset()
+
+
+	def reset(self):
+		"""
+		Create a new simulation world with the robot in its starting pose, so that
+		another gait can be simulated without reading the robot file again.
+		"""
+
+		# Simulation world parameters.
+		self.world = ode.World()
+		self.world.setGravity((0, -9.81, 0))
+		self.world.setERP(0.1)
+		self.space = collisionSpaces.createSpace(self.spacetype)
+		self.staticSpace = collisionSpaces.createSpace(self.spacetype)
+		self.ground = ode.GeomPlane(space=self.staticSpace, normal=(0,1,0), dist=0)
+		self.counter = 0
+
 		# Load the objects.
 		loadModuleObjects(self)
 		self._cjoints = ode.JointGroup()
 		
 		# Make obstacles if they exist.
-		if (obstaclefile!=None):
-		    loadObstacles(self, obstaclefile)
+		if (self.obstaclefile!=None):
+			loadObstacles(self, self.obstaclefile)
 
 		# Create region heights if they are specified.
-		self.heightmap = heightmap
 		if (self.heightmap!=None):
 			loadRegionHeights(self, self.heightmap)
 
@@ -147,7 +167,7 @@ class CKBotSim:
 			rungait(self)
 
 			# Simulation Step
-			self.space.collide((), self._nearcb)
+			collisionSpaces.collide(self.space, self.staticSpace, (), self._nearcb)
 			self.world.step(1/self.fps)
 			self._cjoints.empty()
 						
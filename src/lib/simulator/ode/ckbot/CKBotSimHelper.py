@@ -10,6 +10,7 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
 import math, time, copy, sys, os
+import numpy
 
 from loadModules import *
 from parseTextFiles import *
@@ -104,72 +105,85 @@ def rungait(sim, ref_angles = None):
 	if sim.gait == 0 and ref_angles == None:
 		for module_idx in range(len(sim.hinge)):
 			sim.hinge[module_idx].setParam(ode.ParamVel, 0)
+		return
 		
 	elif ref_angles != None:
-		for module_idx in range(len(sim.hinge)):
-			true_ang = sim.hinge[module_idx].getAngle()
-			ref_ang = ref_angles[module_idx]*(math.pi/180.0)/100.0
-			servo_vel = sim.gain*(ref_ang-true_ang)
-			sim.hinge[module_idx].setParam(ode.ParamVel, servo_vel)
+		ref_angs = numpy.asarray(ref_angles, dtype=float)*(math.pi/180.0)/100.0
 
 	else:
-		gait = sim.gaits[sim.gait - 1]
-		gaittype = gait[0]
-		
-		# If the gait is of periodic type, read the rows in the following format.
-		# ROW 1: Amplitudes
-		# ROW 2: Frequencies
-		# ROW 3: Phases
-		if gaittype == "periodic":
-			for module_idx in range(len(sim.hinge)):
-				amplitude = gait[1][module_idx]
-				frequency = gait[2][module_idx]
-				phase = gait[3][module_idx]
-
-				true_ang = sim.hinge[module_idx].getAngle()
-				ref_ang = amplitude*math.sin(frequency*time + phase)
-				servo_vel = sim.gain*(ref_ang-true_ang)
-				sim.hinge[module_idx].setParam(ode.ParamVel, servo_vel)
-
-		# If the gait is of fixed type, run the function "gaitangle" to interpolate between
-		# reference hinge angles at the current time.
-		elif gaittype == "fixed":
-			for module_idx in range(len(sim.hinge)):
-				true_ang = sim.hinge[module_idx].getAngle()	    
-				ref_ang = gaitangle(sim,gait,time,module_idx)
-				servo_vel = sim.gain*(ref_ang-true_ang)
-				sim.hinge[module_idx].setParam(ode.ParamVel, servo_vel)
-
-
-def gaitangle(sim, gait, time, module):
-	"""
-	Takes in a gait matrix and returns the reference angle at that point in time.
-	"""
-
-	nummoves = len(gait)-2
-	gaittime = gait[1]
-	singletime = float(gaittime)/(nummoves-1)
-
-	timearray = []
-	for i in range(0,nummoves):
-		if i==0:
-			timearray.append(0)
+		ref_angs = gaitangles(getcompiledgait(sim, sim.gaits[sim.gait - 1]), time)
+
+	# Simple P-controlled servos, driving all the hinges towards their reference angles.
+	true_angs = numpy.array([hinge.getAngle() for hinge in sim.hinge])
+	servo_vels = sim.gain*(ref_angs[:len(sim.hinge)] - true_angs)
+	for module_idx in range(len(sim.hinge)):
+		sim.hinge[module_idx].setParam(ode.ParamVel, servo_vels[module_idx])
+
+
+def compilegait(gait, nummodules):
+	"""
+	Converts a gait, as stored in sim.gaits, into arrays that the reference angles of
+	all the modules can be computed from at once (see gaitangles()).
+
+	Only the first nummodules entries of each row are used: some of the robot files
+	have rows with extra entries, which the simulator has always ignored.
+	"""
+
+	gaittype = gait[0]
+
+	# A periodic gait has the rows
+	# ROW 1: Amplitudes
+	# ROW 2: Frequencies
+	# ROW 3: Phases
+	if gaittype == "periodic":
+		amplitudes, frequencies, phases = [numpy.array(row[:nummodules], dtype=float) for row in gait[1:4]]
+		return ("periodic", amplitudes, frequencies, phases)
+
+	# A fixed gait has the time the gait loops in, followed by a table of reference angles
+	# that are evenly spaced in time.
+	elif gaittype == "fixed":
+		gaittime = float(gait[1])
+		table = numpy.array([row[:nummodules] for row in gait[2:]], dtype=float)
+		if len(table) > 1 and gaittime > 0:
+			singletime = gaittime/(len(table)-1)
 		else:
-			timearray.append(timearray[i-1]+singletime)
+			# A single row (or no time to move in) just holds that pose.
+			singletime = 0.0
+		return ("fixed", gaittime, singletime, table)
 
-	currenttime = (time%gaittime)/singletime
-	globalref = gait[int(math.ceil(currenttime))+2][module]
-	globalprev = gait[int(math.floor(currenttime))+2][module]
 
-	if globalref==globalprev:
-		# If the current time coincides with the time of a given gait angle direction, then there is no need to interpolate.
-		localref = globalref
-	else:
-		# Linear interpolation step.
-		interp = (currenttime*singletime - timearray[int(math.floor(currenttime))])/(timearray[int(math.ceil(currenttime))] - timearray[int(math.floor(currenttime))])
-		localref = globalprev + interp*(globalref-globalprev)
+def getcompiledgait(sim, gait):
+	"""
+	Returns the compiled version of a gait of the simulator, compiling it only when the gait
+	is first run.  Gaits are replaced rather than modified, so the gait object identifies it.
+	"""
+
+	compiled = getattr(sim, "compiled_gait", None)
+	if compiled is None or compiled[0] is not gait:
+		sim.compiled_gait = (gait, compilegait(gait, len(sim.hinge)))
+	return sim.compiled_gait[1]
 
-	return localref
+
+def gaitangles(compiled, time):
+	"""
+	Takes in a compiled gait and returns an array of the reference angles of all the
+	modules at that point in time.
+	"""
+
+	if compiled[0] == "periodic":
+		gaittype, amplitudes, frequencies, phases = compiled
+		return amplitudes*numpy.sin(frequencies*time + phases)
+
+	else:
+		# Linear interpolation between the two rows of the gait table around the current time.
+		gaittype, gaittime, singletime, table = compiled
+		if singletime == 0:
+			return table[0].copy()
+		currenttime = (time%gaittime)/singletime
+		prev = int(math.floor(currenttime))
+		next = int(math.ceil(currenttime))
+		interp = currenttime - prev
+		return table[prev] + interp*(table[next] - table[prev])
 
 	
 			
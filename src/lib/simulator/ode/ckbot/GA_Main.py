@@ -1,4 +1,20 @@
-import sys, random, math
+"""
+Genetic algorithm for finding periodic CKBot gaits.
+
+Usage: GA_Main.py [--workers=N] [--seed=N] [--resume] config trait1 [trait2 ...]
+
+Each generation is simulated on a pool of N worker processes (default: one per
+CPU), each with its own headless simulator.  Genes that have already been
+simulated are scored from a cache instead of being simulated again.  If the
+results are saved, the state of the GA is checkpointed after every generation,
+and --resume carries on from the last checkpoint.
+"""
+
+import sys, random, math, os, getopt, cPickle
+import multiprocessing
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".."))
+import fileMethods
 from copy import *
 
 import CKBotSimEngine 
@@ -6,6 +22,32 @@ import CKBotSim
 from fitness_function import *
 from CKBotSimHelper import *
 
+# The simulator and GA settings of a worker process, set up by init_worker().
+worker_sim = None
+worker_settings = None
+
+def init_worker(robotfile, free_modules, traits, steps):
+	"""
+	Load the robot into a headless simulator, once for each worker process.
+	"""
+
+	global worker_sim, worker_settings
+	worker_sim = CKBotSimEngine.CKBotSim(robotfile)
+	worker_settings = (free_modules, traits, steps)
+
+def evaluate_gene(gene):
+	"""
+	Simulate a gene from the robot's starting pose, and return its fitness
+	and the pose of the base module at each step.
+	"""
+
+	free_modules, traits, steps = worker_settings
+	worker_sim.reset()
+	set_periodic_gait_from_GA(worker_sim, gene, worker_sim.gain, free_modules)
+	worker_sim.run(steps)
+	fitness = fitness_function(worker_sim, traits)
+	return fitness, [poses[0] for poses in worker_sim.pose_info]
+
 # Main method.
 if (__name__ == '__main__'):
 
@@ -20,22 +62,57 @@ if (__name__ == '__main__'):
 	# TODO: Make this more user-friendly to enter?
 	rigid_modules = []
 	
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "", ["workers=", "seed=", "resume"])
+	except getopt.GetoptError, e:
+		print e
+		print __doc__.strip().split("\n")[2].strip()
+		sys.exit(2)
+	opts = dict(opts)
+	if len(args) < 1:
+		print __doc__.strip().split("\n")[2].strip()
+		sys.exit(2)
+
+	workers = int(opts.get("--workers", multiprocessing.cpu_count()))
+	if "--seed" in opts:
+		random.seed(int(opts["--seed"]))
+
 	filename = raw_input("\nEnter the desired file name ('none' for no saving): ")
+
+	# Resume from the last checkpoint of this run, if asked to.
+	checkpoint = None
+	if filename != "none":
+		checkpoint_file = "GA_Data/"+filename+".checkpoint"
+		if "--resume" in opts:
+			if os.path.exists(checkpoint_file):
+				checkpoint = cPickle.load(open(checkpoint_file, 'rb'))
+			else:
+				print "No checkpoint found in " + checkpoint_file + ", starting from scratch."
+
 	if filename != "none":
-		# FILE 1: Gene and score informations.
-		f_gene = open("GA_Data/"+filename+".genes", 'w')
-		# FILE 2: Pose information for post-processing.
-		f_pose = open("GA_Data/"+filename+".poses", 'w')
+		if checkpoint is None:
+			# FILE 1: Gene and score informations.
+			f_gene = open("GA_Data/"+filename+".genes", 'w')
+			# FILE 2: Pose information for post-processing.
+			f_pose = open("GA_Data/"+filename+".poses", 'w')
+		else:
+			# Drop anything written after the checkpoint.
+			f_gene = open("GA_Data/"+filename+".genes", 'r+')
+			f_gene.seek(checkpoint['gene_offset'])
+			f_gene.truncate()
+			f_pose = open("GA_Data/"+filename+".poses", 'r+')
+			f_pose.seek(checkpoint['pose_offset'])
+			f_pose.truncate()
 	
 	# Look at the arguments passed in. The first argument is the configuration file and all the others
 	# correspond to the traits that will define the fitness function.
-	robotfile = "config/" + sys.argv[1] + ".ckbot"
+	robotfile = "config/" + args[0] + ".ckbot"
 	traits = []
-	for i in range(2,len(sys.argv)):
-		traits.append(sys.argv[i])
+	for i in range(1,len(args)):
+		traits.append(args[i])
 	
 	# Write the traits and other information to the text file.
-	if filename != "none":
+	if filename != "none" and checkpoint is None:
 		trait_string = ""
 		for i in range(len(traits)):
 			if i == len(traits) - 1:
@@ -78,27 +155,52 @@ if (__name__ == '__main__'):
 	best_generation = 0
 	best_member = 0
 	
-	for i in range(POPULATION_SIZE):
-		temprow = []
-		for j in range(len(free_modules)):
-			temprow.extend([5*random.randint(0,13), random.randint(0,5), random.randint(0,7)])
-		population.append(temprow)
+	# Fitness and base module poses of every gene simulated so far.
+	fitness_cache = {}
+	start_generation = 0
+
+	if checkpoint is None:
+		for i in range(POPULATION_SIZE):
+			temprow = []
+			for j in range(len(free_modules)):
+				temprow.extend([5*random.randint(0,13), random.randint(0,5), random.randint(0,7)])
+			population.append(temprow)
+	else:
+		population = checkpoint['population']
+		fitness_cache = checkpoint['fitness_cache']
+		start_generation = checkpoint['generation']
+		best_score, best_gene, best_generation, best_member = checkpoint['best']
+		random.set_state(checkpoint['random_state'])
+
+	# Worker processes, each with its own simulator.
+	if workers > 1:
+		pool = multiprocessing.Pool(workers, init_worker, (robotfile, free_modules, traits, SIMULATION_STEPS))
+	else:
+		pool = None
+		init_worker(robotfile, free_modules, traits, SIMULATION_STEPS)
 		
 	##############	
 	# MAIN LOOP: #
 	##############
-	for idx in range(GENERATIONS):
+	for idx in range(start_generation, GENERATIONS):
 	
-		# Run each population member and score it.
+		# Simulate the population members that haven't been simulated before.
+		new_genes = []
+		for gene in population:
+			if tuple(gene) not in fitness_cache and tuple(gene) not in new_genes:
+				new_genes.append(tuple(gene))
+		if pool is not None:
+			results = pool.map(evaluate_gene, new_genes, 1)
+		else:
+			results = map(evaluate_gene, new_genes)
+		fitness_cache.update(zip(new_genes, results))
+
+		# Score each population member.
 		scores = []
 		for i in range(POPULATION_SIZE):
 			gene = population[i]
-			instance = CKBotSimEngine.CKBotSim(robotfile)
-			set_periodic_gait_from_GA(instance, gene, instance.gain, free_modules)
-			instance.run(SIMULATION_STEPS)
-			fitness = fitness_function(instance, traits)
+			fitness, poses = fitness_cache[tuple(gene)]
 			scores.append(fitness)
-			poses = instance.pose_info
 			
 			# Write all the information to text files for post_processing.
 			if filename != "none":
@@ -112,14 +214,14 @@ if (__name__ == '__main__'):
 				
 				# Write pose information
 				for j in range(len(poses)):
-					temppose = poses[j][0]	# Each "temppose" is a single pose for the base module.
+					temppose = poses[j]	# Each "temppose" is a single pose for the base module.
 					f_pose.write(str(temppose[0]) + "\n" + str(temppose[1]) + "\n" + str(temppose[2]) + "\n" + str(temppose[3]) + "\n")
 			
 		# Update to see if we can find a new best gene.
 		for i in range(POPULATION_SIZE):
 			if scores[i] > best_score:
 				best_score = copy.deepcopy(scores[i])
-				best_gene = population[i]
+				best_gene = list(population[i])
 				best_generation = idx
 				best_member = i
 				
@@ -239,6 +341,23 @@ if (__name__ == '__main__'):
 		print "GENERATION " + str(idx+1)
 		print "Maximum Score: " + str(max(scores))
 		print "Average Score: " + str(mean(scores))
+
+		# Save everything needed to carry on from the next generation.
+		if filename != "none":
+			f_gene.flush()
+			f_pose.flush()
+			checkpoint = {'generation': idx+1, 'population': population, 'fitness_cache': fitness_cache,
+			              'best': (best_score, best_gene, best_generation, best_member),
+			              'random_state': random.get_state(),
+			              'gene_offset': f_gene.tell(), 'pose_offset': f_pose.tell()}
+			def write(tmpname):
+				with open(tmpname, 'wb') as f:
+					cPickle.dump(checkpoint, f, cPickle.HIGHEST_PROTOCOL)
+			fileMethods.replaceFile(checkpoint_file, write)
+
+	if pool is not None:
+		pool.close()
+		pool.join()
 	
 	# Print the best score and generation it occured in.
 	print "\nBest Score: " + str(best_score)
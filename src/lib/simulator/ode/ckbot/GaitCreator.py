@@ -11,6 +11,7 @@ from loadModules import *
 from parseTextFiles import *
 from matrixFunctions import *
 from CKBotSimHelper import *
+from CKBotLib import CKBotLib
 
 info = """Gait Creator
 
@@ -541,52 +542,20 @@ class GaitCreator:
 		"""
 		gaitname = self.gaitname
 		traits = self.traits.split(", ")
-		traitPreexists = []
-		while len(traitPreexists) < len(traits):
-			traitPreexists.append(0)
 		config = sys.argv[1]
 
-		# Rename file to have a ~ at the end
-		libFile = 'library/CKBotTraits.libe'
-		os.rename(libFile,libFile+'~')
+		libs = CKBotLib()
+		libs.readLibe()
 
-		# Load the robot file.
-		destination= open(libFile, 'w' )
-		source= open(libFile+'~', 'r' )
-
-		# Append config-gait pair to trait list if it already exists
-		for line in source:
-			if not ('# LEAVE THIS LINE HERE (one enter line below last trait list) for correct parsing' in line):
-				destination.write(line)
-				if 'Trait: ' in line:
-					idx = 0
-					for trait in traits:
-						if trait in line:
-							destination.write( config + '-' + gaitname + '\n' )
-							traitPreexists[idx] = 1
-						idx = idx + 1
-
-
-		# Make a new trait list in the library if it doesn't already exist
-		idx = 0
+		# Ask for a definition of each trait that isn't in the library yet
+		definitions = {}
 		for trait in traits:
-			if traitPreexists[idx] == 0:
+			if trait not in libs.words and trait not in definitions:
 				print "New trait! Please write a short definition for trait " + trait + ":"
-				newdefn = raw_input()
-				# Make a new trait list
-				destination.write('# \"' + trait + '\" = ' + newdefn + '\n')
-				destination.s('Trait: ' + trait + '\n')
-				destination.write(config + '-' + gaitname + '\n')	
-				traitPreexists[idx] = 1			
-			idx = idx + 1
-
-		# Write last two lines of library
-		destination.write('\n' )
-		destination.write('# LEAVE THIS LINE HERE (one enter line below last trait list) for correct parsing')
+				definitions[trait] = raw_input()
 
-		# Close the file.
-		source.close()
-		destination.close()
+		# Append config-gait pair to the library
+		libs.addGait(config, gaitname, traits, definitions)
 		
 
 	def run(self):
@@ -288,7 +288,7 @@ def loadRegionHeights(sim, heightmap):
 					pos = [0.5*(max(x_vals)+min(x_vals)), lowerheight*0.5*sim.cubesize, 0.5*(max(z_vals)+min(z_vals))]
 							
 					# Create the obstacle.
-					geom = ode.GeomBox(space=sim.space, lengths=size )
+					geom = ode.GeomBox(space=sim.staticSpace, lengths=size )
 					geom.setPosition(pos)
 					
 				# If there is a slope, create a rotated plate.
@@ -303,7 +303,7 @@ def loadRegionHeights(sim, heightmap):
 					pos = [0.5*(max(x_vals)+min(x_vals)), (upperheight*0.5 + lowerheight*0.5 - SLOPE_THICKNESS*0.5*cos_slope)*sim.cubesize,0.5*(max(z_vals)+min(z_vals))]
 
 					# Create the obstacle.
-					geom = ode.GeomBox(space=sim.space, lengths=size )
+					geom = ode.GeomBox(space=sim.staticSpace, lengths=size )
 					geom.setPosition(pos)
 					
 					if slope_direction == "+x":
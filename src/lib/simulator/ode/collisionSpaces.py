@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Collision spaces for the ODE simulators.
+
+Each simulator keeps the geoms that can move (the robot, and obstacles with
+bodies) in its `space`, and the ground and any other fixed geometry in its
+`staticSpace`.  Only moving/moving and moving/static pairs are ever tested.
+Geoms can also be put in categories (see setCategory()), so that ODE itself
+drops pairs that are known not to need contacts before calling back into Python.
+The broadphase used by both spaces can be chosen from SPACE_TYPES; a hash space
+is much faster than a simple one once there are more than a handful of obstacles.
+"""
+
+import ode
+
+# Broadphase algorithms that can be used
+SPACE_TYPES = ("simple", "hash", "quadtree")
+
+# Volume covered by a quadtree space (in simulator units, with y up), and its depth
+QUADTREE_CENTER = (0, 0, 0)
+QUADTREE_EXTENTS = (4000, 400, 4000)
+QUADTREE_DEPTH = 6
+
+# Collision categories.  Geoms not put in a category collide with everything.
+CATEGORY_ROBOT = 1
+CATEGORY_ALL = 0xffffffff
+
+def createSpace(spacetype):
+    """
+    Create an ODE space using the given broadphase algorithm (one of SPACE_TYPES).
+    """
+
+    if spacetype == "simple":
+        return ode.SimpleSpace()
+    elif spacetype == "hash":
+        return ode.HashSpace()
+    elif spacetype == "quadtree":
+        return ode.QuadTreeSpace(QUADTREE_CENTER, QUADTREE_EXTENTS, QUADTREE_DEPTH)
+    else:
+        raise ValueError("Unknown collision space type %r (expected one of %s)" % (spacetype, ", ".join(SPACE_TYPES)))
+
+def setCategory(geom, category, collides=CATEGORY_ALL):
+    """
+    Put a geom in the given category, and only test it against geoms in the
+    `collides` categories.  Pairs for which neither geom wants to be tested
+    against the other are skipped by ODE without calling back into Python.
+    """
+
+    geom.setCategoryBits(category)
+    geom.setCollideBits(collides)
+
+def collide(space, staticSpace, args, callback):
+    """
+    Call `callback(args, geom1, geom2)` for every pair of geoms that may be
+    touching, except for pairs of geoms that are both in `staticSpace`.
+    """
+
+    space.collide(args, callback)
+    ode.collide2(space, staticSpace, args, callback)
@@ -1,11 +1,21 @@
 #!/usr/bin/env python
 
 import ode, xode.parser
-import pygame
-from OpenGL.GL import *
-from OpenGL.GLU import *
-from OpenGL.GLUT import *
-import math, time, copy, sys
+
+# pygame and OpenGL are only needed to draw the simulation, not to run it headless
+try:
+	import pygame
+	from OpenGL.GL import *
+	from OpenGL.GLU import *
+	from OpenGL.GLUT import *
+	import_graphics = True
+except ImportError:
+	import_graphics = False
+
+import math, time, copy, sys, os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import collisionSpaces
 
 info = """DiffDriveSim
 
@@ -32,9 +42,18 @@ class DiffDriveSim:
 	clip = 150.0
 	res = (800, 600)
 
-	def __init__(self,standalone=1,obstaclefile=None,regionfile=None,region_calib=None,startingpose=None):
+	def __init__(self,standalone=1,obstaclefile=None,regionfile=None,region_calib=None,startingpose=None,headless=False,speedup=1.0,dt=None,spacetype="hash"):
 		"""
 		Initialize the simulator.
+
+		If headless is True, the simulation is not drawn (and pygame and OpenGL are
+		not needed); it can then be advanced with step() as fast as the physics
+		allows.  run() and run_once() keep the simulation at `speedup` times real
+		time, or run it as fast as possible if speedup is 0.  Each physics step
+		advances the simulation by dt seconds (default 1/fps).
+
+		spacetype is the broadphase used for collision detection (one of
+		collisionSpaces.SPACE_TYPES).
 		"""
 
 		# Setting standalone to 1 allows for manual key input.
@@ -43,6 +62,17 @@ class DiffDriveSim:
 			self.standalone = 1
 		else:
 			self.standalone = 0   
+
+		self.headless = headless
+		if not self.headless and not import_graphics:
+			raise ImportError("pygame and PyOpenGL are needed to draw the simulation; run it headless instead")
+
+		self.speedup = speedup
+		if dt is None:
+			dt = 1/self.fps
+		self.dt = dt
+		self._nextStepTime = 0.0
+		if not self.headless:
 			self.clock = pygame.time.Clock()
 
 		# If regionfile=0, render the ground as default solid green terrain.
@@ -57,12 +87,14 @@ class DiffDriveSim:
 			self.region_calib = region_calib
 
 		# Simulation world parameters.
-		self._initOpenGL()
+		if not self.headless:
+			self._initOpenGL()
 		self.world = ode.World()
 		self.world.setGravity((0, -9.81, 0))
 		self.world.setERP(0.1)
-		self.space = ode.Space()
-		self.ground = ode.GeomPlane(space=self.space, normal=(0,1,0), dist=0)
+		self.space = collisionSpaces.createSpace(spacetype)
+		self.staticSpace = collisionSpaces.createSpace(spacetype)
+		self.ground = ode.GeomPlane(space=self.staticSpace, normal=(0,1,0), dist=0)
 
 		# Robot part parameters.
 		self.cubesize = 6.0
@@ -185,6 +217,10 @@ class DiffDriveSim:
 		self.fixed = ode.FixedJoint(self.world)
 		self.fixed.attach(casterbody,boxbody)
 		self.fixed.setFixed()
+
+		# The parts of the robot never need contacts between themselves.
+		for geom in [boxgeom, leftwheelgeom, rightwheelgeom, castergeom]:
+			collisionSpaces.setCategory(geom, collisionSpaces.CATEGORY_ROBOT, collisionSpaces.CATEGORY_ALL & ~collisionSpaces.CATEGORY_ROBOT)
 		
 		# WHEW, THE END OF ALL THAT FINALLY!
 		# Build the Geoms and Joints arrays for rendering.
@@ -495,6 +531,9 @@ class DiffDriveSim:
 		Render the current simulation state.
 		"""
 
+		if self.headless:
+			return
+
 		glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 		self._renderGround()
 
@@ -552,6 +591,9 @@ class DiffDriveSim:
 		Process any input events.
 		"""
 
+		if self.headless:
+			return
+
 		events = pygame.event.get()
 
 		for e in events:
@@ -636,40 +678,84 @@ class DiffDriveSim:
 		self.setWheelSpeeds(left, right)
 		
 		
+	def step(self, n=1):
+		"""
+		Advance the physics by n steps of dt seconds, as fast as possible and without
+		drawing or processing events.  Returns the 2D pose after the last step.
+		"""
+
+		for i in xrange(n):
+			self._stepPhysics()
+
+		return self.get2DPose()
+
+
+	def getTime(self):
+		"""
+		Return the simulated time, in seconds, since the simulator was started.
+		"""
+
+		return self.counter*self.dt
+
+
+	def _stepPhysics(self):
+		"""
+		Apply the wheel speeds and advance the physics by one step of dt seconds.
+		"""
+
+		# Set wheel hinge speeds.
+		self.lefthinge.setParam(ode.ParamVel, self.left_speed)
+		self.righthinge.setParam(ode.ParamVel, self.right_speed)
+
+		# Simulation Step
+		collisionSpaces.collide(self.space, self.staticSpace, (), self._nearcb)
+		self.world.step(self.dt)
+		self._cjoints.empty()
+		self.counter = self.counter + 1
+
+
+	def _limitRate(self):
+		"""
+		Wait until the next step is due, to keep the simulation at `speedup` times real time.
+		"""
+
+		if self.speedup <= 0:
+			return
+
+		if not self.headless:
+			self.clock.tick(self.speedup/self.dt)
+			return
+
+		# Without pygame, keep track of when the next step is due ourselves
+		now = time.time()
+		if self._nextStepTime > now:
+			time.sleep(self._nextStepTime - now)
+		self._nextStepTime = max(self._nextStepTime, now) + self.dt/self.speedup
+
+
 	def run(self):
 		"""
 		Start the demo. This method will block until the demo exits.
 		This method is used if the simulator is run stand-alone.
 		"""
 
-		self.clock = pygame.time.Clock()
 		self._running = True
 		self.doEvents()
 
 		# Receive Locomotion commands for all the hinges from LTLMoP.
-		# Use these commands as reference angles for simple P-controlled servos.	
+		# Use these commands as reference angles for simple P-controlled servos.
 		while self._running:
 
 			self.doEvents()
 
-			counter = self.counter
-			
-			# Set wheel hinge speeds.
-			self.lefthinge.setParam(ode.ParamVel, self.left_speed)
-			self.righthinge.setParam(ode.ParamVel, self.right_speed)
-			
 			#pose = self.get2DPose()
 			#print pose
-			
-			# Simulation Step
-			self.space.collide((), self._nearcb)
-			self.world.step(1/self.fps)
-			self._cjoints.empty()
+
+			self._stepPhysics()
 			self.render()
 
 			# Limit the FPS.
-			self.clock.tick(self.fps)
-			self.counter = self.counter + 1
+			self._limitRate()
 
 
 	def run_once(self):
@@ -680,19 +766,11 @@ class DiffDriveSim:
 		self._running = True
 		self.doEvents()
 
-		# Set wheel hinge speeds.
-		self.lefthinge.setParam(ode.ParamVel, self.left_speed)
-		self.righthinge.setParam(ode.ParamVel, self.right_speed)
-
-		# Simulation Step
-		self.space.collide((), self._nearcb)
-		self.world.step(1/self.fps)
-		self._cjoints.empty()
+		self._stepPhysics()
 		self.render()
 
 		# Limit the FPS.
-		self.clock.tick(self.fps)
-		self.counter = self.counter + 1
+		self._limitRate()
 
 
 # Main method for standalone mode.
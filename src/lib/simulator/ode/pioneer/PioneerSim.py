@@ -1,11 +1,21 @@
 #!/usr/bin/env python
 
-import ode, xode.parser, pygame, socket, subprocess
-from OpenGL.GL import *
-from OpenGL.GLU import *
-from OpenGL.GLUT import *
+import ode, xode.parser, socket, subprocess, getopt
+
+# pygame and OpenGL are only needed to draw the simulation, not to run it headless
+try:
+    import pygame
+    from OpenGL.GL import *
+    from OpenGL.GLU import *
+    from OpenGL.GLUT import *
+    import_graphics = True
+except ImportError:
+    import_graphics = False
+
 from numpy import *
 import math, time, copy, sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import collisionSpaces
 # needs to add the path of ltlmop_root to sys path
 sys.path.append('../../..')
 sys.path.append('.')
@@ -21,6 +31,13 @@ Manual Controls (Standalone Mode):
 Move around with W A S D
 Stop moving with X
 
+Usage (LTLMoP server mode):
+PioneerSim.py [--headless] [--speedup=N] [--space=TYPE] regionfile region_calib startingpose
+
+With --headless nothing is drawn and no display is needed.  The simulation
+runs at N times real time (default 1); N=0 runs it as fast as possible.
+TYPE is the collision broadphase: simple, hash (default) or quadtree.
+
 """
 
 class DiffDriveSim:
@@ -36,9 +53,18 @@ class DiffDriveSim:
     clip = 150.0
     res = (800, 600)
 
-    def __init__(self,standalone=1,obstaclefile=None,regionfile=None,region_calib=None,startingpose=None):
+    def __init__(self,standalone=1,obstaclefile=None,regionfile=None,region_calib=None,startingpose=None,headless=False,speedup=1.0,dt=None,spacetype="hash"):
         """
         Initialize the simulator.
+
+        If headless is True, the simulation is not drawn (and pygame and OpenGL are
+        not needed); it can then be advanced with step() as fast as the physics
+        allows.  run(), run_once() and run_server() keep the simulation at `speedup`
+        times real time, or run it as fast as possible if speedup is 0.  Each physics
+        step advances the simulation by dt seconds (default 1/fps).
+
+        spacetype is the broadphase used for collision detection (one of
+        collisionSpaces.SPACE_TYPES).
         """
 
         # Setting standalone to 1 allows for manual key input.
@@ -47,6 +73,17 @@ class DiffDriveSim:
             self.standalone = 1
         else:
             self.standalone = 0   
+
+        self.headless = headless
+        if not self.headless and not import_graphics:
+            raise ImportError("pygame and PyOpenGL are needed to draw the simulation; run it headless instead")
+
+        self.speedup = speedup
+        if dt is None:
+            dt = 1/self.fps
+        self.dt = dt
+        self._nextStepTime = 0.0
+        if not self.headless:
             self.clock = pygame.time.Clock()
 
         # If regionfile=0, render the ground as default solid green terrain.
@@ -62,12 +99,14 @@ class DiffDriveSim:
             self.region_calib = region_calib
 
         # Simulation world parameters.
-        self._initOpenGL()
+        if not self.headless:
+            self._initOpenGL()
         self.world = ode.World()
         self.world.setGravity((0, -9.81, 0))
         self.world.setERP(0.1)
-        self.space = ode.Space()
-        self.ground = ode.GeomPlane(space=self.space, normal=(0,1,0), dist=0)
+        self.space = collisionSpaces.createSpace(spacetype)
+        self.staticSpace = collisionSpaces.createSpace(spacetype)
+        self.ground = ode.GeomPlane(space=self.staticSpace, normal=(0,1,0), dist=0)
 
         # Robot part parameters.
         self.cubesize = 6.0
@@ -190,6 +229,10 @@ class DiffDriveSim:
         self.fixed = ode.FixedJoint(self.world)
         self.fixed.attach(casterbody,boxbody)
         self.fixed.setFixed()
+
+        # The parts of the robot never need contacts between themselves.
+        for geom in [boxgeom, leftwheelgeom, rightwheelgeom, castergeom]:
+            collisionSpaces.setCategory(geom, collisionSpaces.CATEGORY_ROBOT, collisionSpaces.CATEGORY_ALL & ~collisionSpaces.CATEGORY_ROBOT)
         
         # WHEW, THE END OF ALL THAT FINALLY!
         # Build the Geoms and Joints arrays for rendering.
@@ -200,45 +243,45 @@ class DiffDriveSim:
         self._joints = [self.lefthinge, self.righthinge, self.fixed]
         
 
-        def loadObstacles(self,obstaclefile):
-            """
-            Loads obstacles from the obstacle text file.
-            """
-
-            # Initiate data structures.
-            data = open(obstaclefile,"r")
-            obs_sizes = [];
-            obs_positions = [];
-            obs_masses = [];
-            reading = "None"
-
-            # Parse the obstacle text file.
-            for line in data:
-                linesplit = line.split()
-                if linesplit != []:
-                    if linesplit[0] != "#":
-                        obs_sizes.append([float(linesplit[0]),float(linesplit[1]),float(linesplit[2])])
-                        obs_positions.append([float(linesplit[3]),float(linesplit[4]),float(linesplit[5])])
-                        obs_masses.append(float(linesplit[6]))      
-
-            # Go through all the obstacles in the list and spawn them.
-            for i in range(len(obs_sizes)):
-
-                obs_size = obs_sizes[i]
-                obs_pos = obs_positions[i]
-                obs_mass = obs_masses[i]
-                        
-                # Create the obstacle.
-                body = ode.Body(self.world)
-                geom = ode.GeomBox(space=self.space, lengths=obs_size )
-                geom.setBody(body)
-                geom.setPosition(obs_pos)
-                M = ode.Mass()
-                M.setBox(obs_mass,obs_size[0],obs_size[1],obs_size[2])
-                body.setMass(M)
-
-                # Append all these new pointers to the simulator class.
-                self._geoms.append(geom)
+    def loadObstacles(self,obstaclefile):
+        """
+        Loads obstacles from the obstacle text file.
+        """
+
+        # Initiate data structures.
+        data = open(obstaclefile,"r")
+        obs_sizes = [];
+        obs_positions = [];
+        obs_masses = [];
+        reading = "None"
+
+        # Parse the obstacle text file.
+        for line in data:
+            linesplit = line.split()
+            if linesplit != []:
+                if linesplit[0] != "#":
+                    obs_sizes.append([float(linesplit[0]),float(linesplit[1]),float(linesplit[2])])
+                    obs_positions.append([float(linesplit[3]),float(linesplit[4]),float(linesplit[5])])
+                    obs_masses.append(float(linesplit[6]))      
+
+        # Go through all the obstacles in the list and spawn them.
+        for i in range(len(obs_sizes)):
+
+            obs_size = obs_sizes[i]
+            obs_pos = obs_positions[i]
+            obs_mass = obs_masses[i]
+                    
+            # Create the obstacle.
+            body = ode.Body(self.world)
+            geom = ode.GeomBox(space=self.space, lengths=obs_size )
+            geom.setBody(body)
+            geom.setPosition(obs_pos)
+            M = ode.Mass()
+            M.setBox(obs_mass,obs_size[0],obs_size[1],obs_size[2])
+            body.setMass(M)
+
+            # Append all these new pointers to the simulator class.
+            self._geoms.append(geom)
 
     def rotate(self,vec,rot):
         """
@@ -451,6 +494,9 @@ class DiffDriveSim:
         Render the current simulation state.
         """
 
+        if self.headless:
+            return
+
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         self._renderGround()
 
@@ -508,6 +554,9 @@ class DiffDriveSim:
         Process any input events.
         """
 
+        if self.headless:
+            return
+
         events = pygame.event.get()
 
         for e in events:
@@ -592,13 +641,67 @@ class DiffDriveSim:
         self.setWheelSpeeds(left, right)
         
         
+    def step(self, n=1):
+        """
+        Advance the physics by n steps of dt seconds, as fast as possible and without
+        drawing or processing events.  Returns the 2D pose after the last step.
+        """
+
+        for i in xrange(n):
+            self._stepPhysics()
+
+        return self.get2DPose()
+
+
+    def getTime(self):
+        """
+        Return the simulated time, in seconds, since the simulator was started.
+        """
+
+        return self.counter*self.dt
+
+
+    def _stepPhysics(self):
+        """
+        Apply the wheel speeds and advance the physics by one step of dt seconds.
+        """
+
+        # Set wheel hinge speeds.
+        self.lefthinge.setParam(ode.ParamVel, self.left_speed)
+        self.righthinge.setParam(ode.ParamVel, self.right_speed)
+
+        # Simulation Step
+        collisionSpaces.collide(self.space, self.staticSpace, (), self._nearcb)
+        self.world.step(self.dt)
+        self._cjoints.empty()
+        self.counter = self.counter + 1
+
+
+    def _limitRate(self):
+        """
+        Wait until the next step is due, to keep the simulation at `speedup` times real time.
+        """
+
+        if self.speedup <= 0:
+            return
+
+        if not self.headless:
+            self.clock.tick(self.speedup/self.dt)
+            return
+
+        # Without pygame, keep track of when the next step is due ourselves
+        now = time.time()
+        if self._nextStepTime > now:
+            time.sleep(self._nextStepTime - now)
+        self._nextStepTime = max(self._nextStepTime, now) + self.dt/self.speedup
+
+
     def run(self):
         """
         Start the demo. This method will block until the demo exits.
         This method is used if the simulator is run stand-alone.
         """
 
-        self.clock = pygame.time.Clock()
         self._running = True
         self.doEvents()
 
@@ -608,56 +711,29 @@ class DiffDriveSim:
 
             self.doEvents()
 
-            counter = self.counter
-            
-            # Set wheel hinge speeds.
-            self.lefthinge.setParam(ode.ParamVel, self.left_speed)
-            self.righthinge.setParam(ode.ParamVel, self.right_speed)
-            
             #pose = self.get2DPose()
             #print pose
             
-            # Simulation Step
-            self.space.collide((), self._nearcb)
-            self.world.step(1/self.fps)
-            self._cjoints.empty()
+            self._stepPhysics()
             self.render()
 
             # Limit the FPS.
-            self.clock.tick(self.fps)
-            self.counter = self.counter + 1
+            self._limitRate()
 
 
     #Running ODE standalone with UDP communication
     #UDP port 23456
     def run_server(self):
         
-        self.clock = pygame.time.Clock()
         HOST, PORT = "localhost", 23456
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         data = "DATAGRAM FROM ODE"
 
-        
-        while 1:
-            events = pygame.event.get()
-
-            for e in events:
-                if (e.type == pygame.QUIT):
-                    return
-                elif (e.type == pygame.KEYDOWN):
-                    self._keyDown(e.key)
-                elif (e.type == pygame.KEYUP):
-                    self._keyUp(e.key)
-                elif (e.type == pygame.MOUSEBUTTONDOWN):
-                    if e.button == 1:
-                        self.clicking = True
-                    elif e.button == 4:
-                        self.cameraDistance -= 5
-                    elif e.button == 5:
-                        self.cameraDistance += 5
-                elif (e.type == pygame.MOUSEBUTTONUP):
-                    if e.button == 1:
-                        self.clicking = False
+        self._running = True
+        while self._running:
+            self.doEvents()
+            if not self._running:
+                return
 
             pose = self.get2DPose()
             counter = self.counter
@@ -678,18 +754,11 @@ class DiffDriveSim:
 ##                print somedata
 ##                print "UNKNOWN COMMAND", received
 
-            self.lefthinge.setParam(ode.ParamVel, self.left_speed)
-            self.righthinge.setParam(ode.ParamVel, self.right_speed)
-
-            # Simulation Step
-            self.space.collide((), self._nearcb)
-            self.world.step(1/self.fps)
-            self._cjoints.empty()
+            self._stepPhysics()
             self.render()
 
             # Limit the FPS.
-            self.clock.tick(self.fps)
-            self.counter = self.counter + 1
+            self._limitRate()
 
 
     def run_once(self):
@@ -700,19 +769,11 @@ class DiffDriveSim:
         self._running = True
         self.doEvents()
 
-        # Set wheel hinge speeds.
-        self.lefthinge.setParam(ode.ParamVel, self.left_speed)
-        self.righthinge.setParam(ode.ParamVel, self.right_speed)
-
-        # Simulation Step
-        self.space.collide((), self._nearcb)
-        self.world.step(1/self.fps)
-        self._cjoints.empty()
+        self._stepPhysics()
         self.render()
 
         # Limit the FPS.
-        self.clock.tick(self.fps)
-        self.counter = self.counter + 1
+        self._limitRate()
 
 
 # Main method for standalone mode.
@@ -728,8 +789,11 @@ if (__name__ == '__main__'):
 ##    if len(sys.argv)==2:
 ##        obstaclefile = "obstacles/" + sys.argv[2] + ".obstacle"    
 
+    opts, args = getopt.getopt(sys.argv[1:], "", ["headless", "speedup=", "space="])
+    opts = dict(opts)
     
 ##    sim = DiffDriveSim(standalone=1, obstaclefile=obstaclefile, regionfile="test_decomposed.regions")
-    sim = DiffDriveSim(standalone=0, obstaclefile=obstaclefile,regionfile=sys.argv[1],region_calib=eval(sys.argv[2]),startingpose=eval(sys.argv[3]))
+    sim = DiffDriveSim(standalone=0, obstaclefile=obstaclefile,regionfile=args[0],region_calib=eval(args[1]),startingpose=eval(args[2]),
+                       headless=("--headless" in opts),speedup=float(opts.get("--speedup", 1)),spacetype=opts.get("--space", "hash"))
 ##    print sys.argv[3]    
     sim.run_server()
@@ -13,7 +13,8 @@ from multiprocessing import Pool
 import project
 import regions
 import parseLP
-from createJTLVinput import createLTLfile, createSMVfile, createTopologyFragment, createInitialRegionFragment
+from createJTLVinput import createLTLfile, createSMVfile, createTopologyFragment, createInitialRegionFragment, \
+                            simplifySpecPart, remapSimplifiedFragments
 from parseEnglishToLTL import bitEncoding, replaceRegionName, createStayFormula
 import fsa
 from copy import deepcopy
@@ -79,12 +80,12 @@ class SpecCompiler(object):
         self.proj.all_customs = customs
 
         # construct adjacency matrix
-        self.proj.rfi.transitions= [[[] for j in range(len(self.proj.rfi.regions))] for i in range(len(self.proj.rfi.regions))]
+        self.proj.rfi.transitions = regions.AdjacencyMatrix(len(self.proj.rfi.regions))
         for tran in adj:
             idx0 = self.proj.rfi.indexOfRegionWithName(tran[0])
             idx1 = self.proj.rfi.indexOfRegionWithName(tran[1])
-            self.proj.rfi.transitions[idx0][idx1] = [(0,0)] # fake trans face
-            self.proj.rfi.transitions[idx1][idx0] = [(0,0)]
+            self.proj.rfi.transitions.setFaces(idx0, idx1, [(0,0)]) # fake trans face
+            self.proj.rfi.transitions.setFaces(idx1, idx0, [(0,0)])
 
     def _decompose(self):
         self.parser = parseLP.parseLP()
@@ -115,7 +116,10 @@ class SpecCompiler(object):
         if self.proj.compile_options["decompose"]:
             self.parser.proj.rfi.recalcAdjacency()
 
-        self.parser.proj.rfi.writeFile(filename)
+        if self.proj.compile_options.get("binary_regions", False):
+            self.parser.proj.rfi.writeBinaryFile(filename)
+        else:
+            self.parser.proj.rfi.writeFile(filename)
 
 
         self.proj.regionMapping = self.parser.proj.regionMapping
@@ -327,6 +331,11 @@ class SpecCompiler(object):
         LTLspec_env = self.substituteMacros(LTLspec_env)
         LTLspec_sys = self.substituteMacros(LTLspec_sys)
 
+        # Simplify the parser output (the generated topology and mutex are added afterwards, untouched)
+        self.simplification_map = None
+        if self.proj.compile_options["simplify_ltl"]:
+            LTLspec_env, LTLspec_sys = self._simplifySpec(LTLspec_env, LTLspec_sys)
+
         # If we are not using bit-encoding, we need to
         # explicitly encode a mutex for regions
         if not self.proj.compile_options["use_region_bit_encoding"]:
@@ -361,6 +370,8 @@ class SpecCompiler(object):
         
         if self.proj.compile_options["parser"] == "slurp":
             self.reversemapping = {self.postprocessLTL(line,sensorList,robotPropList).strip():line.strip() for line in oldspec_env + oldspec_sys}
+            if self.simplification_map is not None:
+                self.reversemapping = remapSimplifiedFragments(self.reversemapping, self.simplification_map, canonical=True)
             self.reversemapping[self.spec['Topo'].replace("\n","").replace("\t","").lstrip().rstrip("\n\t &")] = "TOPOLOGY"
 
         #for k,v in self.reversemapping.iteritems():
@@ -368,6 +379,24 @@ class SpecCompiler(object):
 
         return self.spec, traceback, response
 
+    def _simplifySpec(self, LTLspec_env, LTLspec_sys):
+        """
+        Run the simplification pass over both halves of the spec, and update the
+        LTL -> spec line number mapping to refer to the simplified formulas so that
+        core highlighting keeps working.
+        """
+
+        LTLspec_env, env_map = simplifySpecPart(LTLspec_env)
+        LTLspec_sys, sys_map = simplifySpecPart(LTLspec_sys)
+
+        self.simplification_map = dict(env_map)
+        self.simplification_map.update(sys_map)
+
+        if self.LTL2SpecLineNumber is not None:
+            self.LTL2SpecLineNumber = remapSimplifiedFragments(self.LTL2SpecLineNumber, self.simplification_map)
+
+        return LTLspec_env, LTLspec_sys
+
     def substituteMacros(self, text):
         """
         Replace any macros passed to us by the parser.  In general, this is only necessary in cases
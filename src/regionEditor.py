@@ -305,6 +305,7 @@ class DrawingFrame(wx.Frame):
 
         self.dirty     = False
         self.needsAdjacencyRecalc = True
+        self.modifiedRegions = []          # Regions whose adjacency needs to be updated
         self.selection = []                # List of selected Regions
         self.undoInfo  = None              # Saved contents for undo
         self.mouseMode  = mouse_NONE       # Current mousing mode
@@ -697,7 +698,7 @@ class DrawingFrame(wx.Frame):
                                     self._saveUndoInfo()
                                     obj.removePoint(handle)
                                     self.dirty = True
-                                    self.needsAdjacencyRecalc = True
+                                    self._markModified(obj)
                                     self.doChooseSelectTool()
                         else:
                             self.select(obj) 
@@ -716,7 +717,7 @@ class DrawingFrame(wx.Frame):
                                     self._saveUndoInfo()
                                     obj.addPoint(pint-obj.position, i+1)
                                     self.dirty = True
-                                    self.needsAdjacencyRecalc = True
+                                    self._markModified(obj)
                                     self.doChooseSelectTool()
                                     break
                         else:
@@ -873,7 +874,7 @@ class DrawingFrame(wx.Frame):
         else:
             self.drawPanel.PrepareDC(pdc)
 
-        if self.needsAdjacencyRecalc:
+        if self.needsAdjacencyRecalc or self.modifiedRegions:
             self.recalcAdjacency()
 
         self.drawPanel.PrepareDC(dc)
@@ -1008,24 +1009,34 @@ class DrawingFrame(wx.Frame):
         self.Destroy()
 
     def checkSubfaces(self, obj):
-        for other_obj in self.rfi.regions:
-            if other_obj is obj:
-                continue
+        for other_obj in self.rfi.splitSubfacesNear(obj):
+            self._markModified(other_obj)
+
+    def _markModified(self, obj):
+        """
+        Note that the shape of a region has changed, so its adjacency needs to be updated
+        """
 
-            self.rfi.splitSubfaces(obj, other_obj)
-            self.rfi.splitSubfaces(other_obj, obj)
+        if not any(obj is other_obj for other_obj in self.modifiedRegions):
+            self.modifiedRegions.append(obj)
         
     def recalcAdjacency(self):
         """
-        Call the RegionFileInterface's recalcAdjacency() method to figure out where to draw dotted transition lines
+        Call the RegionFileInterface's recalcAdjacency() method to figure out where to draw dotted transition lines.
+        If only the shapes of some regions have changed, just update the adjacency of those regions.
         """
 
-        self.transitionFaces = self.rfi.recalcAdjacency() # This is just a list of faces to draw dotted lines on
+        if self.needsAdjacencyRecalc:
+            self.transitionFaces = self.rfi.recalcAdjacency() # This is just a list of faces to draw dotted lines on
+        else:
+            for obj in self.modifiedRegions:
+                self.transitionFaces = self.rfi.updateAdjacency(obj)
         #self.transitionFaces = dict((face, None) for face in self.rfi.getExternalFaces())
 
         #self.drawPanel.Refresh()
 
         self.needsAdjacencyRecalc = False
+        self.modifiedRegions = []
 
     def getProjectDir(self):
         """
@@ -1678,10 +1689,10 @@ class DrawingFrame(wx.Frame):
             obj.size = Size(botRight.x - topLeft.x, botRight.y - topLeft.y)
 
         self.checkSubfaces(obj)
+        self._markModified(obj)
 
         self.drawPanel.Refresh()
         self.dirty = True
-        self.needsAdjacencyRecalc = True
         self._adjustMenus()
 
 
@@ -1692,10 +1703,10 @@ class DrawingFrame(wx.Frame):
 
         for obj in self.selection:
             obj.position += Point(offsetX, offsetY)
+            self._markModified(obj)
 
         self.drawPanel.Refresh()
         self.dirty = True
-        self.needsAdjacencyRecalc = True
         self._adjustMenus()
 
     def _getEventCoordinates(self, event, snap=False):
@@ -1739,9 +1750,14 @@ class DrawingFrame(wx.Frame):
         """
         BOUNDARY_TOLERANCE = 2
 
-        for obj in self.rfi.regions:
-            # TODO: Do preliminary, less-expensive checking first
+        # Make sure the spatial index doesn't predate any edits we haven't redrawn yet
+        if self.needsAdjacencyRecalc or self.modifiedRegions:
+            self.rfi.invalidateSpatialIndex()
 
+        hits = [i for i in self.rfi.regionsContainingPoint(pt.x, pt.y)
+                if self.rfi.regions[i].name.lower() != "boundary"]
+
+        for i, obj in enumerate(self.rfi.regions):
             if obj.name.lower() == "boundary":
                 # Special case for boundary: only react to clicks on perimeter
 
@@ -1749,12 +1765,14 @@ class DrawingFrame(wx.Frame):
                 for pta, ptb in obj.getFaces():
                     [on_segment, d, pint] = pointLineIntersection(pta, ptb, pt)
                     if on_segment and d <= BOUNDARY_TOLERANCE:
-                        return obj
-            else: 
-                if obj.objectContainsPoint(pt.x, pt.y):
-                    return obj
+                        hits.append(i)
+                        break
+
+        if not hits:
+            return None
 
-        return None
+        # Objects earlier in the list take precedence
+        return self.rfi.regions[min(hits)]
 
 
     def _drawObjectOutline(self, offsetX, offsetY):
@@ -223,11 +223,10 @@ class MapDialog(wx.Dialog):
 
     def onMapClick(self, event):
         x, y = self.panel_2.CalcUnscrolledPosition(event.GetX(), event.GetY())
-        for region in self.parent.proj.rfi.regions:
-            if region.name.lower() != "boundary" and region.objectContainsPoint(x, y):
-                self.parent.text_ctrl_spec.AppendText(region.name)
-                self.Close()
-                break
+        region_idx = self.parent.proj.rfi.regionContainingPoint(x, y, excludeBoundary=True)
+        if region_idx is not None:
+            self.parent.text_ctrl_spec.AppendText(self.parent.proj.rfi.regions[region_idx].name)
+            self.Close()
 
         event.Skip()
 